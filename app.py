@@ -1,23 +1,43 @@
 import streamlit as st
 import weave
-from openai import OpenAI
-import pandas as pd
 from typing import Dict, List, Any
 from datetime import datetime
-import plotly.express as px
 from dotenv import load_dotenv
 import os
+import time
 
-# Load environment variables from .env file
-load_dotenv()
+from checkpoint import CheckpointStore
+from comparison import DEFAULT_CONFIDENCE, comparable_scorers, compare_prompts
+from dataset_loader import DatasetLoader, list_datasets as list_project_datasets
+from early_stopping import DEFAULT_MIN_EXAMPLES
+from live_view import show_early_stopping, show_run_progress
+from local_scorers import local_output_type, validate_local_scorer
+from sampling import MAX_SAMPLES
+from eval_engine import AVAILABLE_MODELS, SCORER_OUTPUT_TYPES, create_engine
+from worker import EvaluationWorker
+
+# How often the page re-reads background run progress while any run is active
+POLL_SECONDS = 1.0
+
+SCORER_TYPE_LABELS = {
+    "llm": "LLM judge",
+    "exact": "Exact match",
+    "normalized": "Normalized match",
+    "contains": "Contains expected",
+    "fuzzy": "Fuzzy similarity",
+    "regex": "Regex",
+    "json_path": "JSON field",
+}
 
 # Initialize session state
 if 'evaluation_results' not in st.session_state:
     st.session_state.evaluation_results = []
-if 'running_evaluation' not in st.session_state:
-    st.session_state.running_evaluation = False
+if 'results_run_id' not in st.session_state:
+    st.session_state.results_run_id = None
 if 'custom_scorers' not in st.session_state:
     st.session_state.custom_scorers = []
+if 'selected_run' not in st.session_state:
+    st.session_state.selected_run = None
 
 # Page config
 st.set_page_config(
@@ -29,15 +49,42 @@ st.set_page_config(
 st.title("🎯 Prompt Engineering Evaluation Playground")
 st.markdown("Evaluate prompts across datasets with LLM-as-judge scoring")
 
-# Initialize Weave and OpenAI
-try:
-    # Use environment variables
+@st.cache_resource
+def get_weave_client():
+    """Process-wide Weave client; .env is read and Weave initialized once, not on every rerun"""
+    # Load environment variables from .env file
+    load_dotenv()
     weave_project = os.getenv("WEAVE_PROJECT", "evaluation-playground")
     if not weave_project:
         raise ValueError("WEAVE_PROJECT environment variable not set")
-    
-    weave.init(project_name=weave_project)
-    client = OpenAI()  # This will use OPENAI_API_KEY from environment
+    return weave.init(project_name=weave_project)
+
+@st.cache_resource
+def get_engine():
+    """Process-wide evaluation engine, so caches and learned rate limits survive script reruns"""
+    return create_engine()
+
+@st.cache_resource
+def get_checkpoint_store():
+    """Process-wide store of finished cells for resuming interrupted runs"""
+    return CheckpointStore()
+
+@st.cache_resource
+def get_dataset_loader():
+    """Process-wide dataset loader backed by the local dataset cache"""
+    return DatasetLoader()
+
+@st.cache_resource
+def get_worker():
+    """Process-wide background worker; runs keep going across reruns and browser sessions"""
+    return EvaluationWorker(get_engine(), get_dataset_loader(), get_checkpoint_store())
+
+# Initialize Weave and OpenAI
+try:
+    weave_client = get_weave_client()
+    weave_project = weave_client.project
+    engine = get_engine()
+    worker = get_worker()
 except Exception as e:
     st.error(f"Failed to initialize: {e}")
     st.info("Please ensure OPENAI_API_KEY and WEAVE_PROJECT are set in your .env file or environment")
@@ -45,124 +92,15 @@ except Exception as e:
 
 # Removed pre-built scorer templates - using only custom scorers
 
-# Available OpenAI models
-AVAILABLE_MODELS = [
-    "gpt-4o",
-    "gpt-4o-mini", 
-    "gpt-4.1",
-    "gpt-4.1-mini",
-    "gpt-4.1-nano",
-    "o3-mini",
-    "o4-mini",
-    "o3"
-]
-
-def get_dataset_fields(dataset):
-    """Extract field names from dataset rows"""
-    if not dataset.rows:
-        return []
-    first_row = dataset.rows[0]
-    return list(first_row.keys())
-
-def find_input_field(fields):
-    """Find the most likely input field"""
-    for field in ['input', 'example', 'question']:
-        if field in fields:
-            return field
-    return fields[0] if fields else None
-
-def find_ground_truth_field(fields):
-    """Find the most likely ground truth field"""
-    for field in ['expected', 'answer', 'ground_truth', 'output']:
-        if field in fields:
-            return field
-    return None
-
-@st.cache_data
-def list_datasets():
+@st.cache_data(ttl=300)
+def list_datasets(_client, project):
     """List available datasets in the Weave project"""
     try:
-        # This is a simplified approach - in production you might want to use Weave's API
-        # to properly list datasets
-        return ["sample_dataset"]  # Placeholder
+        return list_project_datasets(_client)
     except Exception as e:
         st.error(f"Error listing datasets: {e}")
         return []
 
-def run_prompt_on_example(prompt, model, example_input):
-    """Run a single prompt on a single example"""
-    messages = [
-        {"role": "system", "content": prompt},
-        {"role": "user", "content": str(example_input)}
-    ]
-    
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=0.7
-    )
-    
-    return response.choices[0].message.content
-
-def score_response(scorer_config, model, input_text, response, ground_truth=None):
-    """Score a response using an LLM judge"""
-    scorer_prompt = scorer_config['prompt']
-    
-    # Build the scoring prompt with clear field labels
-    scoring_context = f"""Please evaluate the following response based on the criteria provided.
-
-**USER INPUT/QUESTION:**
-{input_text}
-
-**MODEL RESPONSE:**
-{response}
-"""
-    
-    if ground_truth:
-        scoring_context += f"""
-**EXPECTED/CORRECT ANSWER:**
-{ground_truth}
-"""
-    
-    scoring_context += f"""
-**EVALUATION CRITERIA:**
-{scorer_prompt}"""
-    
-    if scorer_config['output_type'] == 'numeric':
-        scoring_context += f"\n\n**INSTRUCTIONS:** Provide only a number on the scale {scorer_config.get('scale', '1-10')}. Do not include any other text."
-    elif scorer_config['output_type'] == 'boolean':
-        scoring_context += "\n\n**INSTRUCTIONS:** Answer only 'true' or 'false'. Do not include any other text."
-    
-    messages = [
-        {"role": "system", "content": "You are an expert evaluator. Provide only the requested output format."},
-        {"role": "user", "content": scoring_context}
-    ]
-    
-    response = client.chat.completions.create(
-        model=scorer_config.get('model', 'gpt-4o-mini'),
-        messages=messages,
-        temperature=0
-    )
-    
-    score_text = response.choices[0].message.content.strip().lower()
-    
-    # Parse the score
-    if scorer_config['output_type'] == 'numeric':
-        try:
-            score = float(score_text.split()[0])
-            return score
-        except:
-            return None
-    elif scorer_config['output_type'] == 'boolean':
-        if 'true' in score_text:
-            return not scorer_config.get('invert', False)
-        elif 'false' in score_text:
-            return scorer_config.get('invert', False)
-        else:
-            return None
-    else:
-        return score_text
-
 # Sidebar configuration
 with st.sidebar:
     st.header("Configuration")
@@ -177,7 +115,14 @@ with st.sidebar:
     
     # Dataset selection
     st.subheader("1. Select Dataset")
+    project_datasets = list_datasets(weave_client, weave_project)
+    selected_dataset = st.selectbox(
+        "Project datasets", ["(enter a reference below)"] + project_datasets,
+        help="Datasets published to this Weave project; the list refreshes every 5 minutes"
+    )
     dataset_ref = st.text_input("Dataset Reference", placeholder="dataset_name:version")
+    if not dataset_ref and selected_dataset in project_datasets:
+        dataset_ref = f"{selected_dataset}:latest"
     
     # Prompt configuration
     st.subheader("2. Configure Prompts")
@@ -189,7 +134,13 @@ with st.sidebar:
             prompt_text = st.text_area(f"Prompt text", key=f"prompt_{i}", 
                                      placeholder="You are a helpful assistant...")
             model = st.selectbox(f"Model", AVAILABLE_MODELS, key=f"model_{i}")
-            prompts.append({"text": prompt_text, "model": model})
+            samples = st.number_input(
+                "Samples per example", min_value=1, max_value=MAX_SAMPLES, value=1, key=f"samples_{i}",
+                help="Completions fetched in one request and each scored; numeric scores are averaged, and boolean "
+                     "scorers also get the share of samples that pass (`pass rate`), which summaries, "
+                     "comparisons and early stopping use"
+            )
+            prompts.append({"text": prompt_text, "model": model, "samples": int(samples)})
     
     # Scorer configuration
     st.subheader("3. Configure Scorers")
@@ -204,7 +155,9 @@ with st.sidebar:
         for idx, scorer in enumerate(st.session_state.custom_scorers):
             col1, col2 = st.columns([4, 1])
             with col1:
-                st.text(f"✓ {scorer['name']} ({scorer['output_type']})")
+                scorer_label = SCORER_TYPE_LABELS[scorer.get('type', 'llm')]
+                target = f", vs {scorer['ground_truth_field']}" if scorer.get('ground_truth_field') else ""
+                st.text(f"✓ {scorer['name']} ({scorer_label}, {scorer['output_type']}{target})")
             with col2:
                 if st.button("Remove", key=f"remove_custom_{idx}"):
                     st.session_state.custom_scorers.pop(idx)
@@ -212,27 +165,116 @@ with st.sidebar:
     
     with st.expander("Add Custom Scorer"):
         custom_name = st.text_input("Scorer name")
-        custom_prompt = st.text_area("Scorer prompt")
-        custom_output = st.selectbox("Output type", ["numeric", "boolean", "text"])
-        custom_model = st.selectbox("Model", AVAILABLE_MODELS, key="custom_model")
+        custom_type = st.selectbox(
+            "Scorer type", list(SCORER_TYPE_LABELS), format_func=SCORER_TYPE_LABELS.get,
+            help="Local scorers run in-process: free and instant, no API call"
+        )
+        custom_config = {"name": custom_name}
+        if custom_type == "llm":
+            custom_prompt = st.text_area("Scorer prompt")
+            custom_output = st.selectbox("Output type", SCORER_OUTPUT_TYPES)
+            custom_model = st.selectbox("Model", AVAILABLE_MODELS, key="custom_model")
+            custom_config.update({"prompt": custom_prompt, "output_type": custom_output, "model": custom_model})
+            if custom_output == "numeric":
+                custom_config["scale"] = st.text_input("Scale (e.g., 1-5)", value="1-10")
+        else:
+            custom_config["type"] = custom_type
+            if custom_type == "regex":
+                custom_config["pattern"] = st.text_input("Pattern", placeholder=r"\b(positive|negative|neutral)\b")
+            elif custom_type == "json_path":
+                custom_config["path"] = st.text_input("JSON path in the response", placeholder="$.customer.name")
+            elif custom_type == "fuzzy":
+                if st.checkbox("Pass/fail at a threshold", value=False):
+                    custom_config["threshold"] = st.slider("Minimum similarity", 0.0, 1.0, 0.8, 0.05)
         
-        custom_scale = None
-        if custom_output == "numeric":
-            custom_scale = st.text_input("Scale (e.g., 1-5)", value="1-10")
+        if custom_type != "regex":
+            custom_gt_field = st.text_input(
+                "Ground truth field (optional)", placeholder="e.g. expected_name",
+                help="Dataset column this scorer compares against; defaults to the detected ground truth field"
+            )
+            if custom_gt_field:
+                custom_config["ground_truth_field"] = custom_gt_field
         
         if st.button("Add Custom Scorer"):
-            if custom_name and custom_prompt:
-                custom_config = {
-                    "name": custom_name,
-                    "prompt": custom_prompt,
-                    "output_type": custom_output,
-                    "model": custom_model
-                }
-                if custom_output == "numeric" and custom_scale:
-                    custom_config["scale"] = custom_scale
+            try:
+                if not custom_name:
+                    raise ValueError("Please give the scorer a name")
+                if custom_type == "llm":
+                    if not custom_config["prompt"]:
+                        raise ValueError("Please write a scorer prompt")
+                else:
+                    validate_local_scorer(custom_config)
+                    custom_config["output_type"] = local_output_type(custom_config)
                 st.session_state.custom_scorers.append(custom_config)
                 st.success(f"Added {custom_name}")
                 st.rerun()
+            except ValueError as e:
+                st.error(str(e))
+
+    # Execution settings
+    st.subheader("4. Execution")
+    execution_mode = st.radio(
+        "Execution mode", ["Interactive", "Batch API"],
+        help="Batch API runs generations and judging as offline batch jobs: slower to finish, but cheaper for large sweeps"
+    )
+    batch_poll_interval = 30
+    if execution_mode == "Batch API":
+        batch_poll_interval = st.number_input("Batch poll interval (seconds)", min_value=1, max_value=600, value=30)
+    max_concurrency = st.number_input(
+        "Max concurrent requests", min_value=1, max_value=64, value=8,
+        help="Upper bound on model calls (generation and scoring) in flight at once"
+    )
+    per_model_concurrency = st.number_input(
+        "Max concurrent requests per model", min_value=1, max_value=64, value=4,
+        help="Ceiling on in-flight calls to any single model; lowered automatically when rate limits are near"
+    )
+    
+    bypass_cache = st.checkbox(
+        "Bypass cache", value=False,
+        help="Always call the models for generations and judging; fresh results still overwrite cached ones"
+    )
+    stream_generations = st.checkbox(
+        "Stream generations", value=True, disabled=execution_mode == "Batch API",
+        help="Show responses as they are generated and measure time to first token"
+    )
+    combine_scorers = st.checkbox(
+        "Combine scorers per judge model", value=False, disabled=execution_mode == "Batch API",
+        help="Ask all scorers that share a judge model for their verdicts in one structured-output call; "
+             "interactive runs only"
+    ) and execution_mode != "Batch API"
+    # Sequential testing needs results as they arrive, so it is only offered for interactive runs
+    early_stopping = None
+    comparable = [s['name'] for s in selected_scorers if s['output_type'] in ("numeric", "boolean")]
+    if execution_mode == "Interactive" and comparable and sum(1 for p in prompts if p['text']) > 1:
+        if st.checkbox(
+            "Stop early when prompts are decided", value=False,
+            help="Shuffle examples and stop evaluating prompts that are clearly worse on the chosen scorer"
+        ):
+            early_stopping = {
+                "scorer": st.selectbox("Decide on scorer", comparable),
+                "confidence": st.select_slider("Confidence", options=[0.9, 0.95, 0.99], value=0.95),
+                "min_examples": st.number_input(
+                    "Minimum examples per prompt", min_value=5, max_value=10000, value=DEFAULT_MIN_EXAMPLES
+                )
+            }
+    
+    for cache_label, cache_stats in engine.cache_stats().items():
+        st.caption(
+            f"{cache_label} cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+            f"{cache_stats['entries']} entries"
+        )
+
+# Settings are captured when a run is submitted; later sidebar changes do not affect it
+run_settings = {
+    "max_concurrency": max_concurrency,
+    "per_model_concurrency": per_model_concurrency,
+    "use_cache": not bypass_cache,
+    "combine_scorers": combine_scorers,
+    "stream": stream_generations,
+    "mode": "batch" if execution_mode == "Batch API" else "interactive",
+    "batch_poll_interval": batch_poll_interval,
+    "early_stopping": early_stopping
+}
 
 # Main content area
 col1, col2 = st.columns([2, 1])
@@ -240,7 +282,7 @@ col1, col2 = st.columns([2, 1])
 with col1:
     st.header("Evaluation Control")
     
-    if st.button("🎮 Run Evaluation", type="primary", disabled=st.session_state.running_evaluation):
+    if st.button("🎮 Run Evaluation", type="primary"):
         if not dataset_ref:
             st.error("Please specify a dataset reference")
         elif not any(p['text'] for p in prompts):
@@ -248,191 +290,249 @@ with col1:
         elif not selected_scorers:
             st.error("Please select at least one scorer")
         else:
-            st.session_state.running_evaluation = True
+            run_config = {"dataset_ref": dataset_ref, "prompts": prompts, "scorers": selected_scorers}
+            st.session_state.selected_run = worker.submit(eval_name, run_config, run_settings)
             st.rerun()
+    
+    # Runs that were interrupted (app restarted, cancelled, or a failing call) can pick up where they stopped
+    active_run_ids = set(worker.active_run_ids())
+    resumable_runs = [run for run in get_checkpoint_store().resumable_runs() if run['run_id'] not in active_run_ids]
+    if resumable_runs:
+        with st.expander(f"Resume an interrupted run ({len(resumable_runs)})"):
+            run_labels = {
+                f"{run['name']} [{run['run_id']}]: {run['completed_cells']}/{run['total_cells'] or '?'} cells, {run['status']}": run
+                for run in resumable_runs
+            }
+            resume_choice = st.selectbox("Interrupted runs", list(run_labels))
+            if st.button("▶️ Resume"):
+                resume_run = run_labels[resume_choice]
+                # A resumed run uses the configuration it was started with, not the current sidebar
+                st.session_state.selected_run = worker.submit(
+                    f"{resume_run['name']} (resumed)", resume_run['config'], run_settings,
+                    run_id=resume_run['run_id']
+                )
+                st.rerun()
 
 with col2:
     status_placeholder = st.empty()
-    if st.session_state.running_evaluation:
-        status_placeholder.info("🔄 Evaluation in progress...")
+    if active_run_ids:
+        status_placeholder.info(f"🔄 {len(active_run_ids)} evaluation(s) in progress...")
 
-# Run evaluation
-if st.session_state.running_evaluation:
-    try:
-        # Load dataset
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        status_text.text("Loading dataset...")
-        dataset = weave.ref(dataset_ref).get()
-        
-        # Find fields
-        fields = get_dataset_fields(dataset)
-        input_field = find_input_field(fields)
-        ground_truth_field = find_ground_truth_field(fields)
-        
-        if not input_field:
-            st.error("Could not find input field in dataset")
-            st.session_state.running_evaluation = False
-            st.stop()
-        
-        # Initialize evaluation logger
-        eval_logger = weave.EvaluationLogger(
-            name=eval_name,
-            model=f"evaluation_playground_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-            dataset=dataset_ref
-        )
-        
-        # Progress tracking
-        total_steps = len(dataset.rows) * len([p for p in prompts if p['text']])
-        current_step = 0
-        
-        # Results container
-        results_container = st.container()
-        
-        # Run evaluations
-        all_results = []
-        
-        for prompt_idx, prompt_config in enumerate(prompts):
-            if not prompt_config['text']:
-                continue
-                
-            prompt_results = []
-            
-            for example_idx, example in enumerate(dataset.rows):
-                current_step += 1
-                progress_bar.progress(current_step / total_steps)
-                status_text.text(f"Running prompt {prompt_idx+1} on example {example_idx+1}/{len(dataset.rows)}")
-                
-                # Get input and ground truth
-                input_text = example.get(input_field, "")
-                ground_truth = example.get(ground_truth_field) if ground_truth_field else None
-                
-                # Run prompt
-                response = run_prompt_on_example(
-                    prompt_config['text'],
-                    prompt_config['model'],
-                    input_text
-                )
-                
-                # Log prediction
-                pred_logger = eval_logger.log_prediction(
-                    inputs={"prompt": prompt_config['text'], "input": input_text},
-                    output=response
-                )
-                
-                # Score with each scorer
-                scores = {}
-                for scorer in selected_scorers:
-                    score = score_response(scorer, scorer['model'], input_text, response, ground_truth)
-                    scores[scorer['name']] = score
-                    pred_logger.log_score(scorer=scorer['name'], score=score)
-                
-                pred_logger.finish()
-                
-                # Store results
-                result = {
-                    "prompt_idx": prompt_idx,
-                    "example_idx": example_idx,
-                    "input": input_text,
-                    "response": response,
-                    "scores": scores,
-                    "ground_truth": ground_truth
-                }
-                prompt_results.append(result)
-                all_results.append(result)
-                
-                # Display live results
-                with results_container:
-                    st.write(f"**Example {example_idx+1}**")
-                    st.write(f"Input: {input_text[:100]}...")
-                    st.write(f"Response: {response[:100]}...")
-                    st.write(f"Scores: {scores}")
-                    st.divider()
-        
-        # Log summary
-        eval_logger.log_summary()
-        
-        # Store results
-        st.session_state.evaluation_results = all_results
-        st.session_state.running_evaluation = False
-        
-        # Clear progress indicators
-        progress_bar.empty()
-        status_text.empty()
-        
-        # Show completion status and Weave link
-        st.success("✅ Evaluation complete!")
-        
-        # Get W&B entity from environment or use default
-        wandb_entity = os.getenv("WANDB_ENTITY", "your-entity")
-        weave_url = f"https://wandb.ai/{wandb_entity}/{weave_project}/weave/evaluations"
-        
-        st.info(f"📊 View your evaluation results in Weave: [{weave_url}]({weave_url})")
-        
-        st.balloons()
-        
-        # Use a small delay before rerun to ensure UI updates are visible
-        import time
-        time.sleep(0.5)
-        st.rerun()
-        
-    except Exception as e:
-        st.error(f"Error during evaluation: {e}")
-        st.session_state.running_evaluation = False
-        # Use a small delay before rerun
-        import time
-        time.sleep(0.5)
-        st.rerun()
+# Background runs
+worker_runs = worker.runs()
+if worker_runs:
+    st.header("🏃 Runs")
+    for run in worker_runs:
+        with st.expander(f"{run['name']} [{run['run_id']}]: {run['status']}", expanded=run['status'] in ("queued", "loading", "running")):
+            if run['status'] in ("queued", "loading", "running"):
+                show_run_progress(run)
+                if st.button("⏹️ Cancel", key=f"cancel_{run['run_id']}"):
+                    worker.cancel(run['run_id'])
+                    st.rerun()
+            elif run['status'] == "completed":
+                st.success(f"✅ Evaluation complete: {run['completed']} results")
+                if run['early_stopping']:
+                    show_early_stopping(run['early_stopping'])
+                if st.button("📊 Show results", key=f"show_{run['run_id']}"):
+                    st.session_state.selected_run = run['run_id']
+                    st.session_state.results_run_id = None
+                    st.rerun()
+            elif run['status'] == "failed":
+                st.error(run['message'])
+            else:
+                st.warning(run['message'])
+
+# Load the selected run's results once it has finished
+selected = worker.get(st.session_state.selected_run) if st.session_state.selected_run else None
+if selected and selected['status'] == "completed" and st.session_state.results_run_id != selected['run_id']:
+    st.session_state.evaluation_results = selected['results']
+    st.session_state.last_cache_stats = selected['cache_stats']
+    st.session_state.last_performance = selected['performance']
+    st.session_state.results_run_id = selected['run_id']
+    
+    # Get W&B entity from environment or use default
+    wandb_entity = os.getenv("WANDB_ENTITY", "your-entity")
+    weave_url = f"https://wandb.ai/{wandb_entity}/{weave_project}/weave/evaluations"
+    
+    st.info(f"📊 View your evaluation results in Weave: [{weave_url}]({weave_url})")
+    
+    st.balloons()
 
 # Results visualization
+# Results are a columnar ResultsStore; its aggregates, table and histograms are memoized across reruns
 if st.session_state.evaluation_results:
+    # Imported on first use, so reruns before there are results never load them
+    import pandas as pd
+    import plotly.express as px
+    
+    results_store = st.session_state.evaluation_results
     st.header("📊 Results")
+    if st.session_state.results_run_id:
+        st.caption(f"Run {st.session_state.results_run_id}")
     
-    # Convert to DataFrame for analysis
-    df_results = pd.DataFrame(st.session_state.evaluation_results)
+    # Cache usage for the last run
+    if st.session_state.get('last_cache_stats'):
+        cache_cols = st.columns(2 * len(st.session_state.last_cache_stats))
+        for col_idx, (label, counts) in enumerate(st.session_state.last_cache_stats.items()):
+            cache_cols[2 * col_idx].metric(f"{label} cache hits", counts['hits'])
+            cache_cols[2 * col_idx + 1].metric(f"{label} cache misses", counts['misses'])
+    
+    # Latency, tokens and cost of the model calls the run made (cache hits make none)
+    performance = st.session_state.get('last_performance')
+    if performance and performance['calls']:
+        st.subheader("Performance & Cost")
+        perf_cols = st.columns(4)
+        perf_cols[0].metric("Model calls", performance['calls'])
+        perf_cols[1].metric("Retries", performance['retries'])
+        perf_cols[2].metric("Tokens", f"{performance['prompt_tokens'] + performance['completion_tokens']:,}")
+        perf_cols[3].metric("Estimated cost", f"${performance['cost_usd']:.4f}")
+        
+        def seconds(value):
+            return round(value, 2) if value is not None else None
+        
+        model_rows = [
+            {
+                "Model": model,
+                "Calls": stats['calls'],
+                "Latency p50 (s)": seconds(stats['latency_p50']),
+                "Latency p95 (s)": seconds(stats['latency_p95']),
+                "Latency p99 (s)": seconds(stats['latency_p99']),
+                "TTFT p50 (s)": seconds(stats['ttft_p50']),
+                "TTFT p95 (s)": seconds(stats['ttft_p95']),
+                "Avg queue wait (s)": seconds(stats['queue_avg']),
+                "Output tokens/s": round(stats['tokens_per_second']) if stats['tokens_per_second'] else None,
+                "Prompt tokens": stats['prompt_tokens'],
+                "Cached tokens": stats['cached_tokens'],
+                "Completion tokens": stats['completion_tokens'],
+                "Retries": stats['retries'],
+                "Cost ($)": round(stats['cost_usd'], 4) if stats['cost_usd'] is not None else None
+            }
+            for model, stats in performance['models'].items()
+        ]
+        st.dataframe(pd.DataFrame(model_rows), hide_index=True)
+        # Judge prompts put each scorer's static text first, so providers can reuse it from their prompt cache
+        judge_calls = performance.get('kinds', {}).get('judge')
+        if judge_calls and judge_calls['calls'] and judge_calls['cached_share'] is not None:
+            st.caption(
+                f"Judge calls: {judge_calls['cached_share']:.0%} of input tokens served from the prompt cache, "
+                f"latency p50 {judge_calls['latency_p50'] or 0:.2f} s"
+            )
+        
+        cost_rows = [
+            {
+                "Prompt": prompt_label,
+                "Examples": stats['examples'],
+                "Calls": stats['calls'],
+                "Tokens": stats['tokens'],
+                "Generation cost ($)": round(stats['generation_cost_usd'], 4),
+                "Judge cost ($)": round(stats['judge_cost_usd'], 4),
+                "Total cost ($)": round(stats['cost_usd'], 4),
+                "Cost per example ($)": round(stats['cost_per_example_usd'], 6)
+            }
+            for prompt_label, stats in performance['prompts'].items()
+        ]
+        st.dataframe(pd.DataFrame(cost_rows), hide_index=True)
+        if performance['unpriced_calls']:
+            st.caption(f"{performance['unpriced_calls']} calls to models without a known price are not in the costs")
     
     # Aggregate scores
     st.subheader("Score Summary")
     
-    scorer_names = list(st.session_state.evaluation_results[0]['scores'].keys())
+    for scorer_summary in results_store.summary():
+        scorer_name = scorer_summary['scorer']
+        if not scorer_summary['count']:
+            continue
+        if scorer_summary['kind'] == "boolean":
+            st.metric(f"{scorer_name} (True %)", f"{scorer_summary['value'] * 100:.1f}%")
+        elif scorer_summary['kind'] == "numeric":
+            st.metric(f"{scorer_name} (Average)", f"{scorer_summary['value']:.2f}")
+        else:
+            st.metric(f"{scorer_name}", "Text responses - no aggregate")
+    
+    # How much an example's samples disagree, for prompts that take several per example
+    sample_variability = results_store.sample_variability()
+    if sample_variability:
+        st.subheader("Sample Variability")
+        st.caption(
+            "Spread between the samples of each example. Boolean scores count as 1/0; `pass rate` scores "
+            "are the share of an example's samples that pass, and `pass@k` scores are true when any sample passes."
+        )
+        st.dataframe(pd.DataFrame([
+            {
+                "Scorer": row['scorer'],
+                "Sampled examples": row['examples'],
+                "Mean variance": round(row['mean_variance'], 4),
+                "Mean std. dev.": round(row['mean_std'], 4),
+                "Examples with disagreeing samples": f"{row['unstable_share']:.0%}"
+            }
+            for row in sample_variability
+        ]), hide_index=True)
     
-    for scorer_name in scorer_names:
-        scores = [r['scores'][scorer_name] for r in st.session_state.evaluation_results if r['scores'][scorer_name] is not None]
+    # Which prompt wins: per-prompt means with bootstrap CIs and paired tests on shared examples
+    comparison_scorers = comparable_scorers(results_store)
+    if comparison_scorers:
+        st.subheader("Prompt Comparison")
+        comparison_scorer = st.selectbox("Compare prompts on", comparison_scorers, key="comparison_scorer")
+        comparison = compare_prompts(results_store, comparison_scorer)
+        confidence_label = f"{DEFAULT_CONFIDENCE:.0%} CI"
         
-        if scores:
-            if isinstance(scores[0], bool):
-                true_pct = sum(scores) / len(scores) * 100
-                st.metric(f"{scorer_name} (True %)", f"{true_pct:.1f}%")
-            elif isinstance(scores[0], (int, float)):
-                avg_score = sum(scores) / len(scores)
-                st.metric(f"{scorer_name} (Average)", f"{avg_score:.2f}")
-            else:
-                st.metric(f"{scorer_name}", "Text responses - no aggregate")
+        prompt_rows = [
+            {
+                "Prompt": f"Prompt {p['prompt_idx']+1}",
+                "Examples": p['n'],
+                "Mean": round(p['mean'], 3),
+                confidence_label: f"[{p['ci_low']:.3f}, {p['ci_high']:.3f}]"
+            }
+            for p in comparison['prompts']
+        ]
+        st.dataframe(pd.DataFrame(prompt_rows), hide_index=True)
+        
+        fig = px.scatter(
+            x=[row['Prompt'] for row in prompt_rows],
+            y=[p['mean'] for p in comparison['prompts']],
+            error_y=[p['ci_high'] - p['mean'] for p in comparison['prompts']],
+            error_y_minus=[p['mean'] - p['ci_low'] for p in comparison['prompts']],
+            labels={"x": "Prompt", "y": comparison_scorer},
+            title=f"{comparison_scorer} by prompt ({confidence_label})"
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        
+        if comparison['pairs']:
+            st.caption(
+                "Paired comparisons use only examples scored for both prompts. "
+                "p-values come from a sign-flip permutation test and are Holm-adjusted across pairs."
+            )
+            pair_rows = [
+                {
+                    "Prompt A": f"Prompt {pair['prompt_a']+1}",
+                    "Prompt B": f"Prompt {pair['prompt_b']+1}",
+                    "Paired examples": pair['n'],
+                    "Mean difference (A - B)": round(pair['mean_diff'], 3),
+                    confidence_label: f"[{pair['ci_low']:.3f}, {pair['ci_high']:.3f}]",
+                    "p-value": round(pair['p_value'], 4),
+                    "Adjusted p-value": round(pair['p_adjusted'], 4),
+                    "Significant": pair['significant']
+                }
+                for pair in comparison['pairs']
+            ]
+            st.dataframe(pd.DataFrame(pair_rows), hide_index=True)
     
     # Detailed results table
     st.subheader("Detailed Results")
     
-    # Create a simplified view
-    display_data = []
-    for result in st.session_state.evaluation_results:
-        row = {
-            "Prompt": f"Prompt {result['prompt_idx']+1}",
-            "Example": result['example_idx']+1,
-            "Input": result['input'][:50] + "...",
-            "Response": result['response'][:50] + "..."
-        }
-        row.update(result['scores'])
-        display_data.append(row)
-    
-    st.dataframe(pd.DataFrame(display_data))
+    st.dataframe(results_store.table())
     
     # Visualizations
     st.subheader("Score Distributions")
     
-    for scorer_name in scorer_names:
-        scores = [r['scores'][scorer_name] for r in st.session_state.evaluation_results if r['scores'][scorer_name] is not None]
-        
-        if scores and isinstance(scores[0], (int, float)):
-            fig = px.histogram(x=scores, title=f"{scorer_name} Distribution", nbins=20)
-            st.plotly_chart(fig, use_container_width=True) 
+    # Binned once per run, so the charts carry 20 bars instead of every score
+    for scorer_name, (counts, edges) in results_store.histograms(nbins=20).items():
+        fig = px.bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, title=f"{scorer_name} Distribution",
+                     labels={"x": scorer_name, "y": "count"})
+        fig.update_layout(bargap=0)
+        st.plotly_chart(fig, use_container_width=True)
+
+# Poll the worker while anything is running; widget interactions interrupt the wait immediately
+if worker.active_run_ids():
+    time.sleep(POLL_SECONDS)
+    st.rerun()
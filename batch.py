@@ -0,0 +1,256 @@
+import io
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openai
+
+from cache import GenerationCache, JudgeCache, count_lookup
+from call_metrics import call_record
+from concurrency import RunCancelled
+from local_scorers import is_local, score_cells, scorer_ground_truth
+from log_buffer import log_result
+from prompts import (
+    DEFAULT_JUDGE_MODEL, JUDGE_PARAMS,
+    build_generation_messages, build_scoring_messages, generation_params, parse_score
+)
+from sampling import distinct_responses, prompt_samples, response_list, sampled_result
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# The Batch API accepts at most 50,000 requests per input file
+MAX_BATCH_REQUESTS = 50_000
+
+
+def build_batch_lines(requests: List[Tuple[str, Dict[str, Any]]]) -> str:
+    """Serialize (custom_id, request body) pairs into Batch API JSONL"""
+    return "".join(
+        json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}) + "\n"
+        for custom_id, body in requests
+    )
+
+
+def submit_batch(client, requests: List[Tuple[str, Dict[str, Any]]], description: str) -> str:
+    """Upload a request file and start a batch job; returns the batch id"""
+    payload = build_batch_lines(requests).encode("utf-8")
+    batch_file = client.files.create(file=("batch.jsonl", io.BytesIO(payload)), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"description": description}
+    )
+    return batch.id
+
+
+def wait_for_batch(client, batch_id: str, poll_interval: float = 30.0,
+                   on_status: Optional[Callable[[Any], None]] = None, cancel: Optional[threading.Event] = None):
+    """Poll a batch until it reaches a terminal status; raises RunCancelled once `cancel` is set"""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if on_status:
+            on_status(batch)
+        if batch.status in TERMINAL_STATUSES:
+            if batch.status != "completed":
+                raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+            return batch
+        if cancel is None:
+            time.sleep(poll_interval)
+        elif cancel.wait(poll_interval):
+            raise RunCancelled(f"Cancelled while waiting for batch {batch_id}")
+
+
+def read_batch_output(client, batch, usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Message content per custom_id; requests that failed inside the batch map to None
+
+    Requests for several choices (with `n`) map to the list of their contents, in choice order.
+
+    If given, `usage` is filled with the token usage of every successful request, per custom_id.
+    """
+    contents = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            body = response.get("body") or {}
+            content = None
+            choices = body.get("choices")
+            if response.get("status_code") == 200 and choices:
+                choices = sorted(choices, key=lambda choice: choice.get("index", 0))
+                content = [choice["message"]["content"] for choice in choices]
+                if len(content) == 1:
+                    content = content[0]
+                if usage is not None:
+                    usage[record["custom_id"]] = body.get("usage")
+            contents[record["custom_id"]] = content
+    return contents
+
+
+def run_batch(client, requests: List[Tuple[str, Dict[str, Any]]], description: str,
+              poll_interval: float = 30.0, on_status: Optional[Callable[[Any], None]] = None,
+              usage: Optional[Dict[str, Any]] = None, cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """Submit requests as one or more batch jobs, wait for all of them and collect the replies
+
+    If `cancel` is set while waiting, the jobs are cancelled and RunCancelled is raised.
+    """
+    batch_ids = [
+        submit_batch(client, requests[start:start + MAX_BATCH_REQUESTS], description)
+        for start in range(0, len(requests), MAX_BATCH_REQUESTS)
+    ]
+    contents = {}
+    try:
+        for batch_id in batch_ids:
+            batch = wait_for_batch(client, batch_id, poll_interval, on_status, cancel)
+            contents.update(read_batch_output(client, batch, usage))
+    except RunCancelled:
+        # Jobs left running would still be billed for replies nobody reads
+        for batch_id in batch_ids:
+            try:
+                client.batches.cancel(batch_id)
+            except openai.APIError:
+                pass  # Already finished
+        raise
+    return contents
+
+
+def run_batch_evaluation(client, cells: List[Dict[str, Any]], scorers: List[Dict[str, Any]], eval_logger=None,
+                         generation_cache: Optional[GenerationCache] = None,
+                         judge_cache: Optional[JudgeCache] = None, use_cache: bool = True,
+                         poll_interval: float = 30.0,
+                         on_status: Optional[Callable[[str, Any], None]] = None,
+                         cancel: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
+    """Evaluate cells with a generation batch followed by a judge batch, logging results to Weave if given a logger
+
+    Each cell holds prompt_idx, example_idx, prompt (the prompt config), input and ground_truth.
+    Cached generations and verdicts are reused and never sent to the Batch API. Local scorers
+    are computed in-process over all cells at once. Each result's `calls` records the token
+    usage and discounted cost of its batch requests, and its `cache` its cache hits and misses. Prompts with several `samples` request
+    them together, and each distinct sample is judged. Setting `cancel` cancels the batch jobs
+    and raises RunCancelled.
+    """
+    def status_callback(stage):
+        return (lambda batch: on_status(stage, batch)) if on_status else None
+
+    def generation_key(cell):
+        prompt_config = cell['prompt']
+        return GenerationCache.make_key(prompt_config['text'], prompt_config['model'], cell['input'],
+                                        generation_params(prompt_samples(prompt_config)))
+
+    # Stage 1: generations, as a list of samples per cell
+    responses = {}
+    generation_requests = []
+    # Cache hits and misses per cell, by generation cell id
+    cache_counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for cell in cells:
+        prompt_config = cell['prompt']
+        cell_id = f"gen-{cell['prompt_idx']}-{cell['example_idx']}"
+        cache_counts[cell_id] = {}
+        cached = None
+        if generation_cache and use_cache:
+            cached = generation_cache.get(generation_key(cell))
+            count_lookup(cache_counts[cell_id], "Generation", cached is not None)
+        if cached is not None:
+            responses[cell_id] = response_list(cached)
+            continue
+        generation_requests.append((cell_id, {
+            "model": prompt_config['model'],
+            "messages": build_generation_messages(prompt_config['text'], cell['input']),
+            **generation_params(prompt_samples(prompt_config))
+        }))
+    generation_usage = {}
+    generated = run_batch(client, generation_requests, "eval playground generations",
+                          poll_interval, status_callback("generation"), generation_usage, cancel)
+    for cell in cells:
+        cell_id = f"gen-{cell['prompt_idx']}-{cell['example_idx']}"
+        if cell_id in generated and generated[cell_id] is not None:
+            responses[cell_id] = response_list(generated[cell_id])
+            if generation_cache:
+                generation_cache.put(generation_key(cell), generated[cell_id])
+
+    # Stage 2: judge verdicts for every distinct sample of every generation that succeeded
+    raw_verdicts = {}
+    judge_requests = []
+    for cell in cells:
+        cell_id = f"gen-{cell['prompt_idx']}-{cell['example_idx']}"
+        samples = responses.get(cell_id)
+        if samples is None:
+            continue
+        for unique_idx, response in enumerate(distinct_responses(samples)[0]):
+            for scorer_idx, scorer in enumerate(scorers):
+                if is_local(scorer):
+                    continue
+                verdict_id = f"judge-{cell['prompt_idx']}-{cell['example_idx']}-{scorer_idx}-{unique_idx}"
+                ground_truth = scorer_ground_truth(scorer, cell['ground_truth'], cell.get('fields'))
+                cached = None
+                if judge_cache and use_cache:
+                    cached = judge_cache.get(JudgeCache.make_key(scorer, cell['input'], response, ground_truth))
+                    count_lookup(cache_counts[cell_id], "Judge", cached is not None)
+                if cached is not None:
+                    raw_verdicts[verdict_id] = cached['raw']
+                    continue
+                judge_requests.append((verdict_id, {
+                    "model": scorer.get('model', DEFAULT_JUDGE_MODEL),
+                    "messages": build_scoring_messages(scorer, cell['input'], response, ground_truth),
+                    **JUDGE_PARAMS
+                }))
+    judge_usage = {}
+    judged = run_batch(client, judge_requests, "eval playground judging", poll_interval, status_callback("judging"),
+                       judge_usage, cancel)
+
+    # Stage 3: assemble ordered results and log them
+    results = []
+    cells = sorted(cells, key=lambda c: (c['prompt_idx'], c['example_idx']))
+    # Failed generations are scored as a single empty response, with every score None
+    cell_samples = [
+        distinct_responses(responses.get(f"gen-{cell['prompt_idx']}-{cell['example_idx']}") or [None])
+        for cell in cells
+    ]
+    local_scores = iter(score_cells(scorers, [cell for cell, (unique, _) in zip(cells, cell_samples) for _ in unique],
+                                    [response for unique, _ in cell_samples for response in unique]))
+    for cell, (unique, positions) in zip(cells, cell_samples):
+        unique_scores = [{} for _ in unique]
+        calls = []
+        cell_id = f"gen-{cell['prompt_idx']}-{cell['example_idx']}"
+        if cell_id in generation_usage:
+            calls.append(call_record("generation", cell['prompt']['model'], generation_usage[cell_id], batch=True))
+        for unique_idx, (response, scores) in enumerate(zip(unique, unique_scores)):
+            cell_local_scores = next(local_scores)
+            for scorer_idx, scorer in enumerate(scorers):
+                if is_local(scorer):
+                    scores[scorer['name']] = cell_local_scores[scorer['name']] if response is not None else None
+                    continue
+                verdict_id = f"judge-{cell['prompt_idx']}-{cell['example_idx']}-{scorer_idx}-{unique_idx}"
+                raw_text = raw_verdicts.get(verdict_id, judged.get(verdict_id))
+                if verdict_id in judge_usage:
+                    calls.append(call_record("judge", scorer.get('model', DEFAULT_JUDGE_MODEL),
+                                             judge_usage[verdict_id], batch=True))
+                score = parse_score(scorer, raw_text) if raw_text is not None else None
+                if verdict_id in judged and raw_text is not None and judge_cache:
+                    judge_cache.put(
+                        JudgeCache.make_key(scorer, cell['input'], response,
+                                            scorer_ground_truth(scorer, cell['ground_truth'], cell.get('fields'))),
+                        {"raw": raw_text, "score": score}
+                    )
+                scores[scorer['name']] = score
+
+        sampled = sampled_result(scorers, [unique[position] for position in positions],
+                                 [unique_scores[position] for position in positions])
+        result = {
+            "prompt_idx": cell['prompt_idx'],
+            "example_idx": cell['example_idx'],
+            "input": cell['input'],
+            **sampled,
+            "response": sampled['response'] if sampled['response'] is not None else "",
+            "ground_truth": cell['ground_truth'],
+            "calls": calls,
+            "cache": cache_counts[cell_id]
+        }
+        if eval_logger is not None:
+            log_result(eval_logger, cell['prompt']['text'], result)
+        results.append(result)
+    return results
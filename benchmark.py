@@ -0,0 +1,334 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from openai import OpenAI
+
+from cache import GenerationCache, JudgeCache
+from call_metrics import CallMetrics
+from checkpoint import CheckpointStore
+from eval_engine import EvaluationEngine
+from log_buffer import BufferedEvaluationLogger
+from mock_openai_server import MockBehavior, MockOpenAIServer
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak memory is then not reported
+    resource = None
+
+# Results compared against a baseline: (key, label, higher is better)
+COMPARED_RESULTS = [("cells_per_second", "cells/s", True), ("wall_p99", "call p99", False),
+                    ("peak_rss_mb", "peak RSS", False)]
+
+
+class LocalPrediction:
+    def __init__(self, eval_logger: "LocalEvaluationLogger"):
+        self._eval_logger = eval_logger
+        self.scores = 0
+
+    def log_score(self, scorer: str, score: Any):
+        self.scores += 1
+
+    def finish(self):
+        if self._eval_logger.log_latency:
+            time.sleep(self._eval_logger.log_latency)
+        self._eval_logger.predictions += 1
+
+
+class LocalEvaluationLogger:
+    """Stand-in for `weave.EvaluationLogger` that only counts what it is given
+
+    Each finished prediction takes `log_latency` seconds, to mimic a slow Weave backend.
+    """
+
+    def __init__(self, log_latency: float = 0.0):
+        self.log_latency = log_latency
+        self.predictions = 0
+        self.summary: Optional[Dict[str, Any]] = None
+
+    def log_prediction(self, inputs: Dict[str, Any], output: Any) -> LocalPrediction:
+        return LocalPrediction(self)
+
+    def log_summary(self, summary: Optional[Dict[str, Any]] = None):
+        self.summary = summary
+
+
+def build_rows(n: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "input": f"Hi, this is customer {idx} writing about order #{idx * 7}. The blender I got is broken.",
+            "expected": f"customer {idx}"
+        }
+        for idx in range(n)
+    ]
+
+
+def build_prompts(n: int, model: str, samples: int = 1) -> List[Dict[str, Any]]:
+    return [
+        {"text": f"You are support assistant #{idx+1}. Extract the customer's name and product.", "model": model,
+         "samples": samples}
+        for idx in range(n)
+    ]
+
+
+def build_scorers(n: int, model: str, rubric_tokens: int = 0) -> List[Dict[str, Any]]:
+    """Alternating boolean and numeric LLM judges, with criteria padded by about `rubric_tokens` tokens"""
+    # About 4 characters per token, as the mock server counts them
+    rubric = "".join(f"\n{line + 1}. The answer must follow guideline {line + 1} of the style guide."
+                     for line in range(rubric_tokens * 4 // 64))
+    scorers = []
+    for idx in range(n):
+        if idx % 2 == 0:
+            scorers.append({"name": f"correct_{idx+1}", "prompt": "Is the extracted name correct?" + rubric,
+                            "output_type": "boolean", "model": model})
+        else:
+            scorers.append({"name": f"quality_{idx+1}", "prompt": "How complete is the extraction?" + rubric,
+                            "output_type": "numeric", "scale": "1-5", "model": model})
+    return scorers
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident memory of this process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(values: np.ndarray) -> List[Optional[float]]:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return [None, None, None]
+    return [float(v) for v in np.percentile(values, [50, 95, 99])]
+
+
+def run_configuration(base_url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one evaluation against the mock server through the real engine and measure it
+
+    Runs in a fresh process (see `main`), so its peak memory belongs to this configuration alone.
+    """
+    client = OpenAI(base_url=base_url, api_key="mock", max_retries=0)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "cache.sqlite")
+        engine = EvaluationEngine(client, generation_cache=GenerationCache(cache_path),
+                                  judge_cache=JudgeCache(cache_path))
+        rows = build_rows(params['rows'])
+        prompts = build_prompts(params['prompts'], params['model'], params.get('samples', 1))
+        scorers = build_scorers(params['scorers'], params['judge_model'], params['rubric_tokens'])
+        checkpoint, run_id = None, None
+        if params['checkpoint']:
+            checkpoint = CheckpointStore(os.path.join(cache_dir, "checkpoints.sqlite"))
+            run_id = checkpoint.start_run("benchmark", {"prompts": prompts, "scorers": scorers},
+                                          len(rows) * len(prompts))
+        local_logger = LocalEvaluationLogger(params['log_latency'])
+        eval_logger = BufferedEvaluationLogger(local_logger)
+        metrics = CallMetrics()
+
+        rss_start = peak_rss_mb()
+        first_result = None
+        start = time.perf_counter()
+        for result in engine.run(
+            rows, prompts, scorers, "input", "expected", eval_logger, checkpoint, run_id,
+            max_concurrency=params['max_concurrency'], per_model_concurrency=params['per_model_concurrency'],
+            use_cache=params['use_cache'], combine_scorers=params['combine_scorers'], mode=params['mode'],
+            stream=params['stream'], batch_poll_interval=0.1
+        ):
+            if first_result is None:
+                first_result = time.perf_counter() - start
+            metrics.add(result)
+        evaluated = time.perf_counter() - start
+        eval_logger.log_summary({"performance": metrics.summary()})
+        seconds = time.perf_counter() - start
+
+    summary = metrics.summary()
+    latency = percentiles(metrics.latency_seconds.values)
+    wall = percentiles(metrics.wall_seconds.values)
+    ttft = percentiles(metrics.ttft_seconds.values)
+    cells = sum(metrics.examples.values())
+    return {
+        "cells": cells,
+        "calls": summary['calls'],
+        "seconds": seconds,
+        # Time until the last result, before the final Weave flush
+        "evaluate_seconds": evaluated,
+        "first_result_seconds": first_result,
+        "cells_per_second": cells / seconds if seconds else None,
+        "calls_per_second": summary['calls'] / seconds if seconds else None,
+        "latency_p50": latency[0],
+        "latency_p95": latency[1],
+        "latency_p99": latency[2],
+        "wall_p50": wall[0],
+        "wall_p95": wall[1],
+        "wall_p99": wall[2],
+        "ttft_p50": ttft[0],
+        "ttft_p95": ttft[1],
+        "retries": summary['retries'],
+        "log_blocked_seconds": eval_logger.stats()['blocked_seconds'],
+        "logged_predictions": local_logger.predictions,
+        "rss_start_mb": rss_start,
+        "peak_rss_mb": peak_rss_mb(),
+        "judge_latency_p50": summary['kinds']['judge']['latency_p50'],
+        "judge_cached_share": summary['kinds']['judge']['cached_share'],
+        "cost_usd": summary['cost_usd']
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_baseline(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_to_baseline(record: Dict[str, Any], baseline: List[Dict[str, Any]],
+                        compared: List[tuple] = COMPARED_RESULTS) -> Optional[str]:
+    """Change against the latest baseline record with identical parameters, for each of `compared`"""
+    matches = [old for old in baseline if old['params'] == record['params']]
+    if not matches:
+        return None
+    old = matches[-1]
+    changes = []
+    for key, label, higher_is_better in compared:
+        before, after = old['results'].get(key), record['results'].get(key)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        better = change > 0 if higher_is_better else change < 0
+        changes.append(f"{label} {change:+.1%}{'' if better or abs(change) < 0.05 else ' (worse)'}")
+    return f"  vs {old.get('commit') or 'baseline'} ({old['timestamp']}): " + ", ".join(changes)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python benchmark.py",
+        description="Benchmark the evaluation loop against a local mock OpenAI server; no API spend"
+    )
+    grid = parser.add_argument_group("workload (comma-separated lists run every combination)")
+    grid.add_argument("--rows", type=int_list, default=[200])
+    grid.add_argument("--prompts", type=int_list, default=[2])
+    grid.add_argument("--scorers", type=int_list, default=[3], help="LLM judge scorers")
+    grid.add_argument("--rubric-tokens", type=int, default=0,
+                      help="Tokens of extra criteria per judge prompt; the API caches prompt prefixes from 1024 tokens")
+    grid.add_argument("--samples", type=int, default=1,
+                      help="Completions per example, fetched in one request; the mock makes about half distinct")
+    grid.add_argument("--repeat", type=int, default=1, help="Runs per combination")
+    server = parser.add_argument_group("mock server")
+    server.add_argument("--latency", type=float, default=0.05, help="Median seconds per chat completion")
+    server.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency")
+    server.add_argument("--per-token-latency", type=float, default=0.0, help="Extra seconds per completion token")
+    server.add_argument("--completion-tokens", type=int, default=150, help="Approximate length of generations")
+    server.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a 500")
+    server.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failing with a 429")
+    server.add_argument("--retry-after", type=float, default=0.05, help="retry-after seconds sent with 429s")
+    server.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="Share of streamed replies whose connection drops halfway")
+    server.add_argument("--requests-per-minute", type=int,
+                        help="Request budget sent in x-ratelimit-* headers; requests over it get a 429")
+    server.add_argument("--tokens-per-minute", type=int,
+                        help="Token budget sent in x-ratelimit-* headers; requests over it get a 429")
+    server.add_argument("--log-latency", type=float, default=0.0,
+                        help="Seconds the stand-in Weave logger spends per prediction")
+    engine = parser.add_argument_group("engine")
+    engine.add_argument("--model", default="gpt-4o-mini")
+    engine.add_argument("--judge-model", default="gpt-4o-mini")
+    engine.add_argument("--max-concurrency", type=int, default=8)
+    engine.add_argument("--per-model-concurrency", type=int, default=4)
+    engine.add_argument("--combine-scorers", action="store_true")
+    engine.add_argument("--no-stream", action="store_true", help="Request generations in one piece")
+    engine.add_argument("--mode", choices=["interactive", "batch"], default="interactive")
+    engine.add_argument("--no-cache", action="store_true", help="Skip cache lookups (entries are still written)")
+    engine.add_argument("--no-checkpoint", action="store_true", help="Do not checkpoint finished cells")
+    parser.add_argument("--output", "-o", help="Append one JSON record per run to this file")
+    parser.add_argument("--baseline", help="JSONL file from an earlier --output to compare against")
+    args = parser.parse_args(argv)
+    if args.mode == "batch" and args.combine_scorers:
+        parser.error("--combine-scorers is not supported with --mode batch")
+
+    baseline = load_baseline(args.baseline) if args.baseline else []
+    commit = git_commit()
+    header = (f"{'rows':>6} {'prompts':>7} {'scorers':>7} {'cells':>7} {'calls':>7} {'secs':>7} {'cells/s':>8} "
+              f"{'calls/s':>8} {'first':>6} {'ttft':>6} {'p50':>6} {'p95':>6} {'p99':>6} {'wallp99':>7} {'retries':>7} "
+              f"{'429s':>5} {'500s':>5} {'jcache':>6} {'peakMB':>7}")
+    print(header)
+
+    # Fresh processes for every run: clean peak memory, and the server's threads never share its GIL
+    spawn = multiprocessing.get_context("spawn")
+    with MockOpenAIServer() as mock_server:
+        for rows, prompts, scorers in itertools.product(args.rows, args.prompts, args.scorers):
+            params = {
+                "rows": rows, "prompts": prompts, "scorers": scorers, "rubric_tokens": args.rubric_tokens,
+                "samples": args.samples,
+                "latency": args.latency, "latency_sigma": args.latency_sigma,
+                "per_token_latency": args.per_token_latency, "completion_tokens": args.completion_tokens,
+                "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate,
+                "retry_after": args.retry_after, "disconnect_rate": args.disconnect_rate, "log_latency": args.log_latency,
+                "requests_per_minute": args.requests_per_minute, "tokens_per_minute": args.tokens_per_minute,
+                "model": args.model, "judge_model": args.judge_model,
+                "max_concurrency": args.max_concurrency, "per_model_concurrency": args.per_model_concurrency,
+                "combine_scorers": args.combine_scorers, "stream": not args.no_stream, "mode": args.mode,
+                "use_cache": not args.no_cache, "checkpoint": not args.no_checkpoint
+            }
+            for _ in range(args.repeat):
+                # Same seed every run, so every run sees the same latencies and failures
+                behavior = MockBehavior(args.latency, args.latency_sigma, args.per_token_latency,
+                                        args.completion_tokens, args.error_rate, args.rate_limit_rate,
+                                        args.retry_after, args.disconnect_rate,
+                                        requests_per_minute=args.requests_per_minute,
+                                        tokens_per_minute=args.tokens_per_minute)
+                mock_server.state.behavior = behavior
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    results = pool.submit(run_configuration, mock_server.base_url, params).result()
+                results["rate_limited"] = behavior.counts["rate_limited"]
+                results["server_errors"] = behavior.counts["errors"]
+                results["disconnects"] = behavior.counts["disconnects"]
+                record = {
+                    "timestamp": datetime.now().isoformat(timespec="seconds"),
+                    "commit": commit,
+                    "python": sys.version.split()[0],
+                    "params": params,
+                    "results": results
+                }
+
+                def fmt(value, spec):
+                    return format(value, spec) if value is not None else "-"
+
+                print(f"{rows:>6} {prompts:>7} {scorers:>7} {results['cells']:>7} {results['calls']:>7} "
+                      f"{results['seconds']:>7.2f} {results['cells_per_second']:>8.1f} "
+                      f"{results['calls_per_second']:>8.1f} {fmt(results['first_result_seconds'], '>6.2f')} "
+                      f"{fmt(results['ttft_p50'], '>6.3f')} "
+                      f"{fmt(results['latency_p50'], '>6.3f')} {fmt(results['latency_p95'], '>6.3f')} "
+                      f"{fmt(results['latency_p99'], '>6.3f')} {fmt(results['wall_p99'], '>7.3f')} "
+                      f"{results['retries']:>7} {results['rate_limited']:>5} {results['server_errors']:>5} "
+                      f"{fmt(results['judge_cached_share'], '>6.0%')} {fmt(results['peak_rss_mb'], '>7.0f')}", flush=True)
+                comparison = compare_to_baseline(record, baseline)
+                if comparison:
+                    print(comparison, flush=True)
+                if args.output:
+                    with open(args.output, "a") as f:
+                        f.write(json.dumps(record) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from prompts import JUDGE_TEMPLATE_VERSION
+
+DEFAULT_CACHE_DIR = os.getenv("EVAL_CACHE_DIR", ".eval_cache")
+
+
+def content_hash(*parts: Any) -> str:
+    """Stable SHA-256 over JSON-serialized parts (dict keys sorted)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def count_lookup(counts: Optional[Dict[str, Dict[str, int]]], label: str, hit: bool):
+    """Tally one cache lookup into a result's `cache` counts ({label: {"hits", "misses"}}), if given"""
+    if counts is None:
+        return
+    entry = counts.setdefault(label, {"hits": 0, "misses": 0})
+    entry["hits" if hit else "misses"] += 1
+
+
+class SqliteCache:
+    """Content-addressed key/value store in SQLite with size- and age-based LRU eviction"""
+
+    # Eviction runs every this many writes rather than on every put
+    EVICT_EVERY = 200
+
+    def __init__(self, path: str, table: str, max_bytes: int = 512 * 1024 * 1024,
+                 max_age_seconds: Optional[float] = 30 * 24 * 3600):
+        self.path = path
+        self.table = table
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        # Running entry count and size, so stats don't scan the table on every page rerun
+        self._entries: Optional[int] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age_seconds is not None and now - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        """Store `value` under `key`, replacing any previous entry"""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            if self._entries is not None:
+                previous = self._conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                self._entries += previous is None
+                self._bytes += len(payload) - (previous[0] if previous else 0)
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size budget"""
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now: float):
+        if self.max_age_seconds is not None:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.max_age_seconds,))
+        entries, total = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+        ).fetchone()
+        if total > self.max_bytes:
+            # Walk from the least recently used end until enough bytes are freed
+            excess = total - self.max_bytes
+            freed = 0
+            stale = []
+            for key, size in self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at"):
+                if freed >= excess:
+                    break
+                stale.append((key,))
+                freed += size
+            self._conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", stale)
+            entries, total = entries - len(stale), total - freed
+        self._conn.commit()
+        # Re-synced here, so writes by other processes sharing the file are picked up
+        self._entries, self._bytes = entries, total
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size
+
+        The size is counted once, then kept up to date by this process's writes and re-counted
+        at every eviction.
+        """
+        with self._lock:
+            if self._entries is None:
+                self._entries, self._bytes = self._conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+                ).fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": self._entries, "bytes": self._bytes}
+
+
+class GenerationCache(SqliteCache):
+    """Cache of model generations keyed by prompt, model, input and sampling params"""
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "cache.sqlite"), **kwargs):
+        super().__init__(path, table="generations", **kwargs)
+
+    @staticmethod
+    def make_key(prompt: str, model: str, example_input: Any, params: Dict[str, Any]) -> str:
+        """Cache key for one generation request"""
+        return content_hash("generation", prompt, model, example_input, params)
+
+
+class JudgeCache(SqliteCache):
+    """Memoized judge verdicts, storing the raw judge text alongside the parsed score"""
+
+    # Scorer settings that change the verdict; the display name deliberately does not
+    SCORER_FIELDS = ("prompt", "output_type", "scale", "model", "invert", "examples")
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "cache.sqlite"), **kwargs):
+        super().__init__(path, table="judgements", **kwargs)
+
+    @classmethod
+    def make_key(cls, scorer_config: Dict[str, Any], input_text: Any, response: Any,
+                 ground_truth: Any = None) -> str:
+        """Cache key for one judge call, tied to the judge prompt layout version"""
+        scorer = {field: scorer_config.get(field) for field in cls.SCORER_FIELDS}
+        return content_hash("judge", JUDGE_TEMPLATE_VERSION, scorer, input_text, response, ground_truth)
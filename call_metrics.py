@@ -0,0 +1,310 @@
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from results_store import GrowableArray, StringPool
+
+# Estimated list prices in USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "o3-mini": (1.10, 0.55, 4.40),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "o3": (2.00, 0.50, 8.00),
+}
+# Batch API requests are billed at half the interactive price
+BATCH_DISCOUNT = 0.5
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+def model_prices(model: str) -> Optional[tuple]:
+    """Prices of a model, matching dated snapshots such as gpt-4o-2024-08-06 to their base model"""
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    # Longest prefix first, so gpt-4o-mini-... is not priced as gpt-4o
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name + "-"):
+            return MODEL_PRICES[name]
+    return None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0,
+                  batch: bool = False) -> Optional[float]:
+    """Estimated USD cost of one call; None for models without a known price"""
+    prices = model_prices(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    cost = ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def usage_counts(usage: Any) -> Dict[str, int]:
+    """Prompt, completion and cached token counts from an API `usage` object or its JSON dict"""
+    def get(obj, key):
+        if obj is None:
+            return None
+        return obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+
+    return {
+        "prompt_tokens": get(usage, "prompt_tokens") or 0,
+        "completion_tokens": get(usage, "completion_tokens") or 0,
+        "cached_tokens": get(get(usage, "prompt_tokens_details"), "cached_tokens") or 0,
+    }
+
+
+def call_record(kind: str, model: str, usage: Any, timing: Optional[Dict[str, float]] = None,
+                batch: bool = False) -> Dict[str, Any]:
+    """One model call as attached to a result's `calls`
+
+    `kind` is "generation" or "judge". `timing` holds the scheduler's wall_seconds, queue_seconds,
+    latency_seconds and retries, plus ttft_seconds (time to first token) for streamed calls;
+    batch requests have no per-call timing.
+    """
+    timing = timing or {}
+    counts = usage_counts(usage)
+    return {
+        "kind": kind,
+        "model": model,
+        "batch": batch,
+        "wall_seconds": timing.get("wall_seconds"),
+        "queue_seconds": timing.get("queue_seconds"),
+        "latency_seconds": timing.get("latency_seconds"),
+        "ttft_seconds": timing.get("ttft_seconds"),
+        "retries": timing.get("retries", 0),
+        **counts,
+        "cost": estimate_cost(model, counts["prompt_tokens"], counts["completion_tokens"],
+                              counts["cached_tokens"], batch)
+    }
+
+
+# Log-spaced latency bins from 1 ms to 1,000 s, each about 6% wide, for percentiles of live runs
+LATENCY_BIN_EDGES = np.geomspace(0.001, 1000.0, 241)
+_BIN_EDGES = LATENCY_BIN_EDGES.tolist()
+
+
+def _percentiles(values: np.ndarray) -> List[Optional[float]]:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return [None] * len(LATENCY_PERCENTILES)
+    return [float(v) for v in np.percentile(values, LATENCY_PERCENTILES)]
+
+
+def _histogram_percentiles(counts: np.ndarray) -> List[Optional[float]]:
+    """Percentiles from binned counts, interpolated geometrically within the bin they fall in"""
+    total = counts.sum()
+    if not total:
+        return [None] * len(LATENCY_PERCENTILES)
+    cumulative = np.cumsum(counts)
+    percentiles = []
+    for q in LATENCY_PERCENTILES:
+        rank = q / 100 * total
+        idx = min(int(np.searchsorted(cumulative, rank)), len(counts) - 1)
+        fraction = (rank - (cumulative[idx] - counts[idx])) / counts[idx] if counts[idx] else 0.0
+        low, high = LATENCY_BIN_EDGES[idx], LATENCY_BIN_EDGES[idx + 1]
+        percentiles.append(float(low * (high / low) ** fraction))
+    return percentiles
+
+
+def _latency_bin(seconds: float) -> int:
+    return min(max(bisect_right(_BIN_EDGES, seconds) - 1, 0), len(_BIN_EDGES) - 2)
+
+
+class _Tally:
+    """Running totals of a group of calls, with histograms of their latency and time to first token"""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        self.priced = 0
+        self.timed_seconds = 0.0
+        self.timed_completion_tokens = 0
+        self.queue_seconds = 0.0
+        self.queued = 0
+        self.latency = np.zeros(len(_BIN_EDGES) - 1, dtype=np.int64)
+        self.ttft = np.zeros(len(_BIN_EDGES) - 1, dtype=np.int64)
+
+    def add(self, call: Dict[str, Any]):
+        self.calls += 1
+        self.retries += call['retries']
+        self.prompt_tokens += call['prompt_tokens']
+        self.completion_tokens += call['completion_tokens']
+        self.cached_tokens += call['cached_tokens']
+        if call['cost'] is not None:
+            self.cost += call['cost']
+            self.priced += 1
+        if call['latency_seconds'] is not None:
+            self.timed_seconds += call['latency_seconds']
+            self.timed_completion_tokens += call['completion_tokens']
+            self.latency[_latency_bin(call['latency_seconds'])] += 1
+        if call.get('ttft_seconds') is not None:
+            self.ttft[_latency_bin(call['ttft_seconds'])] += 1
+        if call['queue_seconds'] is not None:
+            self.queue_seconds += call['queue_seconds']
+            self.queued += 1
+
+
+class CallMetrics:
+    """Columnar log of a run's model calls, aggregated per model and per prompt
+
+    Calls are read from each result's `calls`, so cache hits (which make no call) cost nothing
+    and judge calls are charged to the prompt whose response they scored. Totals are kept
+    running as calls are added, so a live summary costs the same however long the run is.
+    """
+
+    def __init__(self):
+        self.models = StringPool()
+        self.model = GrowableArray(np.int32)
+        self.prompt_idx = GrowableArray(np.int16)
+        self.judge = GrowableArray(np.bool_, False)
+        self.wall_seconds = GrowableArray(np.float64, np.nan)
+        self.queue_seconds = GrowableArray(np.float64, np.nan)
+        self.latency_seconds = GrowableArray(np.float64, np.nan)
+        self.ttft_seconds = GrowableArray(np.float64, np.nan)
+        self.retries = GrowableArray(np.int32)
+        self.prompt_tokens = GrowableArray(np.int64)
+        self.completion_tokens = GrowableArray(np.int64)
+        self.cached_tokens = GrowableArray(np.int64)
+        self.cost = GrowableArray(np.float64, np.nan)
+        self.examples: Dict[int, int] = {}
+        # Running totals per model, per kind ("generation" or "judge") and per (prompt, kind)
+        self._by_model: Dict[str, _Tally] = {}
+        self._by_kind = {"generation": _Tally(), "judge": _Tally()}
+        self._by_prompt: Dict[Tuple[int, str], _Tally] = {}
+        self._version = 0
+        self._summary = {}
+
+    def add(self, result: Dict[str, Any]):
+        """Record the calls made for one result"""
+        prompt_idx = result['prompt_idx']
+        self.examples[prompt_idx] = self.examples.get(prompt_idx, 0) + 1
+        calls = result.get('calls') or []
+        if calls:
+            def number(value):
+                return np.nan if value is None else value
+
+            self.model.extend([self.models.code(call['model']) for call in calls])
+            self.prompt_idx.extend([prompt_idx] * len(calls))
+            self.judge.extend([call['kind'] == "judge" for call in calls])
+            self.wall_seconds.extend([number(call['wall_seconds']) for call in calls])
+            self.queue_seconds.extend([number(call['queue_seconds']) for call in calls])
+            self.latency_seconds.extend([number(call['latency_seconds']) for call in calls])
+            # Records checkpointed before streaming was added have no time to first token
+            self.ttft_seconds.extend([number(call.get('ttft_seconds')) for call in calls])
+            self.retries.extend([call['retries'] for call in calls])
+            self.prompt_tokens.extend([call['prompt_tokens'] for call in calls])
+            self.completion_tokens.extend([call['completion_tokens'] for call in calls])
+            self.cached_tokens.extend([call['cached_tokens'] for call in calls])
+            self.cost.extend([number(call['cost']) for call in calls])
+            for call in calls:
+                kind = "judge" if call['kind'] == "judge" else "generation"
+                if call['model'] not in self._by_model:
+                    self._by_model[call['model']] = _Tally()
+                self._by_model[call['model']].add(call)
+                self._by_kind[kind].add(call)
+                if (prompt_idx, kind) not in self._by_prompt:
+                    self._by_prompt[(prompt_idx, kind)] = _Tally()
+                self._by_prompt[(prompt_idx, kind)].add(call)
+        self._version += 1
+
+    def __len__(self) -> int:
+        return len(self.model.values)
+
+    def summary(self, exact: bool = True) -> Dict[str, Any]:
+        """Totals, per-model latency/throughput/cost, generation vs judge calls and per-prompt cost,
+        as plain JSON values
+
+        Latencies are the time each successful request was in flight; queue time (rate limits and
+        concurrency slots) and retries are reported separately, and time to first token only
+        covers streamed generations. Percentiles are exact, computed over every call; with
+        `exact=False` they come from running histograms instead (to within a bin, about 6%), so the summary
+        of a live run costs the same however many calls it has made. Memoized until the next result.
+        """
+        cached = self._summary.get(exact)
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        latency = self.latency_seconds.values
+
+        def percentiles(tally: _Tally, mask_of):
+            if not exact:
+                return _histogram_percentiles(tally.latency), _histogram_percentiles(tally.ttft)
+            mask = mask_of()
+            return _percentiles(latency[mask]), _percentiles(self.ttft_seconds.values[mask])
+
+        models = {}
+        for code, name in enumerate(self.models.values):
+            tally = self._by_model[name]
+            (p50, p95, p99), (ttft_p50, ttft_p95, _) = percentiles(tally, lambda: self.model.values == code)
+            models[name] = {
+                "calls": tally.calls,
+                "retries": tally.retries,
+                "latency_p50": p50,
+                "latency_p95": p95,
+                "latency_p99": p99,
+                "ttft_p50": ttft_p50,
+                "ttft_p95": ttft_p95,
+                "queue_avg": tally.queue_seconds / tally.queued if tally.queued else None,
+                "tokens_per_second": (tally.timed_completion_tokens / tally.timed_seconds
+                                      if tally.timed_seconds > 0 else None),
+                "prompt_tokens": tally.prompt_tokens,
+                "completion_tokens": tally.completion_tokens,
+                "cached_tokens": tally.cached_tokens,
+                "cost_usd": tally.cost if tally.priced else None
+            }
+
+        # Judge prompts share a static prefix per scorer, so their cached share shows prompt caching at work
+        kinds = {}
+        for kind, tally in self._by_kind.items():
+            judge = kind == "judge"
+            (p50, p95, _), _ = percentiles(tally, lambda: self.judge.values == judge)
+            kinds[kind] = {
+                "calls": tally.calls,
+                "latency_p50": p50,
+                "latency_p95": p95,
+                "prompt_tokens": tally.prompt_tokens,
+                "cached_tokens": tally.cached_tokens,
+                "cached_share": tally.cached_tokens / tally.prompt_tokens if tally.prompt_tokens else None,
+                "cost_usd": tally.cost
+            }
+
+        prompts = {}
+        empty = _Tally()
+        for prompt_idx, examples in sorted(self.examples.items()):
+            generation = self._by_prompt.get((prompt_idx, "generation"), empty)
+            judge = self._by_prompt.get((prompt_idx, "judge"), empty)
+            prompts[f"Prompt {prompt_idx+1}"] = {
+                "examples": examples,
+                "calls": generation.calls + judge.calls,
+                "tokens": (generation.prompt_tokens + generation.completion_tokens
+                           + judge.prompt_tokens + judge.completion_tokens),
+                "generation_cost_usd": generation.cost,
+                "judge_cost_usd": judge.cost,
+                "cost_usd": generation.cost + judge.cost,
+                "cost_per_example_usd": (generation.cost + judge.cost) / examples
+            }
+
+        tallies = list(self._by_model.values())
+        summary = {
+            "calls": len(self),
+            "retries": sum(tally.retries for tally in tallies),
+            "prompt_tokens": sum(tally.prompt_tokens for tally in tallies),
+            "completion_tokens": sum(tally.completion_tokens for tally in tallies),
+            "cached_tokens": sum(tally.cached_tokens for tally in tallies),
+            "cost_usd": sum(tally.cost for tally in tallies),
+            # Calls to models without a known price are left out of the costs
+            "unpriced_calls": sum(tally.calls - tally.priced for tally in tallies),
+            "models": models,
+            "kinds": kinds,
+            "prompts": prompts
+        }
+        self._summary[exact] = (self._version, summary)
+        return summary
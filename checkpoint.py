@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from cache import DEFAULT_CACHE_DIR
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(DEFAULT_CACHE_DIR, "checkpoints.sqlite")
+# Finished cells read per query when replaying a run, so memory stays flat however large it is
+RESULTS_PAGE_SIZE = 500
+
+
+class CheckpointStore:
+    """Persists every finished (prompt_idx, example_idx) cell of a run so it can be resumed"""
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id TEXT PRIMARY KEY, name TEXT NOT NULL, config TEXT NOT NULL, status TEXT NOT NULL, "
+            "total_cells INTEGER, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cells ("
+            "run_id TEXT NOT NULL, prompt_idx INTEGER NOT NULL, example_idx INTEGER NOT NULL, "
+            "result TEXT NOT NULL, PRIMARY KEY (run_id, prompt_idx, example_idx))"
+        )
+        self._conn.commit()
+
+    def start_run(self, name: str, config: Dict[str, Any], total_cells: Optional[int] = None) -> str:
+        """Register a new run and return its id; `config` must hold everything needed to resume it"""
+        run_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (run_id, name, config, status, total_cells, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'running', ?, ?, ?)",
+                (run_id, name, json.dumps(config, default=str), total_cells, now, now)
+            )
+            self._conn.commit()
+        return run_id
+
+    def record(self, run_id: str, result: Dict[str, Any]):
+        """Persist one finished cell"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cells (run_id, prompt_idx, example_idx, result) VALUES (?, ?, ?, ?)",
+                (run_id, result['prompt_idx'], result['example_idx'], json.dumps(result, default=str))
+            )
+            self._conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def set_status(self, run_id: str, status: str):
+        """Mark a run as 'running', 'completed', 'failed' or 'cancelled'"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (status, time.time(), run_id)
+            )
+            self._conn.commit()
+
+    def set_total_cells(self, run_id: str, total_cells: int):
+        """Record the run's cell count once its dataset has been resolved"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runs SET total_cells = ?, updated_at = ? WHERE run_id = ?", (total_cells, time.time(), run_id)
+            )
+            self._conn.commit()
+
+    def pin_dataset(self, run_id: str, digest: Optional[str], num_rows: int):
+        """Record the dataset version a run evaluates, or check that a resumed run still reads it
+
+        Refs like `name:latest` resolve again on every load, so a dataset republished since the
+        run started would mix its rows with cells finished on the old version. Raises ValueError
+        if the digest or row count differs from the ones the run was started on.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT config FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"No checkpointed run with id {run_id}")
+            config = json.loads(row[0])
+            pinned = config.get('dataset')
+            if pinned is not None:
+                if pinned['digest'] != digest or pinned['num_rows'] != num_rows:
+                    raise ValueError(
+                        f"{config['dataset_ref']} now resolves to a different version ({num_rows} rows, "
+                        f"digest {digest}) than run {run_id} was started on ({pinned['num_rows']} rows, "
+                        f"digest {pinned['digest']}); start a new run instead"
+                    )
+                return
+            config['dataset'] = {"digest": digest, "num_rows": num_rows}
+            self._conn.execute(
+                "UPDATE runs SET config = ?, updated_at = ? WHERE run_id = ?",
+                (json.dumps(config, default=str), time.time(), run_id)
+            )
+            self._conn.commit()
+
+    def completed_cells(self, run_id: str, examples: Optional[Tuple[int, int]] = None) -> Set[Tuple[int, int]]:
+        """(prompt_idx, example_idx) of every cell already finished, optionally only for example_idx
+        in the range [start, stop)"""
+        query, params = "SELECT prompt_idx, example_idx FROM cells WHERE run_id = ?", (run_id,)
+        if examples is not None:
+            query += " AND example_idx >= ? AND example_idx < ?"
+            params += tuple(examples)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {(prompt_idx, example_idx) for prompt_idx, example_idx in rows}
+
+    def iter_results(self, run_id: str) -> Iterator[Dict[str, Any]]:
+        """Finished cells in (prompt_idx, example_idx) order
+
+        Read a page at a time, continuing after the last key seen, so neither the whole run nor
+        the lock is held while the caller works through them.
+        """
+        last = (-1, -1)
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT prompt_idx, example_idx, result FROM cells WHERE run_id = ? "
+                    "AND (prompt_idx, example_idx) > (?, ?) ORDER BY prompt_idx, example_idx LIMIT ?",
+                    (run_id, *last, RESULTS_PAGE_SIZE)
+                ).fetchall()
+            for prompt_idx, example_idx, result in rows:
+                yield json.loads(result)
+            if len(rows) < RESULTS_PAGE_SIZE:
+                return
+            last = rows[-1][:2]
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        runs = self._query_runs("WHERE r.run_id = ?", (run_id,))
+        return runs[0] if runs else None
+
+    def resumable_runs(self) -> List[Dict[str, Any]]:
+        """Runs that did not complete, newest first"""
+        return self._query_runs("WHERE r.status != 'completed'", ())
+
+    def _query_runs(self, where: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.run_id, r.name, r.config, r.status, r.total_cells, r.created_at, r.updated_at, "
+                "(SELECT COUNT(*) FROM cells c WHERE c.run_id = r.run_id) "
+                f"FROM runs r {where} ORDER BY r.updated_at DESC",
+                params
+            ).fetchall()
+        return [
+            {
+                "run_id": run_id,
+                "name": name,
+                "config": json.loads(config),
+                "status": status,
+                "total_cells": total_cells,
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "completed_cells": completed
+            }
+            for run_id, name, config, status, total_cells, created_at, updated_at, completed in rows
+        ]
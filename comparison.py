@@ -0,0 +1,142 @@
+from itertools import combinations
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from results_store import ResultsStore
+
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+# Samples with at most this many distinct values are resampled exactly through their value counts
+MAX_DISTINCT_FOR_COUNTS = 256
+# Values drawn per block when samples with more distinct values are resampled row by row
+RESAMPLE_BLOCK_VALUES = 4_000_000
+
+
+def value_counts(values: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """(values, counts) summarizing a discrete sample for resampling, or None for a continuous one
+
+    Samples with few distinct values (judge scales, true/false) are summarized exactly. Continuous
+    samples (cost, latency, length) are resampled row by row instead: summarizing them would drop
+    the spread between values, which narrows intervals on skewed data.
+    """
+    distinct, counts = np.unique(values, return_counts=True)
+    if len(distinct) <= MAX_DISTINCT_FOR_COUNTS:
+        return distinct, counts
+    return None
+
+
+def _blocks(n_resamples: int, n: int) -> Iterator[int]:
+    """Sizes of the blocks that `n_resamples` row-level resamples of `n` rows are drawn in"""
+    per_block = max(1, RESAMPLE_BLOCK_VALUES // max(n, 1))
+    for start in range(0, n_resamples, per_block):
+        yield min(per_block, n_resamples - start)
+
+
+def bootstrap_means(values: np.ndarray, n_resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """Means of `n_resamples` bootstrap resamples of `values`
+
+    For discrete samples, resampling rows with replacement is the same as drawing the resampled
+    count of each value from a multinomial, which costs O(distinct values) per resample instead
+    of O(rows). Continuous samples are resampled row by row, in blocks to bound memory.
+    """
+    n = len(values)
+    summary = value_counts(values)
+    if summary is None:
+        return np.concatenate([values[rng.integers(0, n, size=(size, n), dtype=np.int32)].mean(axis=1)
+                               for size in _blocks(n_resamples, n)])
+    distinct, counts = summary
+    draws = rng.multinomial(n, counts / n, size=n_resamples)
+    return draws @ distinct / n
+
+
+def sign_flip_sums(differences: np.ndarray, n_resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """Sums of `differences` under random sign flips: the null distribution of a paired test"""
+    nonzero = np.abs(differences[differences != 0])
+    if not len(nonzero):
+        return np.zeros(n_resamples)
+    summary = value_counts(nonzero)
+    if summary is None:
+        # One random bit per difference decides whether it flips to positive
+        n = len(nonzero)
+        positive_sums = [np.unpackbits(rng.integers(0, 256, size=(size, (n + 7) // 8), dtype=np.uint8),
+                                       axis=1, count=n) @ nonzero
+                         for size in _blocks(n_resamples, n)]
+        return 2 * np.concatenate(positive_sums) - nonzero.sum()
+    magnitudes, counts = summary
+    # How many copies of each magnitude flip to positive is Binomial(count, 1/2)
+    positives = rng.binomial(counts, 0.5, size=(n_resamples, len(magnitudes)))
+    return (2 * positives - counts) @ magnitudes
+
+
+def holm_adjust(p_values: List[float]) -> List[float]:
+    """Holm-Bonferroni adjusted p-values, controlling the family-wise error over all prompt pairs"""
+    order = np.argsort(p_values)
+    adjusted = np.empty(len(p_values))
+    running_max = 0.0
+    for rank, idx in enumerate(order):
+        running_max = max(running_max, min(1.0, (len(p_values) - rank) * p_values[idx]))
+        adjusted[idx] = running_max
+    return adjusted.tolist()
+
+
+def compare_prompts(store: ResultsStore, scorer: str, n_resamples: int = DEFAULT_RESAMPLES,
+                    confidence: float = DEFAULT_CONFIDENCE, seed: Optional[int] = 0) -> Dict[str, Any]:
+    """Per-prompt means with bootstrap confidence intervals, and paired tests between prompts
+
+    Each pair of prompts is compared on the examples both were scored on. The mean difference
+    gets a bootstrap confidence interval and a sign-flip permutation p-value, Holm-adjusted
+    across all pairs. Results are memoized on the store.
+    """
+    def compute():
+        rng = np.random.default_rng(seed)
+        matrix = store.score_matrix(scorer)
+        tails = [(1 - confidence) / 2, 1 - (1 - confidence) / 2]
+
+        prompts = []
+        for prompt_idx in range(matrix.shape[1]):
+            values = matrix[:, prompt_idx]
+            values = values[~np.isnan(values)]
+            if not len(values):
+                continue
+            ci_low, ci_high = np.quantile(bootstrap_means(values, n_resamples, rng), tails)
+            prompts.append({
+                "prompt_idx": prompt_idx,
+                "n": len(values),
+                "mean": float(values.mean()),
+                "ci_low": float(ci_low),
+                "ci_high": float(ci_high)
+            })
+
+        pairs = []
+        for a, b in combinations([p['prompt_idx'] for p in prompts], 2):
+            both = ~np.isnan(matrix[:, a]) & ~np.isnan(matrix[:, b])
+            differences = matrix[both, a] - matrix[both, b]
+            if not len(differences):
+                continue
+            ci_low, ci_high = np.quantile(bootstrap_means(differences, n_resamples, rng), tails)
+            observed = abs(differences.sum())
+            null_sums = np.abs(sign_flip_sums(differences, n_resamples, rng))
+            # Tolerance keeps float rounding from splitting ties with the observed sum
+            p_value = (np.count_nonzero(null_sums >= observed - 1e-9) + 1) / (n_resamples + 1)
+            pairs.append({
+                "prompt_a": a,
+                "prompt_b": b,
+                "n": len(differences),
+                "mean_diff": float(differences.mean()),
+                "ci_low": float(ci_low),
+                "ci_high": float(ci_high),
+                "p_value": float(p_value)
+            })
+
+        for pair, adjusted in zip(pairs, holm_adjust([pair['p_value'] for pair in pairs])):
+            pair["p_adjusted"] = adjusted
+            pair["significant"] = adjusted < 1 - confidence
+        return {"scorer": scorer, "confidence": confidence, "prompts": prompts, "pairs": pairs}
+
+    return store.memoized(("compare_prompts", scorer, n_resamples, confidence, seed), compute)
+
+
+def comparable_scorers(store: ResultsStore) -> List[str]:
+    """Scorers with numeric or boolean scores"""
+    return [name for name, column in store.scores.items() if column.kind in ("numeric", "boolean")]
@@ -0,0 +1,66 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class RunCancelled(Exception):
+    """Raised inside a run once its cancel event is set"""
+
+
+class ConcurrencyLimiter:
+    """Caps the number of in-flight model calls, globally and per model"""
+
+    def __init__(self, global_limit: int, default_model_limit: Optional[int] = None,
+                 model_limits: Optional[Dict[str, int]] = None):
+        self.global_limit = max(1, int(global_limit))
+        self.default_model_limit = default_model_limit
+        self.model_limits = dict(model_limits or {})
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._in_flight_by_model: Dict[str, int] = {}
+
+    def limit_for(self, model: str) -> int:
+        """Return the concurrency limit that applies to a model"""
+        limit = self.model_limits.get(model, self.default_model_limit)
+        if limit is None:
+            return self.global_limit
+        return max(1, min(int(limit), self.global_limit))
+
+    def set_global_limit(self, limit: int):
+        """Change the global limit; waiting callers are re-checked immediately"""
+        with self._cond:
+            self.global_limit = max(1, int(limit))
+            self._cond.notify_all()
+
+    def set_model_limit(self, model: str, limit: int):
+        """Change a model's limit; waiting callers are re-checked immediately"""
+        with self._cond:
+            self.model_limits[model] = max(1, int(limit))
+            self._cond.notify_all()
+
+    def in_flight(self, model: Optional[str] = None) -> int:
+        """Number of calls currently holding a slot"""
+        with self._cond:
+            if model is None:
+                return self._in_flight
+            return self._in_flight_by_model.get(model, 0)
+
+    def _has_capacity(self, model: str) -> bool:
+        return (self._in_flight < self.global_limit
+                and self._in_flight_by_model.get(model, 0) < self.limit_for(model))
+
+    @contextmanager
+    def slot(self, model: str):
+        """Block until a call to `model` may start, and hold the slot while it runs"""
+        with self._cond:
+            while not self._has_capacity(model):
+                self._cond.wait()
+            self._in_flight += 1
+            self._in_flight_by_model[model] = self._in_flight_by_model.get(model, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._in_flight_by_model[model] -= 1
+                self._cond.notify_all()
@@ -0,0 +1,174 @@
+import json
+import os
+import uuid
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import weave
+from weave.trace_server.trace_server_interface import ObjQueryReq, ObjectVersionFilter, TableQueryReq
+
+from cache import DEFAULT_CACHE_DIR
+
+DATASET_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "datasets")
+# Rows fetched from the server (or read from the local copy) per page
+PAGE_SIZE = 500
+# Rows sampled when working out which fields a dataset has
+FIELD_SAMPLE_SIZE = 100
+
+
+def get_dataset_fields(rows: Iterable[Dict[str, Any]], sample_size: int = FIELD_SAMPLE_SIZE) -> List[str]:
+    """Field names seen in the first `sample_size` rows, in first-seen order"""
+    fields = {}
+    for row in islice(iter(rows), sample_size):
+        for key in row.keys():
+            fields.setdefault(key, None)
+    return list(fields)
+
+
+def list_datasets(client) -> List[str]:
+    """Names of the Dataset objects in the client's Weave project, newest version of each"""
+    response = client.server.objs_query(ObjQueryReq(
+        project_id=f"{client.entity}/{client.project}",
+        filter=ObjectVersionFilter(base_object_classes=["Dataset"], latest_only=True, is_op=False)
+    ))
+    return sorted(obj.object_id for obj in response.objs)
+
+
+class LoadedDataset:
+    """A dataset version whose rows are streamed page by page rather than held in memory"""
+
+    def __init__(self, ref: str, digest: Optional[str], num_rows: int,
+                 pages: Callable[[], Iterator[List[Dict[str, Any]]]], cached: bool = False,
+                 range_pages: Optional[Callable[[int, int], Iterator[List[Dict[str, Any]]]]] = None):
+        self.ref = ref
+        self.digest = digest
+        self.num_rows = num_rows
+        self.cached = cached
+        self._pages = pages
+        self._range_pages = range_pages
+        self._fields = None
+
+    def iter_pages(self) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the rows in pages; each call starts a fresh pass over the dataset"""
+        return self._pages()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for page in self.iter_pages():
+            yield from page
+
+    def iter_range(self, start: int, stop: int) -> Iterator[Dict[str, Any]]:
+        """Rows at positions [start, stop); server tables are queried from `start` instead of read from the top"""
+        if self._range_pages is None:
+            yield from islice(self, start, stop)
+            return
+        for page in self._range_pages(start, stop):
+            yield from page
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def fields(self) -> List[str]:
+        if self._fields is None:
+            self._fields = get_dataset_fields(self)
+        return self._fields
+
+
+class DatasetLoader:
+    """Loads Weave datasets, keeping a local copy of every version it has fully read
+
+    Local copies are keyed by the digest of the version's row table, so a pinned version is
+    fetched from Weave only once; `name:latest` refs re-resolve to the current digest on each load.
+    """
+
+    def __init__(self, cache_dir: str = DATASET_CACHE_DIR, page_size: int = PAGE_SIZE):
+        self.cache_dir = cache_dir
+        self.page_size = page_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, digest: str):
+        base = os.path.join(self.cache_dir, digest)
+        return f"{base}.jsonl", f"{base}.json"
+
+    def load(self, dataset_ref: str) -> LoadedDataset:
+        """Resolve a dataset ref without reading its rows yet"""
+        dataset = weave.ref(dataset_ref).get()
+        table = dataset.rows
+        table_ref = getattr(table, "table_ref", None)
+        if table_ref is None:
+            # Not backed by a server table (e.g. a local Dataset): rows are already in memory
+            rows = list(table)
+            return LoadedDataset(dataset_ref, None, len(rows), lambda: iter([rows]),
+                                 range_pages=lambda start, stop: iter([rows[start:stop]]))
+
+        digest = table_ref.digest
+        rows_path, meta_path = self._paths(digest)
+        if os.path.exists(rows_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            return LoadedDataset(dataset_ref, digest, meta["num_rows"],
+                                 lambda: self._read_local(rows_path), cached=True,
+                                 range_pages=lambda start, stop: self._read_local(rows_path, start, stop))
+        return LoadedDataset(dataset_ref, digest, len(table),
+                             lambda: self._fetch_remote(table, table_ref, rows_path, meta_path),
+                             range_pages=lambda start, stop: self._fetch_range(table, table_ref, start, stop))
+
+    def _read_local(self, rows_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        with open(rows_path) as f:
+            # Skipped rows are not parsed
+            lines = islice(f, start, stop)
+            while True:
+                page = [json.loads(line) for line in islice(lines, self.page_size)]
+                if not page:
+                    return
+                yield page
+
+    def _fetch_range(self, table, table_ref, start: int, stop: int) -> Iterator[List[Dict[str, Any]]]:
+        """Page through rows [start, stop) of the server table; partial reads are not kept locally"""
+        offset = start
+        while offset < stop:
+            response = table.server.table_query(TableQueryReq(
+                project_id=table_ref.project_id,
+                digest=table_ref.digest,
+                offset=offset,
+                limit=min(self.page_size, stop - offset)
+            ))
+            page = [row.val for row in response.rows]
+            if not page:
+                return
+            offset += len(page)
+            yield page
+
+    def _fetch_remote(self, table, table_ref, rows_path: str, meta_path: str) -> Iterator[List[Dict[str, Any]]]:
+        """Page through the server table, writing through to a local copy that is kept only if complete"""
+        tmp_path = f"{rows_path}.{uuid.uuid4().hex}.tmp"
+        num_rows = 0
+        complete = False
+        try:
+            with open(tmp_path, "w") as out:
+                offset = 0
+                while True:
+                    response = table.server.table_query(TableQueryReq(
+                        project_id=table_ref.project_id,
+                        digest=table_ref.digest,
+                        offset=offset,
+                        limit=self.page_size
+                    ))
+                    page = [row.val for row in response.rows]
+                    if not page:
+                        break
+                    for row in page:
+                        out.write(json.dumps(row, default=str) + "\n")
+                    num_rows += len(page)
+                    offset += len(page)
+                    yield page
+                    if len(page) < self.page_size:
+                        break
+            complete = True
+        finally:
+            if complete:
+                os.replace(tmp_path, rows_path)
+                with open(meta_path, "w") as f:
+                    json.dump({"num_rows": num_rows, "digest": table_ref.digest}, f)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
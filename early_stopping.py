@@ -0,0 +1,180 @@
+import math
+import random
+import threading
+from itertools import combinations
+from statistics import NormalDist
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sampling import example_score
+
+DEFAULT_CONFIDENCE = 0.95
+# Paired examples a pair of prompts needs before it is tested at all
+DEFAULT_MIN_EXAMPLES = 30
+# Each further test of a pair waits until its paired examples have grown by this factor
+LOOK_GROWTH = 1.25
+# Rows held in memory to randomize example order without reading the whole dataset
+SHUFFLE_BUFFER_SIZE = 10_000
+
+
+def shuffle_buffered(items: Iterable, seed: int, buffer_size: int = SHUFFLE_BUFFER_SIZE) -> Iterator:
+    """Yield items in a seeded random order using a bounded buffer
+
+    Datasets up to `buffer_size` rows are fully shuffled; larger ones are shuffled within a
+    sliding window, so memory stays bounded while any sorting in the source is broken up.
+    """
+    rng = random.Random(seed)
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        idx = rng.randrange(buffer_size)
+        yield buffer[idx]
+        buffer[idx] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class PairStats:
+    """Running sums of paired score differences (a - b) for one pair of prompts"""
+
+    def __init__(self, min_examples: int):
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.looks = 0
+        self.next_look = min_examples
+
+    def add(self, difference: float):
+        self.n += 1
+        self.total += difference
+        self.total_sq += difference * difference
+
+    def mean(self) -> float:
+        return self.total / self.n
+
+    def std_error(self) -> float:
+        if self.n < 2:
+            return math.inf
+        variance = max(self.total_sq - self.total * self.total / self.n, 0.0) / (self.n - 1)
+        return math.sqrt(variance / self.n)
+
+
+class SequentialStopper:
+    """Opt-in early stopping for prompt sweeps: stop evaluating prompts that have clearly lost
+
+    Results are compared per example across prompts on one scorer (higher is better). Every
+    pair of still-active prompts is tested on its paired differences at a geometric schedule
+    of looks. The error budget is split across pairs and looks (a union bound), so the chosen
+    confidence holds, up to a normal approximation, for the whole sequential procedure. A
+    prompt is stopped as soon as some other active prompt is significantly better; once one
+    prompt is left, the sweep is decided and the remaining cells are skipped.
+    """
+
+    def __init__(self, scorer: str, confidence: float = DEFAULT_CONFIDENCE,
+                 min_examples: int = DEFAULT_MIN_EXAMPLES, shuffle_seed: Optional[int] = 0):
+        self.scorer = scorer
+        self.confidence = confidence
+        self.min_examples = max(min_examples, 2)
+        self.shuffle_seed = shuffle_seed
+        self.calls_per_cell = 1
+        self.total_cells: Optional[int] = None
+        self._active: List[int] = []
+        self._scores: Dict[int, Dict[int, float]] = {}
+        self._pairs: Dict[Tuple[int, int], PairStats] = {}
+        self._stopped: Dict[int, Dict[str, Any]] = {}
+        self._evaluated = 0
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    def start(self, prompt_indices: List[int], calls_per_cell: int, total_cells: Optional[int] = None):
+        """Called by the engine before the first result, with the prompts being compared"""
+        with self._lock:
+            self._active = list(prompt_indices)
+            self._scores = {idx: {} for idx in prompt_indices}
+            self._pairs = {pair: PairStats(self.min_examples) for pair in combinations(prompt_indices, 2)}
+            self.calls_per_cell = calls_per_cell
+            self.total_cells = total_cells
+
+    @property
+    def decided(self) -> bool:
+        """Only one prompt is left after stopping the others: nothing remains to compare"""
+        return len(self._active) <= 1 and bool(self._stopped)
+
+    def is_active(self, prompt_idx: int) -> bool:
+        return prompt_idx in self._active
+
+    def filter(self, cells: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Drop cells of stopped prompts as they are pulled; ends once the sweep is decided"""
+        for cell in cells:
+            if self.decided:
+                return
+            if not self.is_active(cell['prompt_idx']):
+                with self._lock:
+                    self._skipped += 1
+                continue
+            yield cell
+
+    def observe(self, result: Dict[str, Any]):
+        """Record one finished result and stop any prompt that has clearly lost"""
+        with self._lock:
+            self._evaluated += 1
+            prompt_idx, example_idx = result['prompt_idx'], result['example_idx']
+            score = example_score(result['scores'], self.scorer)
+            if score is None or prompt_idx not in self._scores:
+                return
+            score = float(score)
+            self._scores[prompt_idx][example_idx] = score
+            for other, other_scores in self._scores.items():
+                if other == prompt_idx or example_idx not in other_scores:
+                    continue
+                a, b = sorted((prompt_idx, other))
+                self._pairs[(a, b)].add(self._scores[a][example_idx] - self._scores[b][example_idx])
+            self._test_pairs()
+
+    def _test_pairs(self):
+        n_pairs = len(self._pairs)
+        for (a, b), stats in self._pairs.items():
+            if a not in self._active or b not in self._active or stats.n < stats.next_look:
+                continue
+            stats.looks += 1
+            stats.next_look = max(stats.n + 1, math.ceil(stats.n * LOOK_GROWTH))
+            # Spend the error budget over pairs and over looks k = 1, 2, ... as alpha / (k (k + 1))
+            alpha = (1 - self.confidence) / (n_pairs * stats.looks * (stats.looks + 1))
+            radius = NormalDist().inv_cdf(1 - alpha / 2) * stats.std_error()
+            mean = stats.mean()
+            if mean - radius > 0:
+                self._stop(b, winner=a, stats=stats)
+            elif mean + radius < 0:
+                self._stop(a, winner=b, stats=stats)
+
+    def _stop(self, loser: int, winner: int, stats: PairStats):
+        self._active.remove(loser)
+        self._stopped[loser] = {
+            "after_examples": len(self._scores[loser]),
+            "beaten_by": winner,
+            "mean_gap": abs(stats.mean())
+        }
+
+    def report(self) -> Dict[str, Any]:
+        """Which prompts were stopped, when and by whom, and the cells and calls saved"""
+        with self._lock:
+            skipped = self._skipped
+            if self.decided and self.total_cells is not None:
+                # Cells never pulled because the sweep was decided count as skipped too
+                skipped = max(self.total_cells - self._evaluated, skipped)
+            means = {
+                idx: sum(scores.values()) / len(scores) for idx, scores in self._scores.items() if scores
+            }
+            return {
+                "scorer": self.scorer,
+                "confidence": self.confidence,
+                "active_prompts": list(self._active),
+                "stopped_prompts": dict(self._stopped),
+                "decided": self.decided,
+                "leader": max(self._active, key=lambda idx: means.get(idx, -math.inf)) if self._active else None,
+                "evaluated_cells": self._evaluated,
+                "skipped_cells": skipped,
+                # Upper bound: some skipped calls might have been cache hits
+                "calls_saved": skipped * self.calls_per_cell
+            }
@@ -0,0 +1,938 @@
+import argparse
+import copy
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import httpx
+import weave
+from dotenv import load_dotenv
+from openai import APIConnectionError, APIError, APITimeoutError, DefaultHttpxClient, OpenAI
+
+from batch import run_batch_evaluation
+from cache import GenerationCache, JudgeCache, count_lookup
+from call_metrics import CallMetrics, call_record
+from checkpoint import DEFAULT_CHECKPOINT_PATH, CheckpointStore
+from concurrency import RunCancelled
+from dataset_loader import DatasetLoader, get_dataset_fields
+from early_stopping import DEFAULT_CONFIDENCE, DEFAULT_MIN_EXAMPLES, SequentialStopper, shuffle_buffered
+from local_scorers import is_local, local_output_type, score_cells, scorer_ground_truth, validate_local_scorer
+from log_buffer import BufferedEvaluationLogger, log_result
+from prompts import (
+    DEFAULT_JUDGE_MODEL, JUDGE_PARAMS,
+    build_generation_messages, build_group_response_format, build_group_scoring_messages,
+    build_scoring_messages, field_to_raw_text, generation_params, parse_score
+)
+from sampling import MAX_SAMPLES, distinct_responses, prompt_samples, response_list, sampled_result
+from scheduler import RequestScheduler, estimate_tokens
+
+# Some OpenAI SDK releases are built on httpx2, whose errors are not httpx's
+try:
+    import httpx2
+except ImportError:
+    httpx2 = None
+
+# Available OpenAI models
+AVAILABLE_MODELS = [
+    "gpt-4o",
+    "gpt-4o-mini",
+    "gpt-4.1",
+    "gpt-4.1-mini",
+    "gpt-4.1-nano",
+    "o3-mini",
+    "o4-mini",
+    "o3"
+]
+
+SCORER_OUTPUT_TYPES = ["numeric", "boolean", "text"]
+
+# Items buffered between pipeline stages, per worker
+STAGE_QUEUE_DEPTH = 2
+# How often blocked pipeline workers check whether the run was stopped
+STAGE_POLL_SECONDS = 0.1
+# Shortest interval between partial-output updates of a streamed generation
+PARTIAL_INTERVAL = 0.25
+
+_STOP = object()
+# Idle HTTP connections kept open for reuse; the SDK default closes them after 5 seconds, so
+# every run (and every pause in one) would pay for new TLS handshakes
+HTTP_POOL_CONNECTIONS = 64
+HTTP_KEEPALIVE_SECONDS = 120
+# Errors raised by the SDK's HTTP library while a streamed body is read, such as a dropped connection
+_HTTP_MODULES = (httpx,) if httpx2 is None else (httpx, httpx2)
+STREAM_TIMEOUT_ERRORS = tuple(module.TimeoutException for module in _HTTP_MODULES)
+STREAM_TRANSPORT_ERRORS = tuple(module.TransportError for module in _HTTP_MODULES)
+
+
+def find_input_field(fields):
+    """Find the most likely input field"""
+    for field in ['input', 'example', 'question']:
+        if field in fields:
+            return field
+    return fields[0] if fields else None
+
+
+def find_ground_truth_field(fields):
+    """Find the most likely ground truth field"""
+    for field in ['expected', 'answer', 'ground_truth', 'output']:
+        if field in fields:
+            return field
+    return None
+
+
+def create_evaluation_logger(eval_name, dataset_ref, buffered=True):
+    """Start a Weave evaluation run for this playground
+
+    By default predictions are written from a background thread (see `BufferedEvaluationLogger`),
+    so Weave latency stays off the evaluation's critical path.
+    """
+    eval_logger = weave.EvaluationLogger(
+        name=eval_name,
+        model=f"evaluation_playground_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        dataset=dataset_ref
+    )
+    return BufferedEvaluationLogger(eval_logger) if buffered else eval_logger
+
+
+def iter_cells(rows, prompts, input_field, ground_truth_field=None, shuffle_seed=None, extra_fields=(), start=0):
+    """Yield one work item per (example, prompt with text), reading rows lazily
+
+    With a `shuffle_seed`, examples come in a seeded random order (see `shuffle_buffered`);
+    example_idx always refers to the row's position in the dataset, which for rows read from
+    the middle of a dataset starts at `start`. `extra_fields` are copied into each cell's
+    `fields`, for scorers that compare against their own ground truth column.
+    """
+    active_prompts = [(idx, p) for idx, p in enumerate(prompts) if p['text']]
+    examples = enumerate(rows, start)
+    if shuffle_seed is not None:
+        examples = shuffle_buffered(examples, shuffle_seed)
+    for example_idx, example in examples:
+        for prompt_idx, prompt_config in active_prompts:
+            yield {
+                "prompt_idx": prompt_idx,
+                "example_idx": example_idx,
+                "prompt": prompt_config,
+                "input": example.get(input_field, ""),
+                "ground_truth": example.get(ground_truth_field) if ground_truth_field else None,
+                "fields": {field: example.get(field) for field in extra_fields}
+            }
+
+
+class _StageFailure:
+    """Carries an exception from a pipeline worker to the thread consuming results"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _CellsExhausted:
+    """Sent by the reader once every cell has been handed to the pipeline"""
+
+    def __init__(self, count: int):
+        self.count = count
+
+
+class _PendingCell:
+    """A generated cell waiting for its judge groups; the last group to finish completes it
+
+    Each distinct sample is judged once; samples with identical text share its scores.
+    """
+
+    def __init__(self, cell: Dict[str, Any], responses: List[str], calls: List[Dict[str, Any]], groups: int,
+                 cache_counts: Dict[str, Dict[str, int]]):
+        self.cell = cell
+        self.responses = responses
+        self.unique, self.positions = distinct_responses(responses)
+        self.calls = calls
+        self.cache_counts = cache_counts
+        self.scores: List[Dict[str, Any]] = [{} for _ in self.unique]
+        self._remaining = groups * len(self.unique)
+        self._lock = threading.Lock()
+
+    def add(self, unique_idx: int, scores: Dict[str, Any], cache_counts: Dict[str, Dict[str, int]]) -> bool:
+        """Record one group's scores and cache lookups for one distinct sample; True once every group
+        has reported"""
+        with self._lock:
+            self.scores[unique_idx].update(scores)
+            for label, counts in cache_counts.items():
+                total = self.cache_counts.setdefault(label, {"hits": 0, "misses": 0})
+                total["hits"] += counts["hits"]
+                total["misses"] += counts["misses"]
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+class EvaluationEngine:
+    """Runs prompts over dataset rows and scores the responses with LLM judges, independent of any UI"""
+
+    def __init__(self, client, scheduler: Optional[RequestScheduler] = None,
+                 generation_cache: Optional[GenerationCache] = None,
+                 judge_cache: Optional[JudgeCache] = None):
+        self.client = client
+        self.scheduler = scheduler or RequestScheduler(AVAILABLE_MODELS)
+        self.generation_cache = generation_cache or GenerationCache()
+        self.judge_cache = judge_cache or JudgeCache()
+
+    def with_limits(self, max_concurrency: int, per_model_concurrency: int,
+                    cancel: Optional[threading.Event] = None) -> "EvaluationEngine":
+        """A view of this engine whose model calls also keep to one run's concurrency limits
+
+        The view shares the client, caches and rate-limit state, so runs with different limits
+        can use the same engine at once. Its calls stop retrying once `cancel` is set.
+        """
+        view = copy.copy(self)
+        view.scheduler = self.scheduler.for_run(max_concurrency, per_model_concurrency, cancel)
+        return view
+
+    def chat_completion(self, model, messages, kind="generation", calls=None, **params):
+        """Create a chat completion through the rate-limit-aware scheduler
+
+        With a `calls` list, a record of the call's timing, token usage and estimated cost is
+        appended to it (see `call_metrics.call_record`).
+        """
+        timing = {}
+        response = self.scheduler.call(
+            model,
+            lambda: self.client.chat.completions.with_raw_response.create(model=model, messages=messages, **params),
+            estimated_tokens=estimate_tokens(messages),
+            timing=timing
+        )
+        if calls is not None:
+            calls.append(call_record(kind, model, response.usage, timing))
+        return response
+
+    def stream_chat_completion(self, model, messages, calls=None, on_partial=None, **params) -> List[str]:
+        """Stream a chat completion through the scheduler and return the full text of each choice
+
+        The stream is read while the call holds its concurrency slot, so a connection that drops
+        partway through is retried like a failed request, from the start. `on_partial` receives the
+        first choice's text so far, at most every PARTIAL_INTERVAL seconds. The call's record in
+        `calls` includes its time to first token.
+        """
+        request = {}
+
+        def create():
+            if 'sent' in request and on_partial is not None:
+                # A retry: drop the text shown from the failed attempt
+                on_partial("")
+            request['sent'] = time.monotonic()
+            request.pop('first_token', None)
+            return self.client.chat.completions.with_raw_response.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **params
+            )
+
+        def read(raw):
+            # Server-sent events are decoded directly: building an SDK model per chunk costs more
+            # CPU than the rest of the call
+            # Chunks of several choices (with `n`) arrive interleaved, each tagged with its index
+            parts, usage, reported = {}, None, 0.0
+            try:
+                for line in raw.http_response.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        # Read on to the end of the body so the connection can be reused
+                        continue
+                    chunk = json.loads(data)
+                    if chunk.get("error"):
+                        raise APIError(chunk["error"].get("message") or "Error in streamed response",
+                                       raw.http_response.request, body=chunk["error"])
+                    if chunk.get("usage"):
+                        # Sent in a final chunk without choices
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or ():
+                        delta = choice.get("delta", {}).get("content")
+                        if not delta:
+                            continue
+                        now = time.monotonic()
+                        request.setdefault('first_token', now)
+                        parts.setdefault(choice.get("index", 0), []).append(delta)
+                        if on_partial is not None and now - reported >= PARTIAL_INTERVAL:
+                            reported = now
+                            on_partial("".join(parts.get(0, ())))
+            # The HTTP library's own errors surface when the body is read; map them to the SDK's
+            # retryable ones
+            except STREAM_TIMEOUT_ERRORS as e:
+                raise APITimeoutError(raw.http_response.request) from e
+            except STREAM_TRANSPORT_ERRORS as e:
+                raise APIConnectionError(message=f"Stream interrupted: {e}",
+                                         request=raw.http_response.request) from e
+            finally:
+                raw.http_response.close()
+            choices = max(parts, default=0) + 1
+            return ["".join(parts.get(index, ())) for index in range(choices)], usage
+
+        timing = {}
+        contents, usage = self.scheduler.call(
+            model, create, estimated_tokens=estimate_tokens(messages), timing=timing, read=read,
+            count_tokens=lambda result: (result[1] or {}).get("total_tokens")
+        )
+        if 'first_token' in request:
+            timing['ttft_seconds'] = request['first_token'] - request['sent']
+        if calls is not None:
+            calls.append(call_record("generation", model, usage, timing))
+        return contents
+
+    def run_prompt_on_example(self, prompt, model, example_input, use_cache=True, calls=None, stream=False,
+                              on_partial=None):
+        """Run a single prompt on a single example
+
+        With `stream`, the reply is streamed (see `stream_chat_completion`); cached replies are
+        returned at once either way.
+        """
+        return self.sample_prompt_on_example(prompt, model, example_input, 1, use_cache, calls, stream,
+                                             on_partial)[0]
+
+    def sample_prompt_on_example(self, prompt, model, example_input, samples=1, use_cache=True, calls=None,
+                                 stream=False, on_partial=None, cache_counts=None) -> List[str]:
+        """Run a single prompt on a single example and return `samples` completions
+
+        Several samples come from one request with the `n` parameter, so the prompt is sent,
+        queued and billed for input once. They are cached together, apart from single samples.
+        Cache lookups are tallied in `cache_counts` if given (see `cache.count_lookup`).
+        """
+        params = generation_params(samples)
+        cache_key = GenerationCache.make_key(prompt, model, example_input, params)
+        if use_cache:
+            cached = self.generation_cache.get(cache_key)
+            count_lookup(cache_counts, "Generation", cached is not None)
+            if cached is not None:
+                return response_list(cached)
+
+        messages = build_generation_messages(prompt, example_input)
+        if stream:
+            contents = self.stream_chat_completion(model, messages, calls, on_partial, **params)
+        else:
+            response = self.chat_completion(model, messages, calls=calls, **params)
+            contents = [choice.message.content for choice in sorted(response.choices, key=lambda c: c.index)]
+        # Bypassed lookups still refresh the stored entry
+        self.generation_cache.put(cache_key, contents if samples > 1 else contents[0])
+        return contents
+
+    def score_response(self, scorer_config, input_text, response, ground_truth=None, use_cache=True,
+                       calls=None, cache_counts=None):
+        """Score a response using the LLM judge model named in `scorer_config`"""
+        cache_key = JudgeCache.make_key(scorer_config, input_text, response, ground_truth)
+        if use_cache:
+            cached = self.judge_cache.get(cache_key)
+            count_lookup(cache_counts, "Judge", cached is not None)
+            if cached is not None:
+                # Re-parse the stored raw text so parser changes apply without new API calls
+                return parse_score(scorer_config, cached['raw'])
+
+        messages = build_scoring_messages(scorer_config, input_text, response, ground_truth)
+        judge_response = self.chat_completion(
+            scorer_config.get('model', DEFAULT_JUDGE_MODEL),
+            messages,
+            kind="judge",
+            calls=calls,
+            **JUDGE_PARAMS
+        )
+
+        raw_text = judge_response.choices[0].message.content
+        score = parse_score(scorer_config, raw_text)
+        self.judge_cache.put(cache_key, {"raw": raw_text, "score": score})
+        return score
+
+    def score_response_group(self, scorers, input_text, response, ground_truth=None, use_cache=True, calls=None,
+                             cache_counts=None):
+        """Score a response with several scorers sharing a judge model in a single call"""
+        scores = {}
+        pending = []
+        for scorer in scorers:
+            cached = None
+            if use_cache:
+                cached = self.judge_cache.get(JudgeCache.make_key(scorer, input_text, response, ground_truth))
+                count_lookup(cache_counts, "Judge", cached is not None)
+            if cached is not None:
+                scores[scorer['name']] = parse_score(scorer, cached['raw'])
+            else:
+                pending.append(scorer)
+
+        fallback = pending
+        if len(pending) > 1:
+            judge_response = self.chat_completion(
+                pending[0].get('model', DEFAULT_JUDGE_MODEL),
+                build_group_scoring_messages(pending, input_text, response, ground_truth),
+                response_format=build_group_response_format(pending),
+                kind="judge",
+                calls=calls,
+                **JUDGE_PARAMS
+            )
+            try:
+                fields = json.loads(judge_response.choices[0].message.content or "")
+            except json.JSONDecodeError:
+                fields = {}
+            if not isinstance(fields, dict):
+                fields = {}
+
+            fallback = []
+            for idx, scorer in enumerate(pending):
+                raw_text = field_to_raw_text(scorer, fields.get(f"criterion_{idx+1}"))
+                if raw_text is None:
+                    fallback.append(scorer)
+                    continue
+                score = parse_score(scorer, raw_text)
+                self.judge_cache.put(
+                    JudgeCache.make_key(scorer, input_text, response, ground_truth),
+                    {"raw": raw_text, "score": score}
+                )
+                scores[scorer['name']] = score
+
+        # Anything missing or malformed in the combined reply gets its own judge call; its cache
+        # lookup was already counted above
+        for scorer in fallback:
+            scores[scorer['name']] = self.score_response(
+                scorer, input_text, response, ground_truth, use_cache, calls
+            )
+        return scores
+
+    @staticmethod
+    def judge_groups(scorers: List[Dict[str, Any]], combine_scorers: bool = False) -> List[List[Dict[str, Any]]]:
+        """Units of judge work per response: one per LLM scorer, or with `combine_scorers` one per
+        judge model and ground truth column. Local scorers are left to `score_cells`."""
+        scorers = [scorer for scorer in scorers if not is_local(scorer)]
+        if not combine_scorers:
+            return [[scorer] for scorer in scorers]
+        groups = {}
+        for scorer in scorers:
+            key = (scorer.get('model', DEFAULT_JUDGE_MODEL), scorer.get('ground_truth_field'))
+            groups.setdefault(key, []).append(scorer)
+        return list(groups.values())
+
+    def score_group(self, group, input_text, response, ground_truth, fields=None, use_cache=True,
+                    combine_scorers=False, calls=None, cache_counts=None) -> Dict[str, Any]:
+        """Scores of one group from `judge_groups`, by name
+
+        `fields` holds the columns scorers with their own `ground_truth_field` compare against.
+        Every model call made is recorded in `calls` and every cache lookup in `cache_counts`, if
+        given.
+        """
+        ground_truth = scorer_ground_truth(group[0], ground_truth, fields)
+        if combine_scorers:
+            return self.score_response_group(group, input_text, response, ground_truth, use_cache, calls,
+                                             cache_counts)
+        scorer = group[0]
+        return {
+            scorer['name']: self.score_response(
+                scorer, input_text, response, ground_truth, use_cache, calls, cache_counts
+            )
+        }
+
+    def run(self, rows: Iterable[Dict[str, Any]], prompts: List[Dict[str, Any]], scorers: List[Dict[str, Any]],
+            input_field: str, ground_truth_field: Optional[str] = None, eval_logger=None,
+            checkpoint: Optional[CheckpointStore] = None, run_id: Optional[str] = None,
+            stopper: Optional[SequentialStopper] = None, **settings) -> Iterator[Dict[str, Any]]:
+        """Evaluate every prompt with text on every row, yielding each result as it completes
+
+        Interactive results arrive in completion order; sort on (prompt_idx, example_idx) for a
+        stable order. In "batch" mode everything goes through the Batch API and results arrive
+        in order once both batch jobs finish. Each result is logged to `eval_logger` if given.
+        A result's `calls` lists the model calls made for it (none for cache hits); aggregate
+        them with `call_metrics.CallMetrics`. Its `cache` counts its cache hits and misses.
+
+        With a `checkpoint` store and `run_id`, every finished cell is persisted as it completes.
+        Cells the run already finished are not evaluated again: they are replayed first, to the
+        caller and to `eval_logger`. `settings` are passed through to `run_cells`.
+
+        With a `stopper`, examples are shuffled and prompts that have clearly lost on the
+        stopper's scorer are no longer evaluated; read `stopper.report()` for what was saved.
+        """
+        if stopper is not None:
+            if settings.get('mode', 'interactive') != 'interactive':
+                raise ValueError("Early stopping needs interactive mode")
+            active_prompts = [idx for idx, p in enumerate(prompts) if p['text']]
+            # At most: identical samples share their judge calls
+            samples = max((prompt_samples(prompts[idx]) for idx in active_prompts), default=1)
+            calls_per_cell = 1 + samples * len(self.judge_groups(scorers, settings.get('combine_scorers', False)))
+            total_cells = len(rows) * len(active_prompts) if hasattr(rows, '__len__') else None
+            stopper.start(active_prompts, calls_per_cell, total_cells)
+
+        extra_fields = sorted({s['ground_truth_field'] for s in scorers if s.get('ground_truth_field')})
+        cells = iter_cells(rows, prompts, input_field, ground_truth_field,
+                           stopper.shuffle_seed if stopper is not None else None, extra_fields)
+        finished = set()
+        if checkpoint is not None and run_id is not None:
+            finished = checkpoint.completed_cells(run_id)
+            for result in checkpoint.iter_results(run_id):
+                if eval_logger is not None:
+                    log_result(eval_logger, prompts[result['prompt_idx']]['text'], result)
+                if stopper is not None:
+                    stopper.observe(result)
+                yield result
+            cells = (cell for cell in cells if (cell['prompt_idx'], cell['example_idx']) not in finished)
+        if stopper is not None:
+            cells = stopper.filter(cells)
+
+        if checkpoint is None or run_id is None:
+            for result in self.run_cells(cells, scorers, eval_logger, **settings):
+                if stopper is not None:
+                    stopper.observe(result)
+                yield result
+            return
+
+        checkpoint.set_status(run_id, "running")
+        try:
+            for result in self.run_cells(cells, scorers, eval_logger, **settings):
+                checkpoint.record(run_id, result)
+                if stopper is not None:
+                    stopper.observe(result)
+                yield result
+        except RunCancelled:
+            checkpoint.set_status(run_id, "cancelled")
+            raise
+        except Exception:
+            checkpoint.set_status(run_id, "failed")
+            raise
+        checkpoint.set_status(run_id, "completed")
+
+    def run_cells(self, cells: Iterator[Dict[str, Any]], scorers: List[Dict[str, Any]], eval_logger=None,
+                  max_concurrency: int = 8, per_model_concurrency: int = 4, use_cache: bool = True,
+                  combine_scorers: bool = False, mode: str = "interactive", batch_poll_interval: float = 30.0,
+                  on_batch_status: Optional[Callable[[str, Any], None]] = None, stream: bool = True,
+                  on_partial: Optional[Callable[[Dict[str, Any], Optional[str]], None]] = None,
+                  cancel: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+        """Evaluate work items from `iter_cells`, yielding each result as it completes
+
+        Interactive runs are a pipeline of stages joined by bounded queues: a reader pulling
+        cells, generation workers, judge workers, and the caller's thread, which runs local
+        scorers and hands results to the logger. A response is judged as soon as it has been
+        generated, and generation workers move on without waiting for the judges.
+
+        With `stream`, generations are streamed, so their time to first token is recorded, and
+        `on_partial(cell, text)` receives the text so far (and None once the generation is done).
+
+        Prompts with several `samples` get that many completions per example from one request;
+        every distinct completion is scored, and results carry the aggregates described in
+        `sampling.sampled_result`.
+
+        Setting `cancel` stops the run within STAGE_POLL_SECONDS, even while it waits on a batch
+        job or retries a call: RunCancelled is raised and calls in flight finish unread.
+        """
+        if mode == "batch":
+            if combine_scorers:
+                # Batch judge requests are one per scorer; combined replies would need their own fallback batch
+                raise ValueError("combine_scorers is not supported in batch mode")
+            # Offline mode: one generation batch job, then one judge batch job
+            yield from run_batch_evaluation(
+                self.client, list(cells), scorers, eval_logger,
+                self.generation_cache, self.judge_cache, use_cache,
+                batch_poll_interval, on_batch_status, cancel
+            )
+            return
+
+        # Every model call still waits for a slot in the scheduler, whichever stage makes it, under
+        # this run's limits
+        engine = self.with_limits(max_concurrency, per_model_concurrency, cancel)
+        groups = self.judge_groups(scorers, combine_scorers)
+        stop = threading.Event()
+        # Bounded hand-offs: a slow stage holds back the stages before it, so memory stays flat
+        # however large the dataset is
+        depth = max_concurrency * STAGE_QUEUE_DEPTH
+        generation_queue = queue.Queue(maxsize=depth)
+        judge_queue = queue.Queue(maxsize=depth * max(len(groups), 1))
+        result_queue = queue.Queue(maxsize=depth)
+
+        def put(stage_queue, item) -> bool:
+            while not stop.is_set():
+                try:
+                    stage_queue.put(item, timeout=STAGE_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(stage_queue):
+            while not stop.is_set():
+                try:
+                    return stage_queue.get(timeout=STAGE_POLL_SECONDS)
+                except queue.Empty:
+                    pass
+            return _STOP
+
+        def read_cells():
+            count = 0
+            try:
+                for cell in cells:
+                    if not put(generation_queue, cell):
+                        return
+                    count += 1
+            except Exception as e:
+                put(result_queue, _StageFailure(e))
+                return
+            put(result_queue, _CellsExhausted(count))
+            for _ in range(max_concurrency):
+                put(generation_queue, _STOP)
+
+        def generate():
+            while True:
+                cell = get(generation_queue)
+                if cell is _STOP:
+                    return
+                calls, cache_counts = [], {}
+                partial = None
+                if on_partial is not None:
+                    partial = lambda text, cell=cell: on_partial(cell, text)
+                try:
+                    responses = engine.sample_prompt_on_example(
+                        cell['prompt']['text'], cell['prompt']['model'], cell['input'],
+                        prompt_samples(cell['prompt']), use_cache, calls, stream, partial, cache_counts
+                    )
+                except Exception as e:
+                    put(result_queue, _StageFailure(e))
+                    return
+                finally:
+                    if on_partial is not None:
+                        on_partial(cell, None)
+                pending = _PendingCell(cell, responses, calls, len(groups), cache_counts)
+                if not groups:
+                    put(result_queue, pending)
+                    continue
+                for unique_idx in range(len(pending.unique)):
+                    for group in groups:
+                        if not put(judge_queue, (pending, group, unique_idx)):
+                            return
+
+        def judge():
+            while True:
+                item = get(judge_queue)
+                if item is _STOP:
+                    return
+                pending, group, unique_idx = item
+                cell = pending.cell
+                cache_counts = {}
+                try:
+                    scores = engine.score_group(
+                        group, cell['input'], pending.unique[unique_idx], cell['ground_truth'], cell.get('fields'),
+                        use_cache, combine_scorers, pending.calls, cache_counts
+                    )
+                except Exception as e:
+                    put(result_queue, _StageFailure(e))
+                    return
+                if pending.add(unique_idx, scores, cache_counts):
+                    put(result_queue, pending)
+
+        threads = [threading.Thread(target=read_cells, name="eval-read", daemon=True)]
+        threads += [threading.Thread(target=generate, name=f"eval-generate-{idx}", daemon=True)
+                    for idx in range(max_concurrency)]
+        threads += [threading.Thread(target=judge, name=f"eval-judge-{idx}", daemon=True)
+                    for idx in range(max_concurrency if groups else 0)]
+        for thread in threads:
+            thread.start()
+
+        total, received = None, 0
+        try:
+            while total is None or received < total:
+                if cancel is not None and cancel.is_set():
+                    raise RunCancelled("Cancelled while evaluating")
+                try:
+                    items = [result_queue.get(timeout=STAGE_POLL_SECONDS)]
+                except queue.Empty:
+                    continue
+                # Whatever else has finished meanwhile is scored and logged together with it
+                while True:
+                    try:
+                        items.append(result_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                finished = []
+                for item in items:
+                    if isinstance(item, _StageFailure):
+                        raise item.error
+                    if isinstance(item, _CellsExhausted):
+                        total = item.count
+                    else:
+                        finished.append(item)
+                received += len(finished)
+
+                # Local scorers run in-process over every distinct sample that finished together
+                local_scores = iter(score_cells(
+                    scorers, [pending.cell for pending in finished for _ in pending.unique],
+                    [response for pending in finished for response in pending.unique]
+                ))
+                for pending in finished:
+                    cell = pending.cell
+                    unique_scores = [
+                        {
+                            scorer['name']: (cell_local_scores if is_local(scorer) else judge_scores)[scorer['name']]
+                            for scorer in scorers
+                        }
+                        for judge_scores, cell_local_scores in zip(pending.scores, local_scores)
+                    ]
+                    result = {
+                        "prompt_idx": cell['prompt_idx'],
+                        "example_idx": cell['example_idx'],
+                        "input": cell['input'],
+                        **sampled_result(scorers, pending.responses,
+                                         [unique_scores[position] for position in pending.positions]),
+                        "ground_truth": cell['ground_truth'],
+                        "calls": pending.calls,
+                        "cache": pending.cache_counts
+                    }
+                    if eval_logger is not None:
+                        log_result(eval_logger, cell['prompt']['text'], result)
+                    yield result
+        finally:
+            # On failure or early exit, every stage stops taking work; calls in flight finish in the background
+            stop.set()
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters for the generation and judge caches"""
+        return {"Generation": self.generation_cache.stats(), "Judge": self.judge_cache.stats()}
+
+
+def create_engine() -> EvaluationEngine:
+    """Engine wired to the OpenAI client from the environment, with a connection pool reused across runs"""
+    http_client = DefaultHttpxClient(limits=httpx.Limits(
+        max_connections=None, max_keepalive_connections=HTTP_POOL_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+    ))
+    # Retries are handled by the request scheduler, so the client must not retry on its own
+    return EvaluationEngine(OpenAI(max_retries=0, http_client=http_client))  # This will use OPENAI_API_KEY from environment
+
+
+def load_scorers(path: str) -> List[Dict[str, Any]]:
+    """Read scorer configs from a JSON file holding a list of scorer dicts"""
+    with open(path) as f:
+        scorers = json.load(f)
+    if isinstance(scorers, dict):
+        scorers = [scorers]
+    for scorer in scorers:
+        if 'name' not in scorer:
+            raise ValueError("Every scorer needs a name")
+        if scorer.get('type', 'llm') != 'llm':
+            # Local scorers: output type follows from the scorer type
+            validate_local_scorer(scorer)
+            scorer['output_type'] = local_output_type(scorer)
+            continue
+        missing = [key for key in ("prompt", "output_type") if key not in scorer]
+        if missing:
+            raise ValueError(f"Scorer {scorer['name']} is missing {', '.join(missing)}")
+        if scorer['output_type'] not in SCORER_OUTPUT_TYPES:
+            raise ValueError(f"Scorer {scorer['name']} has unknown output_type '{scorer['output_type']}'")
+        examples = scorer.get('examples', [])
+        if not isinstance(examples, list) or not all(isinstance(e, dict) and 'score' in e for e in examples):
+            raise ValueError(f"Scorer {scorer['name']} examples must be a list of objects with a score")
+        scorer.setdefault("model", DEFAULT_JUDGE_MODEL)
+    return scorers
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # Load environment variables from .env file
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        prog="python -m eval_engine",
+        description="Run a prompt evaluation headlessly and stream results as JSONL"
+    )
+    parser.add_argument("--dataset", help="Weave dataset reference, e.g. dataset_name:version")
+    parser.add_argument("--prompt-file", action="append",
+                        help="File holding a system prompt; repeat for several prompts")
+    parser.add_argument("--model", action="append",
+                        help="Model for the prompts: give once for all, or once per --prompt-file")
+    parser.add_argument("--scorers", help="JSON file with a list of scorer configs")
+    parser.add_argument("--output", "-o", help="Write JSONL results here instead of stdout")
+    parser.add_argument("--name", default=f"eval_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                        help="Name for this evaluation run in Weave")
+    parser.add_argument("--project", default=os.getenv("WEAVE_PROJECT", "evaluation-playground"),
+                        help="Weave project (defaults to WEAVE_PROJECT)")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--per-model-concurrency", type=int, default=4)
+    parser.add_argument("--mode", choices=["interactive", "batch"], default="interactive")
+    parser.add_argument("--batch-poll-interval", type=float, default=30.0)
+    parser.add_argument("--samples", type=int, default=1,
+                        help=f"Completions per example for every prompt (1-{MAX_SAMPLES}), fetched in one request "
+                             "and each scored")
+    parser.add_argument("--combine-scorers", action="store_true",
+                        help="One structured-output judge call per judge model instead of per scorer")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the generation and judge caches")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Request generations in one piece instead of streaming them")
+    parser.add_argument("--early-stopping", metavar="SCORER",
+                        help="Shuffle examples and stop prompts that are clearly worse on this scorer")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE, help="Confidence for --early-stopping")
+    parser.add_argument("--min-examples", type=int, default=DEFAULT_MIN_EXAMPLES,
+                        help="Paired examples before --early-stopping tests a pair of prompts")
+    parser.add_argument("--resume", metavar="RUN_ID",
+                        help="Resume an interrupted run, skipping cells it already finished")
+    sharding = parser.add_argument_group("sharded runs")
+    sharding.add_argument("--workers", type=int,
+                          help="Split the dataset into shards and evaluate them in this many worker processes")
+    sharding.add_argument("--shard-size", type=int, help="Examples per shard (default 500)")
+    sharding.add_argument("--shard-worker", metavar="RUN_ID",
+                          help="Only take shards of a sharded run started elsewhere, e.g. from another host")
+    sharding.add_argument("--checkpoint-db", default=DEFAULT_CHECKPOINT_PATH,
+                          help="Checkpoint and shard queue database; put it on a shared filesystem for "
+                               "workers on other hosts")
+    args = parser.parse_args(argv)
+    if args.mode == "batch" and args.combine_scorers:
+        parser.error("--combine-scorers is not supported with --mode batch")
+    settings = {
+        "max_concurrency": args.max_concurrency, "per_model_concurrency": args.per_model_concurrency,
+        "use_cache": not args.no_cache, "combine_scorers": args.combine_scorers, "mode": args.mode,
+        "batch_poll_interval": args.batch_poll_interval, "stream": not args.no_stream
+    }
+
+    if args.shard_worker:
+        # Imported here: sharding builds on this module
+        from sharding import work_shards
+        finished = work_shards(args.shard_worker, settings, args.project, args.checkpoint_db)
+        print(f"Finished {finished} shards; no shards of run {args.shard_worker} are left", file=sys.stderr)
+        return 0
+
+    checkpoint = CheckpointStore(args.checkpoint_db)
+    if args.resume:
+        run = checkpoint.get_run(args.resume)
+        if run is None:
+            parser.error(f"No checkpointed run with id {args.resume}")
+        run_id = run['run_id']
+        config = run['config']
+        dataset_ref, prompts, scorers = config['dataset_ref'], config['prompts'], config['scorers']
+        # Finished cells are replayed into a new Weave evaluation linked by name
+        eval_name = f"{run['name']} (resumed)"
+        if 'sharding' in config and args.workers is None:
+            args.workers = os.cpu_count() or 1
+        elif 'sharding' not in config and args.workers is not None:
+            parser.error(f"Run {run_id} was not sharded; resume it without --workers")
+    else:
+        if not (args.dataset and args.prompt_file and args.scorers):
+            parser.error("--dataset, --prompt-file and --scorers are required unless --resume is given")
+        if not 1 <= args.samples <= MAX_SAMPLES:
+            parser.error(f"--samples must be between 1 and {MAX_SAMPLES}")
+        models = args.model or [AVAILABLE_MODELS[0]]
+        if len(models) not in (1, len(args.prompt_file)):
+            parser.error("--model must be given once or once per --prompt-file")
+        if len(models) == 1:
+            models = models * len(args.prompt_file)
+        prompts = []
+        for path, model in zip(args.prompt_file, models):
+            with open(path) as f:
+                prompts.append({"text": f.read().strip(), "model": model, "samples": args.samples})
+        scorers = load_scorers(args.scorers)
+        dataset_ref = args.dataset
+        eval_name = args.name
+        run_id = None
+
+    weave.init(project_name=args.project)
+    dataset = DatasetLoader().load(dataset_ref)
+    fields = dataset.fields
+    input_field = find_input_field(fields)
+    ground_truth_field = find_ground_truth_field(fields)
+    if not input_field:
+        print("Could not find input field in dataset", file=sys.stderr)
+        return 1
+
+    eval_logger = create_evaluation_logger(eval_name, dataset_ref)
+    if args.workers is not None:
+        from sharding import DEFAULT_SHARD_SIZE, ShardQueue, run_sharded, start_sharded_run
+
+        if args.early_stopping:
+            parser.error("--early-stopping cannot be combined with --workers")
+        if run_id is None:
+            run_id = start_sharded_run(checkpoint, ShardQueue(args.checkpoint_db), eval_name, dataset, prompts,
+                                       scorers, input_field, ground_truth_field, args.shard_size or DEFAULT_SHARD_SIZE)
+    elif run_id is None:
+        config = {"dataset_ref": dataset_ref, "prompts": prompts, "scorers": scorers}
+        total_cells = len(dataset) * len([p for p in prompts if p['text']])
+        run_id = checkpoint.start_run(eval_name, config, total_cells)
+    if args.workers is None:
+        try:
+            checkpoint.pin_dataset(run_id, dataset.digest, len(dataset))
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    print(f"Run id: {run_id} (resume with --resume {run_id})", file=sys.stderr)
+
+    def on_batch_status(stage, batch):
+        print(f"{stage} batch {batch.id}: {batch.status}", file=sys.stderr)
+
+    stopper = None
+    if args.early_stopping:
+        if args.early_stopping not in [s['name'] for s in scorers]:
+            parser.error(f"--early-stopping: no scorer named {args.early_stopping}")
+        stopper = SequentialStopper(args.early_stopping, args.confidence, args.min_examples)
+
+    if args.workers is not None:
+        print(f"Sharded run: other hosts can join with --shard-worker {run_id}", file=sys.stderr)
+        last_counts = {}
+
+        def on_progress(counts):
+            if counts != last_counts:
+                last_counts.update(counts)
+                print(f"Shards: {counts['done']} done, {counts['leased']} running, {counts['pending']} pending, "
+                      f"{counts['failed']} failed", file=sys.stderr)
+
+        results = run_sharded(run_id, args.workers, settings, eval_logger, args.project, args.checkpoint_db,
+                              on_progress=on_progress)
+    else:
+        # Sharded runs evaluate in worker processes, each with its own engine
+        engine = create_engine()
+        results = engine.run(dataset, prompts, scorers, input_field, ground_truth_field, eval_logger, checkpoint,
+                             run_id, stopper, on_batch_status=on_batch_status, **settings)
+
+    metrics = CallMetrics()
+    # Per scorer: summed variance between samples, sampled examples, and examples whose samples disagree
+    variability: Dict[str, List[float]] = {}
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in results:
+            metrics.add(result)
+            for name, stats in (result.get('score_stats') or {}).items():
+                totals = variability.setdefault(name, [0.0, 0, 0])
+                totals[0] += stats['variance']
+                totals[1] += 1
+                totals[2] += stats['variance'] > 0
+            out.write(json.dumps(result, default=str) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        eval_logger.close()
+    performance = metrics.summary()
+    eval_logger.log_summary({"performance": performance})
+    for model, stats in performance['models'].items():
+        latency = ""
+        if stats['latency_p50'] is not None:
+            latency = (f", latency p50/p95/p99 {stats['latency_p50']:.2f}/{stats['latency_p95']:.2f}/"
+                       f"{stats['latency_p99']:.2f} s, {stats['tokens_per_second'] or 0:.0f} tokens/s")
+        cost = f"${stats['cost_usd']:.4f}" if stats['cost_usd'] is not None else "unknown cost"
+        print(f"{model}: {stats['calls']} calls, {stats['retries']} retries{latency}, "
+              f"{stats['prompt_tokens']}+{stats['completion_tokens']} tokens, {cost}", file=sys.stderr)
+    judge = performance['kinds']['judge']
+    if judge['calls']:
+        cached = f"{judge['cached_share']:.0%}" if judge['cached_share'] is not None else "0%"
+        print(f"Judge calls: {judge['calls']}, {judge['cached_tokens']}/{judge['prompt_tokens']} input tokens "
+              f"({cached}) from the prompt cache", file=sys.stderr)
+    for prompt_label, stats in performance['prompts'].items():
+        print(f"{prompt_label}: ${stats['cost_usd']:.4f} (${stats['cost_per_example_usd']:.5f} per example)",
+              file=sys.stderr)
+    print(f"Total estimated cost: ${performance['cost_usd']:.4f}", file=sys.stderr)
+    for name, (variance, examples, unstable) in variability.items():
+        print(f"Sample variability of {name}: mean variance {variance / examples:.3f} over {examples} examples, "
+              f"{unstable / examples:.0%} with samples that disagree", file=sys.stderr)
+    if stopper is not None:
+        report = stopper.report()
+        for prompt_idx, info in sorted(report['stopped_prompts'].items()):
+            print(f"Early stopping: prompt {prompt_idx+1} stopped after {info['after_examples']} examples "
+                  f"(behind prompt {info['beaten_by']+1})", file=sys.stderr)
+        print(f"Early stopping: skipped {report['skipped_cells']} cells, "
+              f"saving up to {report['calls_saved']} model calls", file=sys.stderr)
+    log_stats = eval_logger.stats()
+    print(
+        f"Weave logging: {log_stats['flushed']} predictions in {log_stats['flushes']} flushes, "
+        f"max queue depth {log_stats['max_queue_depth']}, "
+        f"flush latency p95 {log_stats['flush_latency_p95'] * 1000:.0f} ms, "
+        f"blocked {log_stats['blocked_seconds']:.1f} s",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import weave
+from dotenv import load_dotenv
+from weave.trace.refs import TableRef
+from weave.trace.vals import WeaveTable
+from weave.trace_server.trace_server_interface import (
+    TableAppendSpec, TableAppendSpecPayload, TableCreateReq, TableSchemaForInsert, TableUpdateReq
+)
+
+from cache import content_hash
+from dataset_loader import FIELD_SAMPLE_SIZE, get_dataset_fields
+from eval_engine import find_ground_truth_field, find_input_field
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # optional: `pip install pyarrow` to ingest Parquet files
+    pq = None
+
+# Rows read, validated and uploaded per request
+CHUNK_SIZE = 1000
+FORMATS = {".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv", ".parquet": "parquet"}
+
+
+class IngestError(ValueError):
+    """The file cannot be published as an evaluation dataset"""
+
+
+def detect_format(path: str) -> str:
+    """File format from the extension: jsonl, csv or parquet"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise IngestError(f"Cannot tell the format of {path}; pass --format")
+    return FORMATS[extension]
+
+
+def _read_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise IngestError(f"{path}:{line_number}: invalid JSON ({e.msg})") from None
+            if not isinstance(row, dict):
+                raise IngestError(f"{path}:{line_number}: expected a JSON object per line")
+            yield row
+
+
+def _read_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            # DictReader puts cells beyond the header under a None key
+            if None in row:
+                raise IngestError(f"{path}:{reader.line_num}: more cells than header columns")
+            yield row
+
+
+def _read_parquet(path: str, batch_size: int) -> Iterator[Dict[str, Any]]:
+    if pq is None:
+        raise IngestError("Reading Parquet files needs pyarrow: `uv pip install pyarrow`")
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        for row in batch.to_pylist():
+            # Dates, decimals and binary columns are stored as their string form
+            yield json.loads(json.dumps(row, ensure_ascii=False, default=str))
+
+
+def iter_chunks(path: str, file_format: str, chunk_size: int = CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Rows of a file in lists of up to `chunk_size`, read lazily"""
+    if file_format == "jsonl":
+        rows = _read_jsonl(path)
+    elif file_format == "csv":
+        rows = _read_csv(path)
+    elif file_format == "parquet":
+        rows = _read_parquet(path, chunk_size)
+    else:
+        raise IngestError(f"Unknown format {file_format}")
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Schema:
+    """Fields of a dataset and its input and ground truth fields, inferred from its first rows
+
+    Fields are detected the way the app and CLI detect them when they load a dataset, so the
+    published dataset runs with the fields reported here.
+    """
+
+    def __init__(self, sample: List[Dict[str, Any]], input_field: Optional[str] = None,
+                 ground_truth_field: Optional[str] = None):
+        self.fields = get_dataset_fields(sample, FIELD_SAMPLE_SIZE)
+        for name, field in (("input", input_field), ("ground truth", ground_truth_field)):
+            if field is not None and field not in self.fields:
+                raise IngestError(f"No {name} field {field!r}; the first rows have {', '.join(self.fields)}")
+        self.input_field = input_field or find_input_field(self.fields)
+        self.ground_truth_field = ground_truth_field or find_ground_truth_field(self.fields)
+        if not self.input_field:
+            raise IngestError("Could not find an input field: the first rows have no fields")
+        self._known = set(self.fields)
+        self.extra_fields: Dict[str, int] = {}
+
+    def validate(self, row: Dict[str, Any]) -> bool:
+        """Whether a row can be evaluated: its input is present and not empty
+
+        Fields that the first rows did not have are counted in `extra_fields`; the row is kept.
+        """
+        for key in row.keys() - self._known:
+            self.extra_fields[key] = self.extra_fields.get(key, 0) + 1
+        value = row.get(self.input_field)
+        return value is not None and value != ""
+
+
+class Deduplicator:
+    """Drops rows whose content was already seen, keeping the first occurrence
+
+    Only 16 bytes of each distinct row's hash are kept, so memory grows by under 100 bytes per row.
+    """
+
+    def __init__(self):
+        self._seen = set()
+
+    def unique(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        kept = []
+        for row in rows:
+            digest = bytes.fromhex(content_hash(row))[:16]
+            if digest not in self._seen:
+                self._seen.add(digest)
+                kept.append(row)
+        return kept
+
+
+class TablePublisher:
+    """Uploads rows to one Weave table, chunk by chunk, then publishes a Dataset over it
+
+    The first chunk creates the table and every later one appends to it, so no more than a chunk of
+    rows is held in memory at once.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.project_id = f"{client.entity}/{client.project}"
+        self.digest: Optional[str] = None
+
+    def append(self, rows: List[Dict[str, Any]]):
+        if self.digest is None:
+            response = self.client.server.table_create(TableCreateReq(
+                table=TableSchemaForInsert(project_id=self.project_id, rows=rows)
+            ))
+        else:
+            response = self.client.server.table_update(TableUpdateReq(
+                project_id=self.project_id,
+                base_digest=self.digest,
+                updates=[TableAppendSpec(append=TableAppendSpecPayload(row=row)) for row in rows]
+            ))
+        self.digest = response.digest
+
+    def publish(self, name: str) -> str:
+        """Publish the table as the next version of dataset `name`; returns its reference"""
+        table_ref = TableRef(entity=self.client.entity, project=self.client.project, _digest=self.digest)
+        dataset = weave.Dataset(name=name, rows=WeaveTable(server=self.client.server, table_ref=table_ref))
+        ref = weave.publish(dataset)
+        return f"{name}:{ref.digest}"
+
+
+def ingest(chunks: Iterable[List[Dict[str, Any]]], publisher: Optional[TablePublisher] = None,
+           input_field: Optional[str] = None, ground_truth_field: Optional[str] = None,
+           dedupe: bool = True, on_progress=None) -> Dict[str, Any]:
+    """Validate, deduplicate and upload chunks of rows; returns the run's counts and schema
+
+    Rows without an input are skipped. The schema is inferred from the first FIELD_SAMPLE_SIZE
+    rows, whatever the chunk size. Without a publisher nothing is uploaded, which checks a file
+    before publishing it. `on_progress` is called with the running counts after every chunk.
+    """
+    chunks = iter(chunks)
+    # Chunks are held back until they cover the rows the fields are detected from
+    buffered: List[List[Dict[str, Any]]] = []
+    for chunk in chunks:
+        buffered.append(chunk)
+        if sum(map(len, buffered)) >= FIELD_SAMPLE_SIZE:
+            break
+    if not buffered:
+        raise IngestError("The file has no rows")
+    schema = Schema([row for chunk in buffered for row in chunk][:FIELD_SAMPLE_SIZE], input_field, ground_truth_field)
+    deduplicator = Deduplicator() if dedupe else None
+    stats = {"rows": 0, "published": 0, "duplicates": 0, "invalid": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    start = time.perf_counter()
+    for chunk in chain(buffered, chunks):
+        stats["rows"] += len(chunk)
+        valid = [row for row in chunk if schema.validate(row)]
+        stats["invalid"] += len(chunk) - len(valid)
+        if deduplicator is not None:
+            unique = deduplicator.unique(valid)
+            stats["duplicates"] += len(valid) - len(unique)
+            valid = unique
+        if valid and publisher is not None:
+            publisher.append(valid)
+        stats["published"] += len(valid)
+        stats["seconds"] = time.perf_counter() - start
+        stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        if on_progress:
+            on_progress(stats)
+    if not stats["published"]:
+        raise IngestError(f"No row has a value for the input field {schema.input_field!r}")
+    return {
+        **stats,
+        "fields": schema.fields,
+        "input_field": schema.input_field,
+        "ground_truth_field": schema.ground_truth_field,
+        "extra_fields": schema.extra_fields
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        prog="python ingest_dataset.py",
+        description="Publish a JSONL, CSV or Parquet file as a Weave dataset, streaming it in chunks"
+    )
+    parser.add_argument("path", help="File to ingest")
+    parser.add_argument("--name", help="Dataset name in Weave (defaults to the file name)")
+    parser.add_argument("--project", default=os.getenv("WEAVE_PROJECT", "evaluation-playground"),
+                        help="Weave project (defaults to WEAVE_PROJECT)")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())),
+                        help="File format (defaults to the extension's)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows read and uploaded at a time")
+    parser.add_argument("--input-field", help="Field holding each example's input (detected if omitted)")
+    parser.add_argument("--ground-truth-field", help="Field holding the expected output (detected if omitted)")
+    parser.add_argument("--keep-duplicates", action="store_true", help="Publish rows with identical content")
+    parser.add_argument("--dry-run", action="store_true", help="Validate the file and report counts without publishing")
+    args = parser.parse_args(argv)
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+
+    name = args.name or os.path.splitext(os.path.basename(args.path))[0]
+    publisher = None
+    if not args.dry_run:
+        publisher = TablePublisher(weave.init(project_name=args.project))
+
+    def on_progress(stats):
+        print(f"\r{stats['rows']} rows read, {stats['published']} kept, {stats['duplicates']} duplicates, "
+              f"{stats['invalid']} without input ({stats['rows_per_second']:.0f} rows/s)",
+              end="", file=sys.stderr, flush=True)
+
+    try:
+        file_format = args.format or detect_format(args.path)
+        report = ingest(iter_chunks(args.path, file_format, args.chunk_size), publisher,
+                        args.input_field, args.ground_truth_field, not args.keep_duplicates, on_progress)
+    except (IngestError, OSError) as e:
+        print(f"\nError: {e}", file=sys.stderr)
+        return 1
+    print(file=sys.stderr)
+    print(f"Fields: {', '.join(report['fields'])}; input {report['input_field']!r}, "
+          f"ground truth {report['ground_truth_field']!r}", file=sys.stderr)
+    for field, count in report["extra_fields"].items():
+        print(f"Warning: {count} rows have field {field!r}, which the first rows do not", file=sys.stderr)
+    print(f"{report['published']} of {report['rows']} rows in {report['seconds']:.1f} s "
+          f"({report['rows_per_second']:.0f} rows/s)", file=sys.stderr)
+    if publisher is not None:
+        print(f"Published {publisher.publish(name)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+from typing import Any, Dict, List
+
+import streamlit as st
+
+from sampling import example_score
+
+
+class RunningAggregates:
+    """Per-scorer running totals, updated in O(1) per result"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.totals: Dict[str, float] = {}
+        self.kinds: Dict[str, str] = {}
+
+    def update(self, scores: Dict[str, Any]):
+        for name, score in scores.items():
+            if score is None:
+                continue
+            if isinstance(score, bool):
+                kind = "boolean"
+            elif isinstance(score, (int, float)):
+                kind = "numeric"
+            else:
+                kind = "text"
+            self.kinds.setdefault(name, kind)
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if kind != "text":
+                # Sampled examples count a boolean scorer by the share of their samples that pass
+                self.totals[name] = self.totals.get(name, 0.0) + float(example_score(scores, name))
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One summary row per scorer, in the shape shown in the results section"""
+        rows = []
+        for name, kind in self.kinds.items():
+            count = self.counts[name]
+            if kind == "boolean":
+                value = f"{self.totals[name] / count * 100:.1f}% true"
+            elif kind == "numeric":
+                value = f"{self.totals[name] / count:.2f} avg"
+            else:
+                value = "text"
+            rows.append({"Scorer": name, "Scored": count, "Running value": value})
+        return rows
+
+
+def result_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact table row for one result, as shown in the live view"""
+    row = {
+        "Prompt": f"Prompt {result['prompt_idx']+1}",
+        "Example": result['example_idx'] + 1,
+        "Input": str(result['input'])[:60],
+        "Response": str(result['response'])[:60],
+    }
+    row.update({name: score for name, score in result['scores'].items()})
+    return row
+
+
+def show_run_progress(run: Dict[str, Any]):
+    """Draw one background run from a worker snapshot: progress, running aggregates, generations
+    being streamed and recent rows
+
+    Only the last results kept by the worker are shown, so rendering cost does not grow with
+    the dataset; the page redraws whenever the app polls the worker.
+    """
+    total = max(run['total'], 1)
+    st.progress(min(run['completed'] / total, 1.0))
+    status = f"Completed {run['completed']}/{run['total']}" if run['total'] else run['message']
+    if run['total'] and run['message'] != "Evaluating...":
+        status = f"{status}: {run['message']}"
+    st.text(status)
+    if run.get('logging'):
+        log_stats = run['logging']
+        st.caption(
+            f"Weave logging: {log_stats['flushed']}/{log_stats['enqueued']} written, "
+            f"queue depth {log_stats['queue_depth']} (max {log_stats['max_queue_depth']}), "
+            f"flush latency p95 {log_stats['flush_latency_p95'] * 1000:.0f} ms"
+        )
+    if run.get('performance') and run['performance']['calls']:
+        performance = run['performance']
+        st.caption(
+            f"{performance['calls']} model calls ({performance['retries']} retries), "
+            f"{performance['prompt_tokens'] + performance['completion_tokens']} tokens, "
+            f"~${performance['cost_usd']:.4f} so far"
+        )
+    if run.get('early_stopping'):
+        show_early_stopping(run['early_stopping'])
+    if run['aggregates']:
+        st.dataframe(run['aggregates'], hide_index=True)
+    if run.get('streaming'):
+        st.caption("Generating now")
+        st.dataframe(run['streaming'], hide_index=True)
+    if run['recent']:
+        st.dataframe(run['recent'], hide_index=True)
+
+
+def show_early_stopping(report: Dict[str, Any]):
+    """Summarize which prompts early stopping has dropped and what that saved"""
+    stopped = [
+        f"Prompt {idx+1} after {info['after_examples']} examples (behind Prompt {info['beaten_by']+1})"
+        for idx, info in sorted(report['stopped_prompts'].items())
+    ]
+    if report['decided']:
+        st.caption(f"Early stopping: Prompt {report['leader']+1} wins on {report['scorer']} "
+                   f"at {report['confidence']:.0%} confidence")
+    if stopped:
+        st.caption("Stopped: " + "; ".join(stopped))
+    else:
+        st.caption(f"Early stopping on {report['scorer']}: no prompt decided yet")
+    if report['skipped_cells']:
+        st.caption(f"Skipped {report['skipped_cells']} examples, saving up to {report['calls_saved']} model calls")
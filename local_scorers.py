@@ -0,0 +1,179 @@
+import json
+import re
+import string
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz as _rapidfuzz_fuzz
+    from rapidfuzz.process import cpdist as _rapidfuzz_cpdist
+except ImportError:  # optional: `pip install rapidfuzz` for vectorized fuzzy matching
+    _rapidfuzz_fuzz = None
+    _rapidfuzz_cpdist = None
+
+# Local scorer types and the output type each one produces; scorers without a type are LLM judges
+LOCAL_SCORER_TYPES = {
+    "exact": "boolean",
+    "normalized": "boolean",
+    "contains": "boolean",
+    "fuzzy": "numeric",
+    "regex": "boolean",
+    "json_path": "boolean",
+}
+# Local scorer types that compare the response against a ground truth value
+GROUND_TRUTH_TYPES = {"exact", "normalized", "contains", "fuzzy", "json_path"}
+
+_PUNCTUATION = str.maketrans("", "", string.punctuation)
+_WHITESPACE = re.compile(r"\s+")
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_PATH_TOKEN = re.compile(r"\.?([^.\[\]]+)|\[(\d+)\]")
+
+
+def is_local(scorer_config: Dict[str, Any]) -> bool:
+    """Whether a scorer is computed in-process instead of by an LLM judge"""
+    return scorer_config.get('type', 'llm') in LOCAL_SCORER_TYPES
+
+
+def scorer_ground_truth(scorer_config: Dict[str, Any], ground_truth: Any, fields: Optional[Dict[str, Any]] = None):
+    """The ground truth a scorer compares against: its own column if it names one, else the dataset default"""
+    field = scorer_config.get('ground_truth_field')
+    if field:
+        return (fields or {}).get(field)
+    return ground_truth
+
+
+def local_output_type(scorer_config: Dict[str, Any]) -> str:
+    """Output type of a local scorer; fuzzy similarity becomes a pass/fail check when given a threshold"""
+    if scorer_config['type'] == "fuzzy" and scorer_config.get('threshold') is not None:
+        return "boolean"
+    return LOCAL_SCORER_TYPES[scorer_config['type']]
+
+
+def validate_local_scorer(scorer_config: Dict[str, Any]):
+    """Raise ValueError if a local scorer is missing settings or has an invalid pattern"""
+    scorer_type = scorer_config['type']
+    if scorer_type not in LOCAL_SCORER_TYPES:
+        raise ValueError(f"Scorer {scorer_config['name']} has unknown type '{scorer_type}'")
+    if scorer_type == "regex":
+        if not scorer_config.get('pattern'):
+            raise ValueError(f"Regex scorer {scorer_config['name']} needs a pattern")
+        try:
+            re.compile(scorer_config['pattern'])
+        except re.error as e:
+            raise ValueError(f"Regex scorer {scorer_config['name']} has an invalid pattern: {e}")
+    if scorer_type == "json_path" and not scorer_config.get('path'):
+        raise ValueError(f"JSON scorer {scorer_config['name']} needs a path")
+
+
+def normalize_text(value: Any) -> str:
+    """Casefold, strip accents and punctuation, and collapse whitespace"""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _WHITESPACE.sub(" ", text.casefold().translate(_PUNCTUATION)).strip()
+
+
+def parse_json_response(response: str) -> Any:
+    """Parse a JSON object from a response, tolerating markdown fences and surrounding prose"""
+    text = response or ""
+    fenced = _JSON_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def extract_json_path(document: Any, path: str) -> Any:
+    """Follow a path like `$.customer.name` or `items[0].id`; None if any step is missing"""
+    path = path.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    value = document
+    for key, index in _PATH_TOKEN.findall(path):
+        if index:
+            if not isinstance(value, list) or int(index) >= len(value):
+                return None
+            value = value[int(index)]
+        else:
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+    return value
+
+
+def fuzzy_similarity(responses: Sequence[str], references: Sequence[str]) -> np.ndarray:
+    """Similarity in [0, 1] of each response to its reference, after normalization"""
+    left = [normalize_text(r) for r in responses]
+    right = [normalize_text(r) for r in references]
+    if _rapidfuzz_cpdist is not None:
+        # Computed pairwise in native code across all rows at once
+        return np.asarray(_rapidfuzz_cpdist(left, right, scorer=_rapidfuzz_fuzz.ratio, workers=-1)) / 100.0
+    return np.array([SequenceMatcher(None, a, b).ratio() for a, b in zip(left, right)])
+
+
+def score_local(scorer_config: Dict[str, Any], responses: Sequence[str],
+                ground_truths: Sequence[Any]) -> List[Any]:
+    """Score a batch of responses with one local scorer
+
+    Returns booleans (numbers for fuzzy similarity without a threshold); a row is None when
+    the scorer needs a ground truth and the row has none. JSON-path scorers check only that
+    the field is present on rows without a ground truth.
+    """
+    scorer_type = scorer_config['type']
+    responses = ["" if r is None else str(r) for r in responses]
+    has_truth = np.array([gt is not None and gt != "" for gt in ground_truths], dtype=bool)
+
+    if scorer_type == "regex":
+        flags = 0 if scorer_config.get('case_sensitive') else re.IGNORECASE
+        pattern = re.compile(scorer_config['pattern'], flags)
+        return [pattern.search(r) is not None for r in responses]
+
+    if scorer_type == "json_path":
+        extracted = [extract_json_path(parse_json_response(r), scorer_config['path']) for r in responses]
+        present = [value is not None for value in extracted]
+        responses = ["" if value is None else
+                     (value if isinstance(value, str) else json.dumps(value)) for value in extracted]
+
+    references = [str(gt) if truth else "" for gt, truth in zip(ground_truths, has_truth)]
+    if scorer_type == "exact":
+        matches = np.array([r.strip() for r in responses], dtype=object) == \
+            np.array([r.strip() for r in references], dtype=object)
+    elif scorer_type in ("normalized", "json_path"):
+        matches = np.array([normalize_text(r) for r in responses], dtype=object) == \
+            np.array([normalize_text(r) for r in references], dtype=object)
+    elif scorer_type == "contains":
+        matches = np.array([normalize_text(ref) in normalize_text(r) for r, ref in zip(responses, references)])
+    else:
+        similarity = fuzzy_similarity(responses, references)
+        threshold = scorer_config.get('threshold')
+        if threshold is None:
+            return [float(s) if truth else None for s, truth in zip(similarity, has_truth)]
+        matches = similarity >= float(threshold)
+    if scorer_type == "json_path":
+        # Rows without a ground truth only check that the field is present
+        return [bool(m) if truth else p for m, truth, p in zip(matches, has_truth, present)]
+    return [bool(m) if truth else None for m, truth in zip(matches, has_truth)]
+
+
+def score_cells(scorers: List[Dict[str, Any]], cells: Sequence[Dict[str, Any]],
+                responses: Sequence[str]) -> List[Dict[str, Any]]:
+    """Scores of every local scorer for a batch of evaluated cells, one dict per cell"""
+    scores = [{} for _ in cells]
+    for scorer in scorers:
+        if not is_local(scorer):
+            continue
+        ground_truths = [scorer_ground_truth(scorer, cell['ground_truth'], cell.get('fields')) for cell in cells]
+        for cell_scores, score in zip(scores, score_local(scorer, responses, ground_truths)):
+            cell_scores[scorer['name']] = score
+    return scores
@@ -0,0 +1,168 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# Predictions held in memory before `log_prediction` callers block
+DEFAULT_MAX_QUEUE = 1000
+# Predictions sent to Weave per flush
+DEFAULT_BATCH_SIZE = 50
+# Longest a prediction waits for a batch to fill before it is flushed anyway
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+_STOP = object()
+
+
+class BufferedPrediction:
+    """Collects the scores of one prediction; `finish()` hands the whole prediction to the buffer"""
+
+    def __init__(self, buffer: "BufferedEvaluationLogger", inputs: Dict[str, Any], output: Any):
+        self._buffer = buffer
+        self.inputs = inputs
+        self.output = output
+        self.scores: List[tuple] = []
+
+    def log_score(self, scorer: str, score: Any):
+        self.scores.append((scorer, score))
+
+    def finish(self):
+        self._buffer._enqueue(self)
+
+
+class BufferedEvaluationLogger:
+    """Drop-in wrapper for `weave.EvaluationLogger` that logs off the caller's thread
+
+    Finished predictions are queued and written to Weave in batches by a background thread.
+    The queue is bounded, so a slow Weave backend makes `finish()` block instead of growing
+    memory. `log_summary()` flushes everything queued before it writes the summary.
+    """
+
+    def __init__(self, eval_logger, max_queue: int = DEFAULT_MAX_QUEUE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.eval_logger = eval_logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._enqueued = 0
+        self._flushed = 0
+        self._flushes = 0
+        self._max_depth = 0
+        self._blocked_seconds = 0.0
+        self._flush_latencies = deque(maxlen=1000)
+        self._thread = threading.Thread(target=self._run, name="weave-log-flush", daemon=True)
+        self._thread.start()
+
+    def log_prediction(self, inputs: Dict[str, Any], output: Any) -> BufferedPrediction:
+        return BufferedPrediction(self, inputs, output)
+
+    def _enqueue(self, prediction: BufferedPrediction):
+        if self._error is not None:
+            raise RuntimeError("Weave logging failed") from self._error
+        if self._closed:
+            raise RuntimeError("Cannot log to a closed evaluation logger")
+        start = time.monotonic()
+        # Blocks while the queue is full: backpressure on the evaluation instead of unbounded memory
+        self._queue.put(prediction)
+        waited = time.monotonic() - start
+        with self._lock:
+            self._enqueued += 1
+            self._blocked_seconds += waited
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while item is not _STOP and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            predictions = [p for p in batch if p is not _STOP]
+            if predictions:
+                self._write(predictions)
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is _STOP:
+                return
+
+    def _write(self, predictions: List[BufferedPrediction]):
+        if self._error is not None:
+            # Keep draining so producers never block on a logger that can no longer write
+            return
+        start = time.monotonic()
+        try:
+            for prediction in predictions:
+                pred_logger = self.eval_logger.log_prediction(inputs=prediction.inputs, output=prediction.output)
+                for scorer_name, score in prediction.scores:
+                    pred_logger.log_score(scorer=scorer_name, score=score)
+                pred_logger.finish()
+        except Exception as e:
+            self._error = e
+            return
+        with self._lock:
+            self._flushed += len(predictions)
+            self._flushes += 1
+            self._flush_latencies.append(time.monotonic() - start)
+
+    def flush(self):
+        """Block until every prediction queued so far has been written"""
+        self._queue.join()
+        if self._error is not None:
+            raise RuntimeError("Weave logging failed") from self._error
+
+    def close(self):
+        """Flush and stop the background thread; safe to call more than once"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("Weave logging failed") from self._error
+
+    def log_summary(self, summary: Optional[Dict[str, Any]] = None):
+        """Flush all queued predictions, then write the evaluation summary"""
+        self.close()
+        self.eval_logger.log_summary(summary)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and flush latency metrics"""
+        with self._lock:
+            latencies = sorted(self._flush_latencies)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_depth,
+                "enqueued": self._enqueued,
+                "flushed": self._flushed,
+                "flushes": self._flushes,
+                "blocked_seconds": self._blocked_seconds,
+                "flush_latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+                "flush_latency_p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+                "flush_latency_max": latencies[-1] if latencies else 0.0
+            }
+
+    def __getattr__(self, name):
+        # Anything not buffered (ui_url, finish, fail, ...) goes straight to the wrapped logger
+        return getattr(self.eval_logger, name)
+
+
+def log_result(eval_logger, prompt_text, result):
+    """Log one evaluated example and its scores to a Weave evaluation"""
+    samples = result.get('samples')
+    pred_logger = eval_logger.log_prediction(
+        inputs={"prompt": prompt_text, "input": result['input']},
+        output=[sample['response'] for sample in samples] if samples else result['response']
+    )
+    for scorer_name, score in result['scores'].items():
+        pred_logger.log_score(scorer=scorer_name, score=score)
+    pred_logger.finish()
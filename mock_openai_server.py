@@ -0,0 +1,496 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Placeholder values for each JSON schema type in structured-output replies
+FAKE_SCHEMA_VALUES = {"number": 7, "integer": 7, "boolean": True, "string": "ok"}
+
+_SCALE = re.compile(r"scale (\d+)\s*-\s*(\d+)")
+_VARIANT = re.compile(r" \(variant \d+\)")
+_FILLER = " lorem ipsum dolor sit amet"
+# Prompt caching as the API applies it: prompts of at least 1024 tokens, matched in 128-token steps
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+
+
+def fake_completion_content(body: Dict[str, Any], completion_tokens: Optional[int] = None, variant: int = 0) -> str:
+    """Deterministic stand-in reply that satisfies the app's generation and judge prompts
+
+    Free-form replies depend on the system prompt as well as the input, so different prompts
+    get different responses (and separate judge cache entries). They are padded to about
+    `completion_tokens` tokens if given; judge verdicts stay short. Replies other than variant 0
+    are marked as such, and judges score marked responses lower, so sampled runs show spread.
+    """
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        properties = response_format["json_schema"]["schema"].get("properties", {})
+        return json.dumps({name: FAKE_SCHEMA_VALUES.get(spec.get("type"), "ok") for name, spec in properties.items()})
+    prompt = str(body["messages"][-1].get("content", ""))
+    # Judge instructions may sit in the system message, ahead of the example being judged
+    instructions = "\n".join(str(m.get("content", "")) for m in body["messages"])
+    judged_variant = _VARIANT.search(prompt) is not None
+    if "Provide only a number" in instructions:
+        scale = _SCALE.search(instructions)
+        if judged_variant:
+            return str(int(scale.group(1))) if scale else "3"
+        return str(int(scale.group(2))) if scale else "7"
+    if "Answer only 'true' or 'false'" in instructions:
+        return "false" if judged_variant else "true"
+    content = f"Mock response to: {prompt[:200]}"
+    system = [m for m in body["messages"][:-1] if m.get("role") == "system"]
+    if system:
+        content = f"[{zlib.crc32(str(system[0].get('content', '')).encode('utf-8')):08x}] {content}"
+    if variant:
+        content += f" (variant {variant})"
+    if completion_tokens:
+        # About 4 characters per token, matching the usage reported below
+        target = completion_tokens * 4
+        content += _FILLER * max(0, (target - len(content)) // len(_FILLER))
+    return content
+
+
+def fake_chat_completion(body: Dict[str, Any], completion_tokens: Optional[int] = None,
+                         cached_tokens: int = 0) -> Dict[str, Any]:
+    """A complete chat.completion object for a request body, reporting `cached_tokens` prompt cache hits
+
+    With `n`, about half of the choices are distinct: choice i is variant i % ((n + 1) // 2), so
+    samples both differ and repeat.
+    """
+    n = int(body.get("n") or 1)
+    contents = [fake_completion_content(body, completion_tokens, idx % ((n + 1) // 2)) for idx in range(n)]
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4 + 1
+    completion_tokens = sum(len(content) // 4 + 1 for content in contents)
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {"index": idx, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+            for idx, content in enumerate(contents)
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+    }
+
+
+class MockBehavior:
+    """Latency, reply length and failures injected into chat completions, for benchmarks
+
+    Latency is log-normal around `latency` seconds (`latency_sigma` = 0 makes it fixed), plus
+    `per_token_latency` seconds per completion token. A share of requests fails with a 429
+    carrying a `retry-after` of `retry_after` seconds (`rate_limit_rate`) or with a 500
+    (`error_rate`), and a share of streamed replies is cut off halfway (`disconnect_rate`).
+    Draws come from a seeded generator, so runs are repeatable.
+
+    With `requests_per_minute` or `tokens_per_minute`, replies carry `x-ratelimit-*` headers as
+    the API's do, and requests over budget get a 429. Budgets refill evenly over a minute.
+    """
+
+    def __init__(self, latency: float = 0.0, latency_sigma: float = 0.0, per_token_latency: float = 0.0,
+                 completion_tokens: Optional[int] = None, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 0.05, disconnect_rate: float = 0.0, seed: Optional[int] = 0,
+                 requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.per_token_latency = per_token_latency
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.disconnect_rate = disconnect_rate
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self._budgets = {kind: float(limit or 0) for kind, limit in self.limits.items()}
+        self._budgets_updated = time.monotonic()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "rate_limited": 0, "errors": 0, "disconnects": 0}
+
+    def _refill_budgets(self):
+        now = time.monotonic()
+        for kind, limit in self.limits.items():
+            if limit:
+                self._budgets[kind] = min(limit, self._budgets[kind] + (now - self._budgets_updated) * limit / 60)
+        self._budgets_updated = now
+
+    def _rate_limit_headers(self) -> Dict[str, str]:
+        headers = {}
+        for kind, limit in self.limits.items():
+            if limit:
+                headers[f"x-ratelimit-limit-{kind}"] = str(limit)
+                headers[f"x-ratelimit-remaining-{kind}"] = str(max(int(self._budgets[kind]), 0))
+                headers[f"x-ratelimit-reset-{kind}"] = f"{(limit - self._budgets[kind]) * 60 / limit:.3f}s"
+        return headers
+
+    def rate_limit_headers(self, tokens: int) -> Dict[str, str]:
+        """Charge a reply's tokens to the budget and return its x-ratelimit-* headers"""
+        with self._lock:
+            self._refill_budgets()
+            if self.limits["tokens"]:
+                self._budgets["tokens"] -= tokens
+            return self._rate_limit_headers()
+
+    def delay(self, completion_tokens: int) -> float:
+        """Seconds to hold a reply of `completion_tokens` tokens before sending it
+
+        For streamed replies, `delay(0)` is the time to the first token.
+        """
+        with self._lock:
+            base = self.latency * self._rng.lognormvariate(0.0, self.latency_sigma) if self.latency else 0.0
+        return base + self.per_token_latency * completion_tokens
+
+    def failure(self) -> Optional[Tuple[int, Dict[str, Any], Dict[str, str]]]:
+        """(status, error payload, headers) if this request should fail, else None"""
+        with self._lock:
+            self.counts["requests"] += 1
+            self._refill_budgets()
+            waits = [(1 - self._budgets[kind]) * 60 / limit
+                     for kind, limit in self.limits.items() if limit and self._budgets[kind] < 1]
+            if waits:
+                self.counts["rate_limited"] += 1
+                return 429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                       "code": "rate_limit_exceeded"}}, {
+                    "retry-after": f"{max(waits):.3f}", **self._rate_limit_headers()
+                }
+            if self.limits["requests"]:
+                self._budgets["requests"] -= 1
+            draw = self._rng.random()
+            if draw < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return 429, {"error": {"message": "Rate limit reached (injected)", "type": "requests",
+                                       "code": "rate_limit_exceeded"}}, {"retry-after": str(self.retry_after)}
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return 500, {"error": {"message": "Internal server error (injected)", "type": "server_error"}}, {}
+        return None
+
+    def disconnect(self) -> bool:
+        """Whether this streamed reply should drop its connection partway through"""
+        with self._lock:
+            if self._rng.random() < self.disconnect_rate:
+                self.counts["disconnects"] += 1
+                return True
+        return False
+
+
+class MockOpenAIState:
+    """Files and batches held in memory by the mock server"""
+
+    def __init__(self, batch_delay: float = 0.0, behavior: Optional[MockBehavior] = None):
+        self.batch_delay = batch_delay
+        self.behavior = behavior or MockBehavior()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.file_contents: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.prompt_prefixes = set()
+        self.lock = threading.Lock()
+
+    def cached_prompt_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Prompt tokens served from the simulated prompt cache: all messages but the last, once seen before"""
+        tokens = sum(len(str(m.get("content", ""))) for m in messages[:-1]) // 4
+        if tokens < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        prefix = zlib.crc32(json.dumps(messages[:-1], sort_keys=True).encode("utf-8"))
+        with self.lock:
+            if prefix in self.prompt_prefixes:
+                return tokens // PROMPT_CACHE_INCREMENT * PROMPT_CACHE_INCREMENT
+            self.prompt_prefixes.add(prefix)
+        return 0
+
+    def add_file(self, filename: str, purpose: str, content: bytes) -> Dict[str, Any]:
+        file_id = f"file-mock-{uuid.uuid4().hex[:12]}"
+        meta = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed"
+        }
+        with self.lock:
+            self.files[file_id] = meta
+            self.file_contents[file_id] = content
+        return meta
+
+    def create_batch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        batch_id = f"batch_mock_{uuid.uuid4().hex[:12]}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window", "24h"),
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "metadata": request.get("metadata"),
+            "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self._process_batch, args=(batch_id,), daemon=True).start()
+        return batch
+
+    def _process_batch(self, batch_id: str):
+        """Run every request in the batch's input file and write an output file"""
+        with self.lock:
+            batch = self.batches[batch_id]
+            batch["status"] = "in_progress"
+            lines = self.file_contents[batch["input_file_id"]].decode("utf-8").splitlines()
+        time.sleep(self.batch_delay)
+        outputs = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            outputs.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                             "body": fake_chat_completion(
+                                 request["body"], self.behavior.completion_tokens,
+                                 self.cached_prompt_tokens(request["body"].get("messages", []))
+                             )},
+                "error": None
+            }))
+        output = self.add_file("batch_output.jsonl", "batch_output", ("\n".join(outputs) + "\n").encode("utf-8"))
+        with self.lock:
+            if batch["status"] == "cancelling":
+                batch["status"] = "cancelled"
+                return
+            batch["output_file_id"] = output["id"]
+            batch["request_counts"] = {"total": len(outputs), "completed": len(outputs), "failed": 0}
+            batch["completed_at"] = int(time.time())
+            batch["status"] = "completed"
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Routes the subset of the OpenAI REST API the playground uses"""
+
+    state: MockOpenAIState
+    # Keep-alive connections, as with the real API; every reply sets content-length
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, delayed ACKs add ~40 ms per reply
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _path(self) -> str:
+        path = self.path.split("?", 1)[0]
+        return path[len("/v1"):] if path.startswith("/v1/") else path
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("content-length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, completion: Dict[str, Any], include_usage: bool,
+                     headers: Optional[Dict[str, str]] = None):
+        """Send a completion as server-sent events, paced like a streaming model"""
+        behavior = self.state.behavior
+        first_token_delay = behavior.delay(0)
+        disconnect = behavior.disconnect()
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("transfer-encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def send_event(data: str):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+
+        def chunk(index: int, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return json.dumps({
+                "id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+                "model": completion["model"],
+                "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}]
+            })
+
+        if first_token_delay > 0:
+            time.sleep(first_token_delay)
+        # Choices are generated side by side, so their chunks are interleaved
+        choices = [re.findall(r"\S+\s*|\s+", choice["message"]["content"]) for choice in completion["choices"]]
+        for index in range(len(choices)):
+            send_event(chunk(index, {"role": "assistant", "content": ""}))
+        steps = max(len(pieces) for pieces in choices)
+        for step in range(steps):
+            if disconnect and step == steps // 2:
+                # Close the socket without ending the chunked body, like a dropped connection
+                self.close_connection = True
+                return
+            step_pieces = [(index, pieces[step]) for index, pieces in enumerate(choices) if step < len(pieces)]
+            if behavior.per_token_latency:
+                time.sleep(behavior.per_token_latency * max(len(piece) // 4 + 1 for _, piece in step_pieces))
+            for index, piece in step_pieces:
+                send_event(chunk(index, {"content": piece}))
+        for index in range(len(choices)):
+            send_event(chunk(index, {}, "stop"))
+        if include_usage:
+            send_event(json.dumps({
+                "id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+                "model": completion["model"], "choices": [], "usage": completion["usage"]
+            }))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _not_found(self):
+        self._send_json({"error": {"message": f"No route for {self.command} {self.path}", "type": "invalid_request_error"}}, 404)
+
+    def do_POST(self):
+        path = self._path()
+        # Read the body up front, so a kept-alive connection never holds unread bytes
+        raw_body = self._body()
+        if path == "/chat/completions":
+            body = json.loads(raw_body)
+            behavior = self.state.behavior
+            failure = behavior.failure()
+            if failure:
+                status, payload, headers = failure
+                return self._send_json(payload, status, headers)
+            completion = fake_chat_completion(body, behavior.completion_tokens,
+                                              self.state.cached_prompt_tokens(body.get("messages", [])))
+            headers = behavior.rate_limit_headers(completion["usage"]["total_tokens"])
+            if body.get("stream"):
+                include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+                return self._send_stream(completion, include_usage, headers)
+            # Choices are generated side by side: the longest one sets the pace
+            delay = behavior.delay(max(len(choice["message"]["content"]) // 4 + 1 for choice in completion["choices"]))
+            if delay > 0:
+                time.sleep(delay)
+            self._send_json(completion, headers=headers)
+        elif path == "/files":
+            self._upload_file(raw_body)
+        elif path == "/batches":
+            self._send_json(self.state.create_batch(json.loads(raw_body)))
+        elif re.fullmatch(r"/batches/[^/]+/cancel", path):
+            batch = self.state.batches.get(path.split("/")[2])
+            if batch is None:
+                return self._not_found()
+            with self.state.lock:
+                if batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+                    batch["status"] = "cancelling"
+            self._send_json(batch)
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        path = self._path()
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "batches" and parts[1] in self.state.batches:
+            self._send_json(self.state.batches[parts[1]])
+        elif len(parts) == 2 and parts[0] == "files" and parts[1] in self.state.files:
+            self._send_json(self.state.files[parts[1]])
+        elif len(parts) == 3 and parts[0] == "files" and parts[2] == "content" and parts[1] in self.state.file_contents:
+            data = self.state.file_contents[parts[1]]
+            self.send_response(200)
+            self.send_header("content-type", "application/octet-stream")
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._not_found()
+
+    def _upload_file(self, raw_body: bytes):
+        # Parse the multipart/form-data body with the stdlib email parser
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"content-type: " + self.headers["content-type"].encode("latin-1") + b"\r\n\r\n" + raw_body
+        )
+        fields, filename, content = {}, "upload.jsonl", b""
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                filename = part.get_filename()
+                content = part.get_payload(decode=True) or b""
+            else:
+                fields[name] = part.get_content().strip()
+        self._send_json(self.state.add_file(filename, fields.get("purpose", "batch"), content))
+
+
+class MockOpenAIServer:
+    """Local OpenAI-compatible server running on a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, batch_delay: float = 0.0,
+                 behavior: Optional[MockBehavior] = None):
+        self.state = MockOpenAIState(batch_delay, behavior)
+        handler = type("BoundMockOpenAIHandler", (MockOpenAIHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock server (chat completions, files, batches)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="Seconds each batch stays in progress")
+    parser.add_argument("--latency", type=float, default=0.0, help="Median seconds per chat completion")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Log-normal spread of the latency")
+    parser.add_argument("--per-token-latency", type=float, default=0.0, help="Extra seconds per completion token")
+    parser.add_argument("--completion-tokens", type=int, help="Approximate length of generated replies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failing with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="retry-after seconds sent with 429s")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="Share of streamed replies whose connection drops halfway")
+    parser.add_argument("--requests-per-minute", type=int,
+                        help="Request budget reported in x-ratelimit-* headers; requests over it get a 429")
+    parser.add_argument("--tokens-per-minute", type=int,
+                        help="Token budget reported in x-ratelimit-* headers; requests over it get a 429")
+    args = parser.parse_args()
+
+    behavior = MockBehavior(args.latency, args.latency_sigma, args.per_token_latency, args.completion_tokens,
+                            args.error_rate, args.rate_limit_rate, args.retry_after, args.disconnect_rate,
+                            requests_per_minute=args.requests_per_minute, tokens_per_minute=args.tokens_per_minute)
+    server = MockOpenAIServer(args.host, args.port, args.batch_delay, behavior)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    print(f"Point the app at it with OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
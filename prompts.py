@@ -0,0 +1,176 @@
+import json
+from functools import lru_cache
+
+# Sampling parameters for generation and judge calls; they are part of every cache key
+GENERATION_PARAMS = {"temperature": 0.7}
+JUDGE_PARAMS = {"temperature": 0}
+DEFAULT_JUDGE_MODEL = "gpt-4o-mini"
+JUDGE_SYSTEM_PROMPT = "You are an expert evaluator. Provide only the requested output format."
+# Part of every judge cache key; bump it when the judge prompt layout changes, so verdicts
+# given to an older layout are not reused
+JUDGE_TEMPLATE_VERSION = 2
+
+def generation_params(samples=1):
+    """Sampling parameters for `samples` completions in one request; a single sample keeps the
+    plain parameters, so its cache keys are unchanged"""
+    return GENERATION_PARAMS if samples <= 1 else {**GENERATION_PARAMS, "n": samples}
+
+def build_generation_messages(prompt, example_input):
+    """Build the chat messages for running a prompt on one example"""
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": str(example_input)}
+    ]
+
+def format_judged_example(input_text, response, ground_truth=None):
+    """The per-example part of a judge prompt: input, response and expected answer"""
+    example = f"""**USER INPUT/QUESTION:**
+{input_text}
+
+**MODEL RESPONSE:**
+{response}
+"""
+    
+    if ground_truth:
+        example += f"""
+**EXPECTED/CORRECT ANSWER:**
+{ground_truth}
+"""
+    return example
+
+def format_few_shot_examples(examples):
+    """Worked examples for a judge prompt, each an input/response (and optional ground truth) with its verdict"""
+    text = ""
+    for idx, example in enumerate(examples):
+        text += f"\n**EXAMPLE {idx+1}:**\n"
+        text += format_judged_example(example.get('input', ''), example.get('response', ''), example.get('ground_truth'))
+        verdict = example.get('score')
+        text += f"\n**VERDICT:** {verdict if isinstance(verdict, str) else json.dumps(verdict)}\n"
+    return text
+
+def output_instructions(scorer_config):
+    """The reply format a single scorer asks its judge for; None for free-text scorers"""
+    if scorer_config['output_type'] == 'numeric':
+        return f"Provide only a number on the scale {scorer_config.get('scale', '1-10')}. Do not include any other text."
+    elif scorer_config['output_type'] == 'boolean':
+        return "Answer only 'true' or 'false'. Do not include any other text."
+    return None
+
+@lru_cache(maxsize=1024)
+def _compile_judge_prefix(prompt, output_type, scale, examples_json):
+    scorer_config = {"prompt": prompt, "output_type": output_type, "scale": scale}
+    prefix = f"""{JUDGE_SYSTEM_PROMPT}
+
+Evaluate the response in the user's message based on the criteria provided.
+
+**EVALUATION CRITERIA:**
+{prompt}
+"""
+    prefix += format_few_shot_examples(json.loads(examples_json))
+    instructions = output_instructions(scorer_config)
+    if instructions:
+        prefix += f"\n**INSTRUCTIONS:** {instructions}"
+    return prefix
+
+def judge_prefix(scorer_config):
+    """The static part of a scorer's judge prompt, compiled once per scorer
+
+    Everything that is the same for every call (role, criteria, few-shot examples, output
+    instructions) goes in the system message, byte for byte identical across calls, so the
+    provider can serve it from its prompt cache; the per-example content follows it.
+    """
+    scale = scorer_config.get('scale', '1-10') if scorer_config['output_type'] == 'numeric' else None
+    examples_json = json.dumps(scorer_config.get('examples') or [], sort_keys=True, ensure_ascii=False)
+    return _compile_judge_prefix(scorer_config['prompt'], scorer_config['output_type'], scale, examples_json)
+
+def build_scoring_messages(scorer_config, input_text, response, ground_truth=None):
+    """Build the judge prompt for one scorer: its static prefix, then the example being judged"""
+    return [
+        {"role": "system", "content": judge_prefix(scorer_config)},
+        {"role": "user", "content": format_judged_example(input_text, response, ground_truth)}
+    ]
+
+def parse_score(scorer_config, raw_text):
+    """Parse a judge's raw reply into a score for the scorer's output type"""
+    score_text = (raw_text or "").strip().lower()
+    
+    if scorer_config['output_type'] == 'numeric':
+        try:
+            score = float(score_text.split()[0])
+            return score
+        except:
+            return None
+    elif scorer_config['output_type'] == 'boolean':
+        if 'true' in score_text:
+            return not scorer_config.get('invert', False)
+        elif 'false' in score_text:
+            return scorer_config.get('invert', False)
+        else:
+            return None
+    else:
+        return score_text
+
+JSON_SCHEMA_TYPES = {"numeric": "number", "boolean": "boolean", "text": "string"}
+
+def group_judge_prefix(scorers):
+    """The static part of a combined judge prompt: every criterion and the JSON instructions
+
+    Like `judge_prefix`, it is identical for every call with the same scorers.
+    """
+    prefix = f"""{JUDGE_SYSTEM_PROMPT}
+
+Evaluate the response in the user's message against each of the criteria listed below.
+"""
+    
+    for idx, scorer in enumerate(scorers):
+        prefix += f"""
+**CRITERION `criterion_{idx+1}` ({scorer['name']}):**
+{scorer['prompt']}
+"""
+        if scorer['output_type'] == 'numeric':
+            prefix += f"Answer with a number on the scale {scorer.get('scale', '1-10')}.\n"
+        elif scorer['output_type'] == 'boolean':
+            prefix += "Answer with true or false.\n"
+        if scorer.get('examples'):
+            prefix += format_few_shot_examples(scorer['examples'])
+    
+    prefix += "\n**INSTRUCTIONS:** Return a JSON object with one field per criterion, keyed by the criterion id."
+    return prefix
+
+def build_group_scoring_messages(scorers, input_text, response, ground_truth=None):
+    """Build one judge prompt that asks for every scorer's verdict as a JSON field"""
+    return [
+        {"role": "system", "content": group_judge_prefix(scorers)},
+        {"role": "user", "content": format_judged_example(input_text, response, ground_truth)}
+    ]
+
+def build_group_response_format(scorers):
+    """JSON schema response format with one typed field per scorer"""
+    properties = {
+        f"criterion_{idx+1}": {"type": JSON_SCHEMA_TYPES[scorer['output_type']]}
+        for idx, scorer in enumerate(scorers)
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "scores",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False
+            }
+        }
+    }
+
+def field_to_raw_text(scorer_config, value):
+    """Validate one structured field and turn it into the raw text parse_score expects"""
+    output_type = scorer_config['output_type']
+    if output_type == 'numeric' and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if output_type == 'boolean' and isinstance(value, bool):
+        return "true" if value else "false"
+    if output_type == 'text' and isinstance(value, str):
+        return value
+    return None
@@ -0,0 +1,358 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from sampling import pass_rate_name
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Characters of input/response shown per cell in the results table
+TABLE_TEXT_CHARS = 50
+# Missing boolean score
+BOOL_MISSING = -1
+# Missing string (e.g. no ground truth)
+NO_STRING = -1
+
+
+class StringPool:
+    """Interns strings to int32 codes, so repeated inputs and text scores are stored once"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def code(self, value: Optional[Any]) -> int:
+        if value is None:
+            return NO_STRING
+        value = value if isinstance(value, str) else str(value)
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class GrowableArray:
+    """Append-only NumPy array with amortized O(1) appends"""
+
+    def __init__(self, dtype, fill=0, capacity: int = 1024):
+        self._data = np.full(capacity, fill, dtype=dtype)
+        self._fill = fill
+        self._size = 0
+
+    def append(self, value):
+        if self._size == len(self._data):
+            grown = np.full(len(self._data) * 2, self._fill, dtype=self._data.dtype)
+            grown[:self._size] = self._data
+            self._data = grown
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        needed = self._size + len(values)
+        if needed > len(self._data):
+            grown = np.full(max(needed, len(self._data) * 2), self._fill, dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        self._data[self._size:needed] = values
+        self._size = needed
+
+    def pad_to(self, size: int):
+        """Append missing values until the array has `size` entries"""
+        if self._size < size:
+            self.extend(np.full(size - self._size, self._fill, dtype=self._data.dtype))
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def reorder(self, order: np.ndarray):
+        self._data[:self._size] = self._data[:self._size][order]
+
+
+class ScoreColumn:
+    """Typed scores of one scorer: float64 (NaN = missing), int8 booleans, or interned text codes"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        if kind == "numeric":
+            self.data = GrowableArray(np.float64, np.nan)
+        elif kind == "boolean":
+            self.data = GrowableArray(np.int8, BOOL_MISSING)
+        else:
+            self.data = GrowableArray(np.int32, NO_STRING)
+
+    @staticmethod
+    def kind_of(score: Any) -> str:
+        if isinstance(score, bool):
+            return "boolean"
+        if isinstance(score, (int, float)):
+            return "numeric"
+        return "text"
+
+    def encode(self, score: Any, strings: StringPool):
+        """Column value for one score; missing or mistyped scores become the column's missing value"""
+        if score is None:
+            return self.data._fill
+        if self.kind == "numeric":
+            try:
+                return float(score)
+            except (TypeError, ValueError):
+                return np.nan
+        if self.kind == "boolean":
+            return int(score) if isinstance(score, bool) else BOOL_MISSING
+        return strings.code(score)
+
+    def valid(self) -> np.ndarray:
+        """Mask of rows that have a score"""
+        values = self.data.values
+        if self.kind == "numeric":
+            return ~np.isnan(values)
+        return values != (BOOL_MISSING if self.kind == "boolean" else NO_STRING)
+
+
+class ResultsStore:
+    """Columnar evaluation results: one NumPy column per field and per scorer
+
+    Inputs, responses, ground truths and text scores are interned into a shared string pool,
+    so each distinct string is held once. Aggregates, the results table and histograms are
+    computed with vectorized operations and memoized until the store changes. Results of
+    prompts that take several samples per example also fill a variance column per scorer.
+    """
+
+    def __init__(self):
+        self.strings = StringPool()
+        self.prompt_idx = GrowableArray(np.int16)
+        self.example_idx = GrowableArray(np.int64)
+        self.input = GrowableArray(np.int32, NO_STRING)
+        self.response = GrowableArray(np.int32, NO_STRING)
+        self.ground_truth = GrowableArray(np.int32, NO_STRING)
+        self.scores: Dict[str, ScoreColumn] = {}
+        # Variance between an example's samples, per scorer; NaN for single-sample results
+        self.variances: Dict[str, GrowableArray] = {}
+        self._size = 0
+        self._version = 0
+        self._memo: Dict[Tuple, Any] = {}
+
+    @classmethod
+    def from_results(cls, results) -> "ResultsStore":
+        store = cls()
+        store.extend(results)
+        return store
+
+    def append(self, result: Dict[str, Any]):
+        """Add one result dict as produced by `EvaluationEngine.run`"""
+        self.extend([result])
+
+    def extend(self, results):
+        """Add result dicts, converting each column to NumPy once for the whole batch"""
+        results = list(results)
+        if not results:
+            return
+        code = self.strings.code
+        self.prompt_idx.extend([r['prompt_idx'] for r in results])
+        self.example_idx.extend([r['example_idx'] for r in results])
+        self.input.extend([code(r['input']) for r in results])
+        self.response.extend([code(r['response']) for r in results])
+        self.ground_truth.extend([code(r.get('ground_truth')) for r in results])
+
+        names = {}
+        for result in results:
+            for name, score in result['scores'].items():
+                # A column's type is decided by its first real score
+                if score is not None and name not in self.scores and name not in names:
+                    names[name] = ScoreColumn.kind_of(score)
+        for name, kind in names.items():
+            column = ScoreColumn(kind)
+            column.data.pad_to(self._size)
+            self.scores[name] = column
+        for name, column in self.scores.items():
+            column.data.extend([column.encode(r['scores'].get(name), self.strings) for r in results])
+
+        for name in {name for r in results for name in r.get('score_stats') or {}} - set(self.variances):
+            variances = GrowableArray(np.float64, np.nan)
+            variances.pad_to(self._size)
+            self.variances[name] = variances
+        for name, variances in self.variances.items():
+            variances.extend([(r.get('score_stats') or {}).get(name, {}).get('variance', np.nan) for r in results])
+
+        self._size += len(results)
+        self._version += 1
+
+    def sort(self):
+        """Order rows by (prompt_idx, example_idx) in place"""
+        order = np.lexsort((self.example_idx.values, self.prompt_idx.values))
+        for array in (self.prompt_idx, self.example_idx, self.input, self.response, self.ground_truth):
+            array.reorder(order)
+        for column in self.scores.values():
+            column.data.reorder(order)
+        for variances in self.variances.values():
+            variances.reorder(order)
+        self._version += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(self._size):
+            yield self.result(row)
+
+    def result(self, row: int) -> Dict[str, Any]:
+        """Rebuild the result dict of one row"""
+        def text(code):
+            return self.strings.values[code] if code != NO_STRING else None
+
+        scores = {}
+        for name, column in self.scores.items():
+            value = column.data.values[row]
+            if column.kind == "numeric":
+                scores[name] = None if np.isnan(value) else float(value)
+            elif column.kind == "boolean":
+                scores[name] = None if value == BOOL_MISSING else bool(value)
+            else:
+                scores[name] = text(value)
+        return {
+            "prompt_idx": int(self.prompt_idx.values[row]),
+            "example_idx": int(self.example_idx.values[row]),
+            "input": text(self.input.values[row]) or "",
+            "response": text(self.response.values[row]) or "",
+            "scores": scores,
+            "ground_truth": text(self.ground_truth.values[row])
+        }
+
+    def memoized(self, key: Tuple, compute):
+        """Value of `compute()`, recomputed only after the store changes"""
+        cached = self._memo.get(key)
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        value = compute()
+        self._memo[key] = (self._version, value)
+        return value
+
+    @property
+    def scorer_names(self) -> List[str]:
+        return list(self.scores)
+
+    def score_values(self, name: str) -> np.ndarray:
+        """Numeric or boolean (0/1) scores of one scorer as float64, NaN where missing
+
+        Sampled examples of a boolean scorer count with their pass rate, as `example_score` does.
+        """
+        column = self.scores[name]
+        if column.kind == "numeric":
+            return column.data.values
+        if column.kind == "boolean":
+            values = column.data.values.astype(np.float64)
+            values[column.data.values == BOOL_MISSING] = np.nan
+            pass_rate = self.scores.get(pass_rate_name(name))
+            if pass_rate is not None and pass_rate.kind == "numeric":
+                sampled = ~np.isnan(pass_rate.data.values)
+                values[sampled] = pass_rate.data.values[sampled]
+            return values
+        raise ValueError(f"Scorer {name} has text scores")
+
+    def score_matrix(self, name: str) -> np.ndarray:
+        """Scores of one scorer as an (example, prompt) matrix, NaN where missing, for paired comparisons"""
+        def compute():
+            _, example_rows = np.unique(self.example_idx.values, return_inverse=True)
+            n_prompts = int(self.prompt_idx.values.max(initial=-1)) + 1
+            matrix = np.full((int(example_rows.max(initial=-1)) + 1, n_prompts), np.nan)
+            matrix[example_rows, self.prompt_idx.values] = self.score_values(name)
+            return matrix
+        return self.memoized(("score_matrix", name), compute)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-scorer aggregates: mean for numeric scores, share of true for boolean ones (counting
+        each sampled example by its pass rate)"""
+        def compute():
+            rows = []
+            for name, column in self.scores.items():
+                valid = column.valid()
+                count = int(valid.sum())
+                value = None
+                if count and column.kind in ("numeric", "boolean"):
+                    value = float(self.score_values(name)[valid].mean())
+                rows.append({"scorer": name, "kind": column.kind, "count": count, "value": value})
+            return rows
+        return self.memoized(("summary",), compute)
+
+    def sample_variability(self) -> List[Dict[str, Any]]:
+        """Per-scorer spread between the samples of sampled examples: mean variance and standard
+        deviation, and the share of examples whose samples did not all score the same"""
+        def compute():
+            rows = []
+            for name, variances in self.variances.items():
+                values = variances.values[~np.isnan(variances.values)]
+                if not len(values):
+                    continue
+                rows.append({
+                    "scorer": name,
+                    "examples": len(values),
+                    "mean_variance": float(values.mean()),
+                    "mean_std": float(np.sqrt(values).mean()),
+                    "unstable_share": float((values > 0).mean())
+                })
+            return rows
+        return self.memoized(("sample_variability",), compute)
+
+    def _text_column(self, codes: np.ndarray, max_chars: Optional[int] = None) -> "pd.Categorical":
+        """Strings for a code column, built once per distinct string rather than per row"""
+        import pandas as pd
+
+        used, row_codes = np.unique(codes, return_inverse=True)
+        texts = [
+            self.strings.values[code] if max_chars is None else self.strings.values[code][:max_chars] + "..."
+            for code in used[used != NO_STRING]
+        ]
+        # Truncation can make distinct strings equal, and categories must be unique
+        text_codes, categories = pd.factorize(np.asarray(texts, dtype=object))
+        if len(used) and used[0] == NO_STRING:
+            text_codes = np.concatenate(([-1], text_codes))
+        return pd.Categorical.from_codes(text_codes[row_codes] if len(used) else row_codes, categories=categories)
+
+    def table(self, max_chars: int = TABLE_TEXT_CHARS) -> "pd.DataFrame":
+        """Display table with truncated text, one column per scorer"""
+        # Imported on first use: the engine and the CLI never build tables, and pandas is slow to import
+        import pandas as pd
+
+        def compute():
+            data = {
+                "Prompt": pd.Categorical.from_codes(
+                    self.prompt_idx.values.astype(np.int32),
+                    categories=[f"Prompt {idx+1}" for idx in range(int(self.prompt_idx.values.max(initial=-1)) + 1)]
+                ),
+                "Example": self.example_idx.values + 1,
+                "Input": self._text_column(self.input.values, max_chars),
+                "Response": self._text_column(self.response.values, max_chars),
+            }
+            for name, column in self.scores.items():
+                values = column.data.values
+                if column.kind == "numeric":
+                    data[name] = values
+                elif column.kind == "boolean":
+                    data[name] = pd.array(np.where(values == BOOL_MISSING, pd.NA, values == 1), dtype="boolean")
+                else:
+                    data[name] = self._text_column(values)
+            for name, variances in self.variances.items():
+                data[f"{name} variance"] = variances.values
+            return pd.DataFrame(data)
+        return self.memoized(("table", max_chars), compute)
+
+    def histograms(self, nbins: int = 20) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """(counts, bin edges) of every numeric scorer"""
+        def compute():
+            histograms = {}
+            for name, column in self.scores.items():
+                if column.kind != "numeric":
+                    continue
+                values = column.data.values[column.valid()]
+                if len(values):
+                    histograms[name] = np.histogram(values, bins=nbins)
+            return histograms
+        return self.memoized(("histograms", nbins), compute)
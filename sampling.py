@@ -0,0 +1,103 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Upper bound on samples per example; the API accepts up to 128 choices, but cost grows with each one
+MAX_SAMPLES = 10
+
+
+def prompt_samples(prompt_config: Dict[str, Any]) -> int:
+    """Completions requested per example for a prompt; prompts saved before sampling existed take one"""
+    return max(int(prompt_config.get('samples') or 1), 1)
+
+
+def distinct_responses(responses: Sequence[str]) -> Tuple[List[str], List[int]]:
+    """Distinct responses in first-seen order, and the position of each response among them
+
+    Identical completions are judged once; their verdicts are shared through the positions.
+    """
+    unique = list(dict.fromkeys(responses))
+    position = {response: idx for idx, response in enumerate(unique)}
+    return unique, [position[response] for response in responses]
+
+
+def pass_at_k_name(scorer_name: str, samples: int) -> str:
+    """Name of the score that is true when any of an example's samples passes a boolean scorer"""
+    return f"{scorer_name} pass@{samples}"
+
+
+def pass_rate_name(scorer_name: str) -> str:
+    """Name of the score holding the share of an example's samples that pass a boolean scorer"""
+    return f"{scorer_name} pass rate"
+
+
+def example_score(scores: Dict[str, Any], scorer_name: str) -> Any:
+    """The score an example counts for in summaries, comparisons and early stopping
+
+    For a sampled example that is a boolean scorer's pass rate, so every sample counts, not just
+    the first; otherwise it is the scorer's own score.
+    """
+    pass_rate = scores.get(pass_rate_name(scorer_name))
+    return pass_rate if pass_rate is not None else scores.get(scorer_name)
+
+
+def aggregate_samples(scorers: List[Dict[str, Any]],
+                      sample_scores: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """An example's scores over its samples, and the per-scorer spread between samples
+
+    Numeric scores are averaged. Boolean and text scores keep the first sample's verdict, so a
+    scorer's column has one type whatever each prompt's sample count; boolean scorers also get a
+    `<scorer> pass rate` score (the share of samples that pass) and a `<scorer> pass@k` score
+    that is true if any sample passes. The stats hold the mean, sample variance and count of
+    each numeric or boolean scorer.
+    """
+    scores: Dict[str, Any] = {}
+    stats: Dict[str, Dict[str, Any]] = {}
+    for scorer in scorers:
+        name = scorer['name']
+        values = [sample[name] for sample in sample_scores if sample.get(name) is not None]
+        if scorer.get('output_type') == "text" or any(isinstance(v, str) for v in values):
+            scores[name] = sample_scores[0].get(name)
+            continue
+        if not values:
+            scores[name] = None
+            continue
+        array = np.asarray(values, dtype=np.float64)
+        if all(isinstance(v, bool) for v in values):
+            scores[name] = sample_scores[0].get(name)
+            scores[pass_rate_name(name)] = float(array.mean())
+            scores[pass_at_k_name(name, len(sample_scores))] = bool(array.any())
+        else:
+            scores[name] = float(array.mean())
+        stats[name] = {
+            "mean": float(array.mean()),
+            "variance": float(array.var(ddof=1)) if len(array) > 1 else 0.0,
+            "samples": len(array)
+        }
+    return scores, stats
+
+
+def sampled_result(scorers: List[Dict[str, Any]], responses: List[str],
+                   sample_scores: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The response and score fields of a result, from each sample's response and scores
+
+    A single sample gives the plain `response` and `scores`. Several samples add `samples` (each
+    one's response and scores) and `score_stats`, with `scores` aggregated by `aggregate_samples`
+    and `response` holding the first sample.
+    """
+    if len(responses) == 1:
+        return {"response": responses[0], "scores": sample_scores[0]}
+    scores, stats = aggregate_samples(scorers, sample_scores)
+    return {
+        "response": responses[0],
+        "scores": scores,
+        "samples": [{"response": response, "scores": s} for response, s in zip(responses, sample_scores)],
+        "score_stats": stats
+    }
+
+
+def response_list(value: Optional[Any]) -> Optional[List[str]]:
+    """A generation as a list of samples: cached multi-sample generations are lists, single ones strings"""
+    if value is None or isinstance(value, list):
+        return value
+    return [value]
@@ -0,0 +1,305 @@
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import openai
+
+from concurrency import ConcurrencyLimiter, RunCancelled
+
+# Errors worth retrying: rate limits, timeouts, dropped connections and 5xx responses
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+# Ceilings shared by every run in a process; each run also keeps to its own limits (see `for_run`)
+MAX_GLOBAL_CONCURRENCY = 64
+MAX_MODEL_CONCURRENCY = 64
+# A model's AIMD window starts here and grows toward MAX_MODEL_CONCURRENCY while calls succeed
+INITIAL_MODEL_WINDOW = 8
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse an x-ratelimit-reset-* value such as '1s', '6m0s' or '20ms' into seconds"""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(messages) -> int:
+    """Rough prompt token count (about 4 characters per token) used to pre-charge the TPM bucket"""
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1
+
+
+def response_tokens(response) -> Optional[int]:
+    """Prompt plus completion tokens a parsed response used, if it reports its usage"""
+    return getattr(getattr(response, "usage", None), "total_tokens", None)
+
+
+class TokenBucket:
+    """Refilling token bucket; a capacity of None means the limit is not known yet"""
+
+    def __init__(self, capacity: Optional[float] = None, refill_seconds: float = 60.0):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.tokens = capacity or 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.capacity is not None:
+            rate = self.capacity / self.refill_seconds
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """Block until `amount` tokens are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.capacity is None:
+                    return
+                # A single request larger than the whole bucket only has to wait for a full bucket
+                amount = min(amount, self.capacity)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) * self.refill_seconds / self.capacity
+            time.sleep(min(wait, 1.0))
+
+    def charge(self, amount: float):
+        """Take `amount` tokens (or give them back, if negative) without waiting; the bucket may go
+        into debt, which later `acquire` calls wait out"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.capacity is not None:
+                self.tokens = min(self.capacity, self.tokens - amount)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset_seconds: Optional[float]):
+        """Align the bucket with the server's view of the limit"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit:
+                if self.capacity is None:
+                    self.tokens = limit
+                self.capacity = limit
+                self.refill_seconds = 60.0
+            if remaining is not None and self.capacity is not None:
+                self.tokens = min(self.tokens, remaining)
+                if remaining <= 0 and reset_seconds:
+                    # Empty until the server-side window resets
+                    self.tokens = -reset_seconds * self.capacity / self.refill_seconds
+
+
+class ModelRateState:
+    """Request/token buckets and the AIMD concurrency window for one model"""
+
+    def __init__(self, initial_window: int, max_concurrency: int):
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.max_concurrency = max_concurrency
+        self.window = float(min(initial_window, max_concurrency))
+        self.remaining_fraction: Optional[float] = None
+
+
+class RequestScheduler:
+    """Runs model calls under per-model rate limits with AIMD concurrency and jittered retries
+
+    Each model's window of calls in flight starts at `initial_window`. It grows by about one
+    slot per window of successful calls while it is full, up to `per_model_limit`, and halves
+    on a 429 or when the rate-limit headers show the budget nearly spent.
+    """
+
+    # Below this fraction of the per-minute budget remaining, back off before the server says 429
+    LOW_REMAINING_FRACTION = 0.1
+
+    def __init__(self, models: Iterable[str], global_limit: int = MAX_GLOBAL_CONCURRENCY,
+                 per_model_limit: int = MAX_MODEL_CONCURRENCY, initial_window: int = INITIAL_MODEL_WINDOW,
+                 max_retries: int = 6, base_delay: float = 0.5, max_delay: float = 30.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.limiter = ConcurrencyLimiter(global_limit, default_model_limit=per_model_limit)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._states: Dict[str, ModelRateState] = {}
+        self.per_model_limit = per_model_limit
+        self.initial_window = initial_window
+        for model in models:
+            self._state(model)
+
+    def _state(self, model: str) -> ModelRateState:
+        with self._lock:
+            if model not in self._states:
+                state = ModelRateState(self.initial_window, self.per_model_limit)
+                self._states[model] = state
+                self.limiter.set_model_limit(model, int(state.window))
+            return self._states[model]
+
+    def for_run(self, global_limit: int, per_model_limit: int,
+                cancel: Optional[threading.Event] = None) -> "RunScheduler":
+        """A view for one run with its own concurrency limits, on top of the shared rate limits
+
+        Once `cancel` is set, the run's failed calls are no longer retried.
+        """
+        return RunScheduler(self, global_limit, per_model_limit, cancel)
+
+    def concurrency_windows(self) -> Dict[str, int]:
+        """Current AIMD window per model"""
+        with self._lock:
+            return {model: int(state.window) for model, state in self._states.items()}
+
+    def _adjust(self, model: str, state: ModelRateState, congested: bool, in_flight: int):
+        """Resize a model's window after a call that started with `in_flight` calls to it running"""
+        with self._lock:
+            if congested:
+                # Halve what was actually in flight, not a window the callers never filled
+                state.window = max(1.0, min(state.window, in_flight or state.window) / 2)
+            elif in_flight >= int(state.window):
+                # Additive increase, only while the window is what holds calls back: roughly +1 slot
+                # per window's worth of successful calls
+                state.window = min(float(state.max_concurrency), state.window + 1.0 / max(state.window, 1.0))
+            self.limiter.set_model_limit(model, int(state.window))
+
+    def _observe_headers(self, state: ModelRateState, headers) -> bool:
+        """Sync buckets from x-ratelimit-* headers; return True if the budget is nearly spent"""
+        def number(name):
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        fractions = []
+        for kind, bucket in (("requests", state.requests), ("tokens", state.tokens)):
+            limit = number(f"x-ratelimit-limit-{kind}")
+            remaining = number(f"x-ratelimit-remaining-{kind}")
+            reset = parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if limit is None and remaining is None:
+                continue
+            bucket.sync(limit, remaining, reset)
+            if limit and remaining is not None:
+                fractions.append(remaining / limit)
+        if not fractions:
+            return False
+        state.remaining_fraction = min(fractions)
+        return state.remaining_fraction < self.LOW_REMAINING_FRACTION
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = parse_reset_duration(response.headers.get("retry-after"))
+        # Full jitter keeps many retrying threads from waking up in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, model: str, create: Callable, estimated_tokens: int = 0,
+             timing: Optional[Dict[str, float]] = None, read: Optional[Callable[[Any], Any]] = None,
+             limiter: Optional[ConcurrencyLimiter] = None, cancel: Optional[threading.Event] = None,
+             count_tokens: Callable[[Any], Optional[int]] = response_tokens):
+        """Run `create()` (returning a raw API response) for `model`, retrying transient failures
+
+        If given, `timing` is filled with wall_seconds (end to end), queue_seconds (waiting on
+        rate limits and concurrency slots), latency_seconds (the successful request in flight)
+        and retries. `read` consumes the raw response (e.g. a stream) while the call still holds
+        its concurrency slot, and its return value is returned instead of the parsed response.
+        A `limiter` caps the calls of one caller (see `for_run`) on top of the shared limits.
+        Setting `cancel` stops retries: the call raises RunCancelled instead of waiting to retry.
+
+        The token bucket is charged `estimated_tokens` up front, then corrected to the tokens the
+        call actually used, as `count_tokens` reads them from the result.
+        """
+        state = self._state(model)
+        attempt = 0
+        started = time.monotonic()
+        queued = 0.0
+        in_flight = 0
+        while True:
+            waiting = time.monotonic()
+            try:
+                with ExitStack() as slots:
+                    if limiter is not None:
+                        # The caller's own cap comes first, so its excess calls do not hold shared budget
+                        slots.enter_context(limiter.slot(model))
+                    state.requests.acquire(1)
+                    state.tokens.acquire(estimated_tokens)
+                    slots.enter_context(self.limiter.slot(model))
+                    in_flight = self.limiter.in_flight(model)
+                    sent = time.monotonic()
+                    queued += sent - waiting
+                    raw = create()
+                    result = raw.parse() if read is None else read(raw)
+                    latency = time.monotonic() - sent
+            except RETRYABLE_ERRORS as e:
+                if getattr(e, "code", None) == "insufficient_quota":
+                    # Out of credit, not rate limited: retrying cannot help
+                    raise
+                if isinstance(e, openai.RateLimitError):
+                    self._adjust(model, state, True, in_flight)
+                    response = getattr(e, "response", None)
+                    if response is not None:
+                        self._observe_headers(state, response.headers)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                if cancel is None:
+                    self._sleep(delay)
+                elif cancel.is_set() or cancel.wait(delay):
+                    raise RunCancelled(f"Cancelled while retrying a call to {model}") from e
+                attempt += 1
+                continue
+            used = count_tokens(result)
+            if used is not None:
+                # Completion tokens count against the TPM budget as well
+                state.tokens.charge(used - estimated_tokens)
+            congested = self._observe_headers(state, raw.headers)
+            self._adjust(model, state, congested, in_flight)
+            if timing is not None:
+                timing.update(wall_seconds=time.monotonic() - started, queue_seconds=queued,
+                              latency_seconds=latency, retries=attempt)
+            return result
+
+
+class RunScheduler:
+    """One run's view of a shared `RequestScheduler`
+
+    Calls obey the run's own global and per-model concurrency limits as well as the shared
+    scheduler's rate limits and AIMD windows, so runs with different settings can share a
+    scheduler without changing each other's limits.
+    """
+
+    def __init__(self, scheduler: RequestScheduler, global_limit: int, per_model_limit: int,
+                 cancel: Optional[threading.Event] = None):
+        self.scheduler = scheduler
+        self.limiter = ConcurrencyLimiter(global_limit, default_model_limit=per_model_limit)
+        self.cancel = cancel
+
+    def for_run(self, global_limit: int, per_model_limit: int,
+                cancel: Optional[threading.Event] = None) -> "RunScheduler":
+        return self.scheduler.for_run(global_limit, per_model_limit, cancel)
+
+    def call(self, model: str, create: Callable, estimated_tokens: int = 0,
+             timing: Optional[Dict[str, float]] = None, read: Optional[Callable[[Any], Any]] = None,
+             count_tokens: Callable[[Any], Optional[int]] = response_tokens):
+        """`RequestScheduler.call` under this run's limits"""
+        return self.scheduler.call(model, create, estimated_tokens, timing, read, limiter=self.limiter,
+                                   cancel=self.cancel, count_tokens=count_tokens)
@@ -0,0 +1,351 @@
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import weave
+from dotenv import load_dotenv
+
+from checkpoint import DEFAULT_CHECKPOINT_PATH, CheckpointStore
+from dataset_loader import DatasetLoader
+from eval_engine import create_engine, iter_cells
+from log_buffer import log_result
+
+# Examples per shard; a shard holds every prompt's cells for its rows, so prompts stay paired
+DEFAULT_SHARD_SIZE = 500
+# A shard whose worker stops renewing its lease for this long is handed to another worker
+LEASE_SECONDS = 120.0
+# Attempts per shard before the run gives up on it; resuming the run grants new attempts
+MAX_SHARD_ATTEMPTS = 3
+# How often idle workers and the coordinator look at the queue
+QUEUE_POLL_SECONDS = 2.0
+
+
+def plan_shards(num_rows: int, shard_size: int = DEFAULT_SHARD_SIZE) -> List[Tuple[int, int]]:
+    """Row ranges [start, stop) of a dataset's shards; the same rows and size always give the same shards"""
+    if shard_size < 1:
+        raise ValueError("Shard size must be at least 1")
+    return [(start, min(start + shard_size, num_rows)) for start in range(0, num_rows, shard_size)]
+
+
+class ShardQueue:
+    """Work queue of sharded runs in SQLite: workers lease shards, renew the lease while they work,
+    and mark each shard done or failed
+
+    Lives in the checkpoint database, so any process or host that can open that file can take
+    work. Shards whose lease expired (their worker died) or that failed are handed out again
+    until they have been claimed `max_attempts` times. A shard whose lease expires on its last
+    attempt is marked failed, so a shard that kills its worker every time cannot stall the run.
+    """
+
+    # Shards a worker may take: never taken, or abandoned by a worker or failed with attempts left
+    _CLAIMABLE = ("(status = 'pending' OR (status = 'leased' AND lease_expires < ? AND attempts < ?) "
+                  "OR (status = 'failed' AND attempts < ?))")
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH, max_attempts: int = MAX_SHARD_ATTEMPTS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            "run_id TEXT NOT NULL, shard_idx INTEGER NOT NULL, start_row INTEGER NOT NULL, "
+            "stop_row INTEGER NOT NULL, status TEXT NOT NULL, worker TEXT, lease_expires REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (run_id, shard_idx))"
+        )
+        self._conn.commit()
+
+    def create(self, run_id: str, shards: List[Tuple[int, int]]):
+        """Queue a run's shards, as planned by `plan_shards`"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO shards (run_id, shard_idx, start_row, stop_row, status, updated_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?)",
+                [(run_id, idx, start, stop, now) for idx, (start, stop) in enumerate(shards)]
+            )
+            self._conn.commit()
+
+    def claim(self, run_id: str, worker: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Lease the first claimable shard to `worker`; None if there is none right now"""
+        while True:
+            now = time.time()
+            with self._lock:
+                self._expire(run_id, now)
+                row = self._conn.execute(
+                    f"SELECT shard_idx, start_row, stop_row FROM shards WHERE run_id = ? AND {self._CLAIMABLE} "
+                    "ORDER BY shard_idx LIMIT 1",
+                    (run_id, now, self.max_attempts, self.max_attempts)
+                ).fetchone()
+                if row is None:
+                    self._conn.commit()
+                    return None
+                # Another worker may take the same shard in between: the update then matches nothing
+                claimed = self._conn.execute(
+                    "UPDATE shards SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    f"updated_at = ? WHERE run_id = ? AND shard_idx = ? AND {self._CLAIMABLE}",
+                    (worker, now + lease_seconds, now, run_id, row[0], now, self.max_attempts, self.max_attempts)
+                ).rowcount
+                self._conn.commit()
+            if claimed:
+                return {"shard_idx": row[0], "start_row": row[1], "stop_row": row[2]}
+
+    def _expire(self, run_id: str, now: float):
+        """Mark shards failed whose lease expired on their last attempt; the caller holds the lock and commits"""
+        self._conn.execute(
+            "UPDATE shards SET status = 'failed', error = 'Lease expired: the worker stopped renewing it', "
+            "lease_expires = NULL, updated_at = ? "
+            "WHERE run_id = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, run_id, now, self.max_attempts)
+        )
+
+    def renew(self, run_id: str, shard_idx: int, worker: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+        """Extend a lease; False if the shard is no longer leased to `worker`"""
+        now = time.time()
+        with self._lock:
+            renewed = self._conn.execute(
+                "UPDATE shards SET lease_expires = ?, updated_at = ? "
+                "WHERE run_id = ? AND shard_idx = ? AND worker = ? AND status = 'leased'",
+                (now + lease_seconds, now, run_id, shard_idx, worker)
+            ).rowcount
+            self._conn.commit()
+        return bool(renewed)
+
+    def complete(self, run_id: str, shard_idx: int, worker: str):
+        self._finish(run_id, shard_idx, worker, "done", None)
+
+    def fail(self, run_id: str, shard_idx: int, worker: str, error: str):
+        self._finish(run_id, shard_idx, worker, "failed", error)
+
+    def _finish(self, run_id: str, shard_idx: int, worker: str, status: str, error: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE shards SET status = ?, error = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE run_id = ? AND shard_idx = ? AND worker = ? AND status != 'done'",
+                (status, error, time.time(), run_id, shard_idx, worker)
+            )
+            self._conn.commit()
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        """Shards per status: pending, leased, done and failed"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM shards WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall()
+        return {"pending": 0, "leased": 0, "done": 0, "failed": 0, **dict(rows)}
+
+    def outstanding(self, run_id: str) -> int:
+        """Shards not done yet that may still be (or are being) evaluated"""
+        with self._lock:
+            self._expire(run_id, time.time())
+            self._conn.commit()
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM shards WHERE run_id = ? AND status != 'done' "
+                "AND NOT (status = 'failed' AND attempts >= ?)",
+                (run_id, self.max_attempts)
+            ).fetchone()[0]
+
+    def exhausted(self, run_id: str) -> List[Dict[str, Any]]:
+        """Failed shards that have used up their attempts, with their last error"""
+        with self._lock:
+            self._expire(run_id, time.time())
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT shard_idx, start_row, stop_row, error FROM shards "
+                "WHERE run_id = ? AND status = 'failed' AND attempts >= ? ORDER BY shard_idx",
+                (run_id, self.max_attempts)
+            ).fetchall()
+        return [{"shard_idx": idx, "start_row": start, "stop_row": stop, "error": error}
+                for idx, start, stop, error in rows]
+
+    def retry_failed(self, run_id: str):
+        """Give failed shards a fresh set of attempts"""
+        with self._lock:
+            self._expire(run_id, time.time())
+            self._conn.execute(
+                "UPDATE shards SET attempts = 0, updated_at = ? WHERE run_id = ? AND status = 'failed'",
+                (time.time(), run_id)
+            )
+            self._conn.commit()
+
+
+def start_sharded_run(checkpoint: CheckpointStore, queue: ShardQueue, name: str, dataset, prompts: List[Dict[str, Any]],
+                      scorers: List[Dict[str, Any]], input_field: str, ground_truth_field: Optional[str] = None,
+                      shard_size: int = DEFAULT_SHARD_SIZE) -> str:
+    """Register a sharded run and queue its shards; returns the run id
+
+    The run's config pins the dataset version and fields, so every worker reads the same rows.
+    """
+    config = {
+        "dataset_ref": dataset.ref,
+        "prompts": prompts,
+        "scorers": scorers,
+        "sharding": {
+            "digest": dataset.digest,
+            "num_rows": len(dataset),
+            "shard_size": shard_size,
+            "input_field": input_field,
+            "ground_truth_field": ground_truth_field
+        }
+    }
+    run_id = checkpoint.start_run(name, config, len(dataset) * len([p for p in prompts if p['text']]))
+    queue.create(run_id, plan_shards(len(dataset), shard_size))
+    return run_id
+
+
+def work_shards(run_id: str, settings: Optional[Dict[str, Any]] = None, project: Optional[str] = None,
+                checkpoint_path: str = DEFAULT_CHECKPOINT_PATH, dataset_loader: Optional[DatasetLoader] = None,
+                worker_id: Optional[str] = None) -> int:
+    """Evaluate shards of a sharded run until none are left; returns how many this worker finished
+
+    Runs in the coordinator's worker processes, or on any host sharing the checkpoint database
+    (`python -m eval_engine --shard-worker RUN_ID`). Finished cells are checkpointed as they
+    complete, so a retried shard only evaluates the rest. A worker that loses a shard's lease
+    (it could not renew it in time) stops work on the shard and discards the results it has not
+    recorded yet, since another worker may have taken the shard over. Nothing is logged to Weave
+    here: the coordinator logs the merged results. `settings` are passed to `EvaluationEngine.run_cells`.
+    """
+    load_dotenv()
+    if project:
+        weave.init(project_name=project)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    checkpoint = CheckpointStore(checkpoint_path)
+    queue = ShardQueue(checkpoint_path)
+    run = checkpoint.get_run(run_id)
+    if run is None or 'sharding' not in run['config']:
+        raise ValueError(f"No sharded run with id {run_id}")
+    config = run['config']
+    sharding = config['sharding']
+    dataset = (dataset_loader or DatasetLoader()).load(config['dataset_ref'])
+    if dataset.digest != sharding['digest'] or len(dataset) != sharding['num_rows']:
+        raise ValueError(f"{config['dataset_ref']} no longer resolves to the version run {run_id} was sharded on")
+    extra_fields = sorted({s['ground_truth_field'] for s in config['scorers'] if s.get('ground_truth_field')})
+    engine = create_engine()
+
+    finished = 0
+    while True:
+        claimed_at = time.time()
+        shard = queue.claim(run_id, worker_id, LEASE_SECONDS)
+        if shard is None:
+            if not queue.outstanding(run_id):
+                return finished
+            # The remaining shards are leased to other workers; take over any whose lease expires
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+
+        shard_idx, start, stop = shard['shard_idx'], shard['start_row'], shard['stop_row']
+        done = threading.Event()
+        lost = threading.Event()
+        # When the lease runs out at the latest, from this worker's side
+        lease = {"expires": claimed_at + LEASE_SECONDS}
+
+        def keep_lease():
+            while not done.wait(LEASE_SECONDS / 3):
+                renewed_at = time.time()
+                if not queue.renew(run_id, shard_idx, worker_id, LEASE_SECONDS):
+                    lost.set()
+                    return
+                lease["expires"] = renewed_at + LEASE_SECONDS
+
+        def holds_lease():
+            return not lost.is_set() and time.time() < lease["expires"]
+
+        threading.Thread(target=keep_lease, name=f"shard-lease-{shard_idx}", daemon=True).start()
+        try:
+            skip = checkpoint.completed_cells(run_id, (start, stop))
+            cells = iter_cells(dataset.iter_range(start, stop), config['prompts'], sharding['input_field'],
+                               sharding['ground_truth_field'], extra_fields=extra_fields, start=start)
+            results = engine.run_cells(
+                (cell for cell in cells if (cell['prompt_idx'], cell['example_idx']) not in skip),
+                config['scorers'], **(settings or {})
+            )
+            try:
+                for result in results:
+                    if not holds_lease():
+                        break
+                    checkpoint.record(run_id, result)
+            finally:
+                results.close()
+            if not holds_lease():
+                # Another worker may be evaluating these rows now: leave the shard to it
+                print(f"Lost the lease on shard {shard_idx}; dropping its unrecorded results", file=sys.stderr)
+                continue
+            queue.complete(run_id, shard_idx, worker_id)
+            finished += 1
+        except Exception as e:
+            traceback.print_exc()
+            queue.fail(run_id, shard_idx, worker_id, f"{type(e).__name__}: {e}")
+        finally:
+            done.set()
+
+
+def run_sharded(run_id: str, workers: int, settings: Optional[Dict[str, Any]] = None, eval_logger=None,
+                project: Optional[str] = None, checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+                dataset_loader: Optional[DatasetLoader] = None,
+                on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Iterator[Dict[str, Any]]:
+    """Evaluate a sharded run in `workers` local processes, then yield its merged results in
+    (prompt_idx, example_idx) order, logging each to `eval_logger` if given
+
+    Workers on other hosts may join at any time with `work_shards`; with `workers=0` this only
+    waits for them. `on_progress` receives the queue's `counts` while shards are running.
+    Shards that failed `MAX_SHARD_ATTEMPTS` times raise a RuntimeError once the rest are done;
+    their finished cells stay checkpointed, and running the run again retries only what is left.
+    """
+    checkpoint = CheckpointStore(checkpoint_path)
+    queue = ShardQueue(checkpoint_path)
+    run = checkpoint.get_run(run_id)
+    queue.retry_failed(run_id)
+    checkpoint.set_status(run_id, "running")
+
+    def report():
+        if on_progress is not None:
+            on_progress(queue.counts(run_id))
+
+    try:
+        if workers:
+            # Fresh processes, so every worker has its own interpreter, connection pool and caches
+            spawn = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=spawn) as pool:
+                futures = [
+                    pool.submit(work_shards, run_id, settings, project, checkpoint_path, dataset_loader,
+                                f"{socket.gethostname()}-{os.getpid()}-{idx}")
+                    for idx in range(workers)
+                ]
+                pending = futures
+                while pending:
+                    report()
+                    finished, pending = wait(pending, timeout=QUEUE_POLL_SECONDS, return_when=FIRST_EXCEPTION)
+                    for future in finished:
+                        # A worker that cannot start (e.g. the dataset changed) stops the whole run
+                        future.result()
+        while queue.outstanding(run_id):
+            report()
+            time.sleep(QUEUE_POLL_SECONDS)
+        report()
+        exhausted = queue.exhausted(run_id)
+        if exhausted:
+            raise RuntimeError(
+                f"{len(exhausted)} shards failed {queue.max_attempts} times; run the same run id again to retry them "
+                f"(shard {exhausted[0]['shard_idx']}: {exhausted[0]['error']})"
+            )
+    except BaseException:
+        checkpoint.set_status(run_id, "failed")
+        raise
+
+    prompts = run['config']['prompts']
+    for result in checkpoint.iter_results(run_id):
+        if eval_logger is not None:
+            log_result(eval_logger, prompts[result['prompt_idx']]['text'], result)
+        yield result
+    checkpoint.set_status(run_id, "completed")
@@ -0,0 +1,184 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+# Only standard-library modules at the top: the child process re-imports this module, and anything
+# imported here would be loaded before the cold start is timed
+from mock_openai_server import MockOpenAIServer
+
+# Modules the app only needs once there are results or runs to show
+DEFERRED_MODULES = ("pandas", "plotly.express")
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# Results compared against a baseline: (key, label, higher is better)
+COMPARED_RESULTS = [("cold_start_seconds", "cold start", False), ("rerun_p50", "rerun p50", False),
+                    ("results_rerun_p50", "results rerun p50", False)]
+
+
+class LocalWeaveClient:
+    """Stand-in for the client returned by `weave.init`: an empty project and no network calls"""
+
+    def __init__(self, project_name: str):
+        self.entity = "local"
+        self.project = project_name
+        self.server = self
+
+    def objs_query(self, req):
+        return SimpleNamespace(objs=[])
+
+
+def build_results(rows: int, prompts: int):
+    """A finished run's results, with a numeric and a boolean scorer"""
+    import numpy as np
+    from results_store import ResultsStore
+
+    rng = np.random.default_rng(0)
+    return ResultsStore.from_results(
+        {
+            "prompt_idx": prompt_idx,
+            "example_idx": example_idx,
+            "input": f"Question {example_idx}",
+            "response": f"Answer {example_idx} from prompt {prompt_idx}",
+            "ground_truth": f"Answer {example_idx}",
+            "scores": {"quality": int(rng.integers(1, 11)), "correct": bool(rng.random() < 0.7)}
+        }
+        for prompt_idx in range(prompts) for example_idx in range(rows)
+    )
+
+
+def seed_cache(path: str, entries: int):
+    """Fill the generation cache with `entries` replies of about 1 KB, like a long-used install"""
+    from cache import GenerationCache
+
+    cache = GenerationCache(path)
+    value = "lorem ipsum " * 85
+    for i in range(entries):
+        cache.put(f"seed-{i}", value)
+
+
+def measure_startup(base_url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Cold start and rerun timings of the app in a fresh process; runs in a child process"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Set before any app module is imported: the cache directory is read at import time
+        os.environ.update(OPENAI_BASE_URL=base_url, OPENAI_API_KEY="mock", EVAL_CACHE_DIR=cache_dir,
+                          WEAVE_PROJECT="startup-benchmark")
+        if params['cache_entries']:
+            seed_cache(os.path.join(cache_dir, "cache.sqlite"), params['cache_entries'])
+        preloaded = set(sys.modules)
+
+        started = time.perf_counter()
+        import weave
+        from streamlit.testing.v1 import AppTest
+
+        weave_inits = []
+
+        def init(project_name: str, **kwargs):
+            weave_inits.append(project_name)
+            return LocalWeaveClient(project_name)
+
+        weave.init = init
+        app = AppTest.from_file(APP_PATH, default_timeout=120)
+        app.run()
+        cold_start = time.perf_counter() - started
+        check_app(app)
+        loaded_at_start = [name for name in DEFERRED_MODULES if name in sys.modules and name not in preloaded]
+
+        def rerun_times(label: str) -> List[float]:
+            # Each interaction edits the first prompt, which reruns the whole script
+            times = []
+            for i in range(params['reruns']):
+                started = time.perf_counter()
+                app.text_area(key="prompt_0").input(f"{label} prompt {i}").run()
+                times.append(time.perf_counter() - started)
+                check_app(app)
+            return times
+
+        reruns = rerun_times("plain")
+
+        app.session_state["evaluation_results"] = build_results(params['rows'], params['prompts'])
+        app.session_state["results_run_id"] = "benchmark"
+        started = time.perf_counter()
+        app.run()
+        results_first = time.perf_counter() - started
+        check_app(app)
+        results_reruns = rerun_times("results")
+
+    import numpy as np
+    p50, p95 = np.percentile(reruns, [50, 95])
+    results_p50, results_p95 = np.percentile(results_reruns, [50, 95])
+    return {
+        "cold_start_seconds": cold_start,
+        "rerun_p50": float(p50),
+        "rerun_p95": float(p95),
+        "results_first_seconds": results_first,
+        "results_rerun_p50": float(results_p50),
+        "results_rerun_p95": float(results_p95),
+        # Once per process is expected; more means initialization is repeated on reruns
+        "weave_inits": len(weave_inits),
+        # Should stay empty: these are imported on first use
+        "loaded_at_start": loaded_at_start
+    }
+
+
+def check_app(app):
+    if app.exception:
+        raise RuntimeError(f"The app raised: {app.exception[0].value}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python startup_benchmark.py",
+        description="Measure the app's cold start and per-interaction rerun time, without a browser or API spend"
+    )
+    parser.add_argument("--reruns", type=int, default=20, help="Widget interactions timed per scenario")
+    parser.add_argument("--rows", type=int, default=500, help="Examples in the results shown")
+    parser.add_argument("--prompts", type=int, default=3, help="Prompts in the results shown")
+    parser.add_argument("--cache-entries", type=int, default=0,
+                        help="Cached generations to seed, to time a long-used cache")
+    parser.add_argument("--repeat", type=int, default=1, help="Fresh processes to measure")
+    parser.add_argument("--output", "-o", help="Append one JSON record per run to this file")
+    parser.add_argument("--baseline", help="JSONL file from an earlier --output to compare against")
+    args = parser.parse_args(argv)
+    from benchmark import compare_to_baseline, git_commit, load_baseline
+
+    baseline = load_baseline(args.baseline) if args.baseline else []
+    commit = git_commit()
+    params = {"reruns": args.reruns, "rows": args.rows, "prompts": args.prompts, "cache_entries": args.cache_entries}
+    print(f"{'cold':>7} {'rerun50':>8} {'rerun95':>8} {'results':>8} {'res50':>7} {'res95':>7} {'inits':>6} "
+          f"loaded at start")
+
+    # A fresh process per run, so the cold start includes every import
+    spawn = multiprocessing.get_context("spawn")
+    with MockOpenAIServer() as mock_server:
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                results = pool.submit(measure_startup, mock_server.base_url, params).result()
+            record = {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "commit": commit,
+                "python": sys.version.split()[0],
+                "params": params,
+                "results": results
+            }
+            print(f"{results['cold_start_seconds']:>7.2f} {results['rerun_p50']:>8.3f} {results['rerun_p95']:>8.3f} "
+                  f"{results['results_first_seconds']:>8.3f} {results['results_rerun_p50']:>7.3f} "
+                  f"{results['results_rerun_p95']:>7.3f} {results['weave_inits']:>6} "
+                  f"{', '.join(results['loaded_at_start']) or '-'}", flush=True)
+            comparison = compare_to_baseline(record, baseline, COMPARED_RESULTS)
+            if comparison:
+                print(comparison, flush=True)
+            if args.output:
+                with open(args.output, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
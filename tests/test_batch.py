@@ -0,0 +1,85 @@
+import pytest
+from openai import OpenAI
+
+from cache import GenerationCache, JudgeCache
+from eval_engine import EvaluationEngine, iter_cells
+from mock_openai_server import MockOpenAIServer
+
+ROWS = [{"input": f"question {i}", "expected": "Mock response"} for i in range(6)]
+PROMPTS = [{"text": "Answer briefly", "model": "gpt-4o-mini"}, {"text": "Answer well", "model": "gpt-4o-mini"}]
+SCORERS = [
+    {"name": "helpful", "prompt": "Is it helpful?", "output_type": "boolean", "model": "gpt-4o-mini"},
+    {"name": "clear", "prompt": "How clear is it?", "output_type": "numeric", "scale": "1-10", "model": "gpt-4o-mini"},
+]
+
+
+class RecordingLogger:
+    """Evaluation logger stand-in keeping every prediction it is given"""
+
+    def __init__(self):
+        self.predictions = []
+
+    def log_prediction(self, inputs, output):
+        prediction = {"inputs": inputs, "output": output, "scores": {}}
+        self.predictions.append(prediction)
+        return self
+
+    def log_score(self, scorer, score):
+        self.predictions[-1]["scores"][scorer] = score
+
+    def finish(self):
+        pass
+
+
+def make_engine(server, tmp_path, name):
+    path = str(tmp_path / f"{name}.sqlite")
+    return EvaluationEngine(OpenAI(base_url=server.base_url, api_key="mock", max_retries=0),
+                            generation_cache=GenerationCache(path), judge_cache=JudgeCache(path))
+
+
+def test_batch_results_are_logged_like_interactive_ones(tmp_path):
+    loggers = {}
+    with MockOpenAIServer() as server:
+        for mode in ("interactive", "batch"):
+            loggers[mode] = RecordingLogger()
+            results = make_engine(server, tmp_path, mode).run_cells(
+                iter_cells(ROWS, PROMPTS, "input", "expected"), SCORERS, loggers[mode],
+                mode=mode, batch_poll_interval=0.01, stream=False
+            )
+            list(results)
+
+    def ordered(logger):
+        return sorted(logger.predictions, key=lambda p: (p["inputs"]["prompt"], p["inputs"]["input"]))
+
+    assert len(loggers["batch"].predictions) == len(ROWS) * len(PROMPTS)
+    assert ordered(loggers["batch"]) == ordered(loggers["interactive"])
+
+
+def test_batch_mode_rejects_combined_scorers(tmp_path):
+    with MockOpenAIServer() as server:
+        results = make_engine(server, tmp_path, "batch").run_cells(
+            iter_cells(ROWS, PROMPTS, "input", "expected"), SCORERS, mode="batch", combine_scorers=True
+        )
+        with pytest.raises(ValueError, match="combine_scorers"):
+            next(results)
+
+
+@pytest.mark.parametrize("mode", ["interactive", "batch"])
+def test_results_count_their_own_cache_hits(tmp_path, mode):
+    with MockOpenAIServer() as server:
+        engine = make_engine(server, tmp_path, mode)
+        first = list(engine.run_cells(iter_cells(ROWS[:3], PROMPTS, "input", "expected"), SCORERS,
+                                      mode=mode, batch_poll_interval=0.01, stream=False))
+        second = list(engine.run_cells(iter_cells(ROWS, PROMPTS, "input", "expected"), SCORERS,
+                                       mode=mode, batch_poll_interval=0.01, stream=False))
+
+    def totals(results):
+        return {
+            label: {kind: sum(r["cache"][label][kind] for r in results) for kind in ("hits", "misses")}
+            for label in ("Generation", "Judge")
+        }
+
+    cells, judged = 3 * len(PROMPTS), 3 * len(PROMPTS) * len(SCORERS)
+    assert totals(first) == {"Generation": {"hits": 0, "misses": cells}, "Judge": {"hits": 0, "misses": judged}}
+    assert totals(second) == {"Generation": {"hits": cells, "misses": cells},
+                              "Judge": {"hits": judged, "misses": judged}}
@@ -0,0 +1,86 @@
+import cache as cache_module
+from cache import GenerationCache, JudgeCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_get_counts_hits_and_misses_and_put_replaces(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache.sqlite"))
+    key = GenerationCache.make_key("Answer: {question}", "gpt-4o", {"question": "2+2"}, {"temperature": 0})
+
+    assert cache.get(key) is None
+    cache.put(key, ["4", {"total_tokens": 3}])
+    assert cache.get(key) == ["4", {"total_tokens": 3}]
+    cache.put(key, ["four", None])
+    assert cache.get(key) == ["four", None]
+
+    assert cache.stats() == {"hits": 2, "misses": 1, "entries": 1, "bytes": len('["four", null]')}
+    assert key != GenerationCache.make_key("Answer: {question}", "gpt-4o", {"question": "2+2"}, {"temperature": 1})
+
+
+def test_judge_key_ignores_the_scorer_display_name(tmp_path):
+    scorer = {"name": "Correct", "prompt": "Is it right?", "output_type": "boolean", "model": "gpt-4o"}
+    key = JudgeCache.make_key(scorer, "2+2", "4", "4")
+
+    assert JudgeCache.make_key({**scorer, "name": "Renamed"}, "2+2", "4", "4") == key
+    assert JudgeCache.make_key({**scorer, "prompt": "Is it wrong?"}, "2+2", "4", "4") != key
+    assert JudgeCache.make_key(scorer, "2+2", "4", "5") != key
+
+
+def test_entries_expire_after_max_age(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = JudgeCache(str(tmp_path / "cache.sqlite"), max_age_seconds=60)
+    cache.put("old", {"score": True})
+    clock.now += 30
+    cache.put("new", {"score": False})
+
+    clock.now += 45
+    assert cache.get("old") is None
+    assert cache.get("new") == {"score": False}
+
+    cache.evict()
+    assert cache.stats()["entries"] == 1
+
+
+def test_eviction_drops_least_recently_used_entries_over_the_size_budget(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    value = "x" * 98
+    size = len(f'"{value}"')
+    cache = GenerationCache(str(tmp_path / "cache.sqlite"), max_bytes=2 * size, max_age_seconds=None)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.put(key, value)
+    clock.now += 1
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == value
+
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("c") == value
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == 2 * size
+
+
+def test_eviction_runs_periodically_on_put(tmp_path, monkeypatch):
+    monkeypatch.setattr(GenerationCache, "EVICT_EVERY", 3)
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = GenerationCache(str(tmp_path / "cache.sqlite"), max_bytes=1, max_age_seconds=None)
+    for key in ("a", "b"):
+        clock.now += 1
+        cache.put(key, key)
+    assert cache.stats()["entries"] == 2
+
+    clock.now += 1
+    cache.put("c", "c")
+    assert cache.stats() == {"hits": 0, "misses": 0, "entries": 0, "bytes": 0}
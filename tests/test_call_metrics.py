@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from call_metrics import CallMetrics, call_record
+
+
+def make_metrics(results=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    metrics = CallMetrics()
+    for idx in range(results):
+        calls = []
+        for kind in ("generation", "judge", "judge"):
+            timing = {"wall_seconds": 1.0, "queue_seconds": float(rng.random()) / 10,
+                      "latency_seconds": float(rng.lognormal(-1.0, 1.0)), "retries": int(rng.integers(0, 2))}
+            if kind == "generation":
+                timing["ttft_seconds"] = float(rng.lognormal(-2.0, 0.5))
+            usage = {"prompt_tokens": int(rng.integers(10, 500)), "completion_tokens": int(rng.integers(1, 100)),
+                     "prompt_tokens_details": {"cached_tokens": int(rng.integers(0, 10))}}
+            calls.append(call_record(kind, "gpt-4o-mini" if idx % 2 else "unpriced-model", usage, timing))
+        metrics.add({"prompt_idx": idx % 3, "calls": calls})
+    return metrics
+
+
+def test_live_summary_matches_exact_summary():
+    metrics = make_metrics()
+    exact, live = metrics.summary(), metrics.summary(exact=False)
+
+    assert live["calls"] == exact["calls"] == 6000
+    assert live["unpriced_calls"] == exact["unpriced_calls"] == 3000
+    assert live["cost_usd"] == pytest.approx(exact["cost_usd"])
+    for name, prompt in exact["prompts"].items():
+        assert live["prompts"][name] == pytest.approx(prompt)
+    for name, model in exact["models"].items():
+        for key, value in model.items():
+            if value is None:
+                assert live["models"][name][key] is None
+                continue
+            # Live percentiles are read from histograms with bins about 6% wide
+            assert live["models"][name][key] == pytest.approx(value, rel=0.06 if "_p" in key else 1e-9)
+    for kind in ("generation", "judge"):
+        assert live["kinds"][kind]["calls"] == exact["kinds"][kind]["calls"]
+        assert live["kinds"][kind]["latency_p50"] == pytest.approx(exact["kinds"][kind]["latency_p50"], rel=0.06)
+
+
+def test_summary_is_memoized_until_the_next_result():
+    metrics = make_metrics(10)
+    live = metrics.summary(exact=False)
+    assert metrics.summary(exact=False) is live
+
+    metrics.add({"prompt_idx": 0, "calls": []})
+    assert metrics.summary(exact=False) is not live
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+from openai import OpenAI
+
+from cache import GenerationCache, JudgeCache
+from concurrency import RunCancelled
+from eval_engine import AVAILABLE_MODELS, EvaluationEngine, iter_cells
+from mock_openai_server import MockBehavior, MockOpenAIServer
+from scheduler import RequestScheduler
+
+ROWS = [{"input": f"question {i}", "expected": "Mock response"} for i in range(4)]
+PROMPTS = [{"text": "Answer briefly", "model": "gpt-4o-mini"}]
+SCORERS = [{"name": "helpful", "prompt": "Is it helpful?", "output_type": "boolean", "model": "gpt-4o-mini"}]
+
+
+def cancelled_run_seconds(server, tmp_path, **settings) -> float:
+    """Seconds a run takes to stop when it is cancelled 0.2 s in"""
+    path = str(tmp_path / "cache.sqlite")
+    # Retries would wait 30 s, as long as the batch jobs take
+    engine = EvaluationEngine(OpenAI(base_url=server.base_url, api_key="mock", max_retries=0),
+                              scheduler=RequestScheduler(AVAILABLE_MODELS, base_delay=30.0, max_delay=30.0),
+                              generation_cache=GenerationCache(path), judge_cache=JudgeCache(path))
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    started = time.monotonic()
+    with pytest.raises(RunCancelled):
+        list(engine.run_cells(iter_cells(ROWS, PROMPTS, "input", "expected"), SCORERS, stream=False,
+                              cancel=cancel, **settings))
+    return time.monotonic() - started
+
+
+def test_cancel_stops_a_run_waiting_on_its_batch(tmp_path):
+    with MockOpenAIServer(batch_delay=30.0) as server:
+        seconds = cancelled_run_seconds(server, tmp_path, mode="batch", batch_poll_interval=10.0)
+        statuses = [batch["status"] for batch in server.state.batches.values()]
+
+    assert seconds < 2
+    assert statuses in (["cancelling"], ["cancelled"])
+
+
+def test_cancel_stops_a_run_waiting_to_retry(tmp_path):
+    with MockOpenAIServer(behavior=MockBehavior(error_rate=1.0)) as server:
+        seconds = cancelled_run_seconds(server, tmp_path)
+
+    assert seconds < 2
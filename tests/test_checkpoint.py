@@ -0,0 +1,33 @@
+import pytest
+
+import checkpoint as checkpoint_module
+from checkpoint import CheckpointStore
+
+
+def test_resume_refuses_a_republished_dataset(tmp_path):
+    checkpoint = CheckpointStore(str(tmp_path / "checkpoints.sqlite"))
+    run_id = checkpoint.start_run("run", {"dataset_ref": "qa:latest", "prompts": [], "scorers": []})
+
+    checkpoint.pin_dataset(run_id, "digest-1", 10)
+    checkpoint.pin_dataset(run_id, "digest-1", 10)
+
+    assert checkpoint.get_run(run_id)['config']['dataset'] == {"digest": "digest-1", "num_rows": 10}
+    with pytest.raises(ValueError, match="different version"):
+        checkpoint.pin_dataset(run_id, "digest-2", 10)
+    with pytest.raises(ValueError, match="different version"):
+        checkpoint.pin_dataset(run_id, "digest-1", 12)
+
+
+def test_results_are_replayed_in_order_a_page_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint_module, "RESULTS_PAGE_SIZE", 2)
+    checkpoint = CheckpointStore(str(tmp_path / "checkpoints.sqlite"))
+    run_id = checkpoint.start_run("run", {})
+    cells = [(1, 0), (0, 2), (0, 10), (1, 3), (0, 1)]
+    for prompt_idx, example_idx in cells:
+        checkpoint.record(run_id, {"prompt_idx": prompt_idx, "example_idx": example_idx})
+
+    results = checkpoint.iter_results(run_id)
+    assert next(results) == {"prompt_idx": 0, "example_idx": 1}
+    # Cells recorded while the replay is under way are picked up by the pages still to come
+    checkpoint.record(run_id, {"prompt_idx": 0, "example_idx": 5})
+    assert [(r["prompt_idx"], r["example_idx"]) for r in results] == [(0, 2), (0, 5), (0, 10), (1, 0), (1, 3)]
@@ -0,0 +1,24 @@
+import numpy as np
+
+from comparison import DEFAULT_RESAMPLES, bootstrap_means, sign_flip_sums
+
+
+def test_heavy_tailed_interval_matches_standard_error():
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(0.0, 2.0, 5000)
+    standard_error = values.std(ddof=1) / np.sqrt(len(values))
+
+    means = bootstrap_means(values, DEFAULT_RESAMPLES, rng)
+    low, high = np.quantile(means, [0.025, 0.975])
+
+    assert 0.9 < means.std() / standard_error < 1.1
+    assert 0.9 < (high - low) / (2 * 1.96 * standard_error) < 1.1
+
+
+def test_heavy_tailed_sign_flips_match_null_spread():
+    rng = np.random.default_rng(1)
+    differences = rng.lognormal(0.0, 2.0, 5000) - rng.lognormal(0.0, 2.0, 5000)
+
+    sums = sign_flip_sums(differences, DEFAULT_RESAMPLES, rng)
+
+    assert 0.9 < sums.std() / np.sqrt((differences ** 2).sum()) < 1.1
@@ -0,0 +1,23 @@
+import json
+
+from dataset_loader import FIELD_SAMPLE_SIZE
+from ingest_dataset import ingest, iter_chunks
+
+
+def test_small_chunks_infer_fields_from_the_first_rows(tmp_path):
+    rows = [{"question": f"q {i}"} for i in range(FIELD_SAMPLE_SIZE + 20)]
+    rows[2]["answer"] = "a 2"
+    rows[FIELD_SAMPLE_SIZE + 5]["notes"] = "late"
+    rows.append(dict(rows[0]))
+    path = tmp_path / "rows.jsonl"
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+    report = ingest(iter_chunks(str(path), "jsonl", 2))
+
+    assert report["fields"] == ["question", "answer"]
+    assert report["input_field"] == "question"
+    assert report["ground_truth_field"] == "answer"
+    assert report["extra_fields"] == {"notes": 1}
+    assert report["rows"] == len(rows)
+    assert report["duplicates"] == 1
+    assert report["published"] == len(rows) - 1
@@ -0,0 +1,60 @@
+import pytest
+
+import local_scorers
+from local_scorers import local_output_type, score_cells, score_local, validate_local_scorer
+
+
+def test_exact_strips_whitespace_but_keeps_case():
+    scorer = {"name": "Exact", "type": "exact"}
+    scores = score_local(scorer, ["  Paris\n", "paris", "Paris", None], ["Paris", "Paris", None, "Paris"])
+    assert scores == [True, False, None, False]
+
+
+def test_contains_matches_normalized_text():
+    scorer = {"name": "Mentions", "type": "contains"}
+    scores = score_local(scorer, ["The capital is PARÍS.", "It is Lyon", "Paris"], ["paris", "Paris", ""])
+    assert scores == [True, False, None]
+
+
+@pytest.mark.parametrize("rapidfuzz", [True, False])
+def test_fuzzy_similarity_with_and_without_threshold(monkeypatch, rapidfuzz):
+    if not rapidfuzz:
+        monkeypatch.setattr(local_scorers, "_rapidfuzz_cpdist", None)
+    elif local_scorers._rapidfuzz_cpdist is None:
+        pytest.skip("rapidfuzz is not installed")
+    responses = ["Paris!", "Pariss", "Berlin", "Paris"]
+    ground_truths = ["paris", "Paris", "Paris", None]
+
+    similarity = score_local({"name": "Close", "type": "fuzzy"}, responses, ground_truths)
+    assert similarity[0] == pytest.approx(1.0)
+    assert 0.8 < similarity[1] < 1.0
+    assert similarity[2] < 0.5
+    assert similarity[3] is None
+
+    scorer = {"name": "Close", "type": "fuzzy", "threshold": 0.8}
+    assert local_output_type(scorer) == "boolean"
+    assert score_local(scorer, responses, ground_truths) == [True, True, False, None]
+
+
+def test_score_cells_uses_each_scorers_ground_truth_field():
+    scorers = [
+        {"name": "Judge", "prompt": "Is it right?", "output_type": "boolean"},
+        {"name": "Exact", "type": "exact"},
+        {"name": "City", "type": "contains", "ground_truth_field": "city"},
+    ]
+    cells = [
+        {"ground_truth": "Paris", "fields": {"city": "paris"}},
+        {"ground_truth": "Rome", "fields": {}},
+    ]
+    assert score_cells(scorers, cells, ["Paris", "Milan"]) == [
+        {"Exact": True, "City": True},
+        {"Exact": False, "City": None},
+    ]
+
+
+def test_validate_rejects_unknown_types_and_bad_patterns():
+    validate_local_scorer({"name": "Exact", "type": "exact"})
+    with pytest.raises(ValueError, match="unknown type"):
+        validate_local_scorer({"name": "Odd", "type": "levenshtein"})
+    with pytest.raises(ValueError, match="invalid pattern"):
+        validate_local_scorer({"name": "Re", "type": "regex", "pattern": "("})
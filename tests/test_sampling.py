@@ -0,0 +1,45 @@
+from early_stopping import SequentialStopper
+from results_store import ResultsStore
+from sampling import sampled_result
+
+SCORERS = [{"name": "correct", "output_type": "boolean"}, {"name": "quality", "output_type": "numeric"}]
+
+
+def result(prompt_idx, example_idx, responses, sample_scores):
+    return {"prompt_idx": prompt_idx, "example_idx": example_idx, "input": f"question {example_idx}",
+            "ground_truth": None, **sampled_result(SCORERS, responses, sample_scores)}
+
+
+def test_sampled_prompt_keeps_boolean_scores_of_single_sample_prompts():
+    store = ResultsStore.from_results([
+        result(0, 0, ["a"], [{"correct": True, "quality": 8.0}]),
+        result(0, 1, ["b"], [{"correct": False, "quality": 4.0}]),
+        result(1, 0, ["c", "d", "e"], [{"correct": True, "quality": 9.0}, {"correct": False, "quality": 5.0},
+                                       {"correct": False, "quality": 7.0}]),
+    ])
+
+    assert store.scores["correct"].kind == "boolean"
+    assert [r["scores"]["correct"] for r in store] == [True, False, True]
+    assert store.scores["correct pass rate"].kind == "numeric"
+    assert [r["scores"]["correct pass rate"] for r in store] == [None, None, 1 / 3]
+    assert [r["scores"]["correct pass@3"] for r in store] == [None, None, True]
+    assert [r["scores"]["quality"] for r in store] == [8.0, 4.0, 7.0]
+
+
+def test_sampled_boolean_scores_count_every_sample_in_aggregates():
+    store = ResultsStore.from_results([
+        result(0, 0, ["a"], [{"correct": True, "quality": 8.0}]),
+        result(1, 0, ["c", "d", "e", "f"], [{"correct": True, "quality": 9.0}, {"correct": False, "quality": 5.0},
+                                            {"correct": False, "quality": 7.0}, {"correct": False, "quality": 7.0}]),
+    ])
+
+    assert store.score_matrix("correct").tolist() == [[1.0, 0.25]]
+    summary = {row["scorer"]: row for row in store.summary()}
+    assert summary["correct"]["kind"] == "boolean"
+    assert summary["correct"]["value"] == 0.625
+
+    stopper = SequentialStopper("correct")
+    stopper.start([0, 1], 1)
+    for row in store:
+        stopper.observe(row)
+    assert stopper._scores == {0: {0: 1.0}, 1: {0: 0.25}}
@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from openai import OpenAI
+
+from cache import GenerationCache, JudgeCache
+from eval_engine import AVAILABLE_MODELS, EvaluationEngine
+from mock_openai_server import MockBehavior, MockOpenAIServer
+from scheduler import RequestScheduler
+
+
+class FakeResponse:
+    def __init__(self, headers=None, total_tokens=None):
+        self.headers = headers or {}
+        self.total_tokens = total_tokens
+
+    def parse(self):
+        if self.total_tokens is None:
+            return "ok"
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=self.total_tokens))
+
+
+class InFlight:
+    """Counts concurrent calls and remembers the most seen at once"""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def create(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(0.02)
+        with self._lock:
+            self.current -= 1
+        return FakeResponse()
+
+
+def test_runs_keep_their_own_concurrency_limits():
+    scheduler = RequestScheduler(["model"])
+    narrow, wide = scheduler.for_run(8, 2), scheduler.for_run(8, 6)
+    narrow_calls, wide_calls = InFlight(), InFlight()
+
+    with ThreadPoolExecutor(32) as pool:
+        futures = [pool.submit(narrow.call, "model", narrow_calls.create) for _ in range(16)]
+        futures += [pool.submit(wide.call, "model", wide_calls.create) for _ in range(16)]
+        assert [f.result() for f in futures] == ["ok"] * 32
+
+    assert narrow_calls.peak == 2
+    assert wide_calls.peak == 6
+
+
+def test_token_bucket_is_charged_the_tokens_a_call_used():
+    scheduler = RequestScheduler(["model"])
+    headers = {"x-ratelimit-limit-tokens": "100000", "x-ratelimit-remaining-tokens": "100000"}
+    scheduler.call("model", lambda: FakeResponse(headers))
+    bucket = scheduler._state("model").tokens
+
+    scheduler.call("model", lambda: FakeResponse(headers, total_tokens=3000), estimated_tokens=500)
+
+    assert 96990 < bucket.tokens <= 97010
+
+
+def test_window_grows_past_its_start_only_while_full():
+    scheduler = RequestScheduler(["model"], per_model_limit=6, initial_window=2)
+    for _ in range(20):
+        scheduler.call("model", FakeResponse)
+    assert scheduler.concurrency_windows() == {"model": 2}
+
+    calls = InFlight()
+    with ThreadPoolExecutor(16) as pool:
+        list(pool.map(lambda _: scheduler.call("model", calls.create), range(200)))
+
+    assert scheduler.concurrency_windows() == {"model": 6}
+    assert calls.peak == 6
+
+
+def test_rate_limit_headers_back_off_before_the_server_refuses(tmp_path):
+    behavior = MockBehavior(requests_per_minute=20, tokens_per_minute=1_000_000)
+    with MockOpenAIServer(behavior=behavior) as server:
+        scheduler = RequestScheduler(AVAILABLE_MODELS)
+        path = str(tmp_path / "cache.sqlite")
+        engine = EvaluationEngine(OpenAI(base_url=server.base_url, api_key="mock", max_retries=0), scheduler,
+                                  GenerationCache(path), JudgeCache(path))
+        for i in range(18):
+            engine.run_prompt_on_example("Answer briefly", "gpt-4o-mini", f"question {i}", use_cache=False)
+        state = scheduler._state("gpt-4o-mini")
+        assert state.requests.capacity == 20
+        assert state.tokens.capacity == 1_000_000
+        assert scheduler.concurrency_windows()["gpt-4o-mini"] == 8
+
+        # 19 of 20 requests spent: under a tenth of the budget is left
+        engine.run_prompt_on_example("Answer briefly", "gpt-4o-mini", "question 18", use_cache=False)
+
+    assert scheduler.concurrency_windows()["gpt-4o-mini"] == 1
+    assert state.remaining_fraction == 1 / 20
+    assert behavior.counts["rate_limited"] == 0
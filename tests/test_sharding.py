@@ -0,0 +1,56 @@
+import time
+
+import sharding
+from checkpoint import CheckpointStore
+from dataset_loader import LoadedDataset
+from mock_openai_server import MockBehavior, MockOpenAIServer
+from sharding import ShardQueue, plan_shards, start_sharded_run, work_shards
+
+
+class RowsLoader:
+    """Dataset loader serving one in-memory dataset version"""
+
+    def __init__(self, num_rows):
+        self.rows = [{"input": f"question {i}", "expected": "Mock response"} for i in range(num_rows)]
+
+    def load(self, ref):
+        return LoadedDataset(ref, "digest", len(self.rows), lambda: iter([self.rows]))
+
+
+def test_shard_whose_lease_always_expires_fails_after_max_attempts(tmp_path):
+    queue = ShardQueue(str(tmp_path / "queue.sqlite"), max_attempts=3)
+    queue.create("run", plan_shards(10, 10))
+
+    for attempt in range(3):
+        # The worker holding the shard dies: its lease runs out without being renewed
+        assert queue.claim("run", f"worker-{attempt}", lease_seconds=0.01) is not None
+        time.sleep(0.02)
+
+    assert queue.claim("run", "worker-3") is None
+    assert queue.outstanding("run") == 0
+    assert [shard["shard_idx"] for shard in queue.exhausted("run")] == [0]
+
+
+def test_worker_that_loses_its_lease_stops_and_keeps_no_results(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sharding, "LEASE_SECONDS", 0.3)
+    monkeypatch.setattr(sharding, "QUEUE_POLL_SECONDS", 0.05)
+    # Renewals fail, as when another worker has already taken the shard over
+    monkeypatch.setattr(ShardQueue, "renew", lambda *args, **kwargs: False)
+    path = str(tmp_path / "checkpoints.sqlite")
+    loader = RowsLoader(20)
+    prompts = [{"text": "Answer the question", "model": "gpt-4o-mini"}]
+    scorers = [{"name": "correct", "type": "exact", "ground_truth_field": "expected", "output_type": "boolean"}]
+
+    with MockOpenAIServer(behavior=MockBehavior(latency=0.05)) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+        checkpoint, queue = CheckpointStore(path), ShardQueue(path)
+        run_id = start_sharded_run(checkpoint, queue, "lease", loader.load("rows:v1"), prompts, scorers,
+                                   "input", "expected", shard_size=20)
+        finished = work_shards(run_id, {"stream": False, "max_concurrency": 1, "per_model_concurrency": 1},
+                               checkpoint_path=path, dataset_loader=loader, worker_id="worker")
+
+    assert finished == 0
+    assert queue.counts(run_id)["done"] == 0
+    assert len(checkpoint.completed_cells(run_id)) < len(loader.rows)
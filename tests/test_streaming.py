@@ -0,0 +1,35 @@
+from openai import OpenAI
+
+from cache import GenerationCache, JudgeCache
+from eval_engine import AVAILABLE_MODELS, EvaluationEngine
+from mock_openai_server import MockBehavior, MockOpenAIServer
+from scheduler import RequestScheduler
+
+
+class DropFirstStream(MockBehavior):
+    """Cuts off the first streamed reply halfway and sends the rest in full"""
+
+    def disconnect(self) -> bool:
+        with self._lock:
+            self.counts["disconnects"] += 1
+            return self.counts["disconnects"] == 1
+
+
+def test_dropped_stream_is_retried(tmp_path):
+    behavior = DropFirstStream(completion_tokens=80)
+    with MockOpenAIServer(behavior=behavior) as server:
+        engine = EvaluationEngine(
+            OpenAI(base_url=server.base_url, api_key="mock", max_retries=0),
+            scheduler=RequestScheduler(AVAILABLE_MODELS, base_delay=0.01),
+            generation_cache=GenerationCache(str(tmp_path / "cache.sqlite")),
+            judge_cache=JudgeCache(str(tmp_path / "cache.sqlite"))
+        )
+        partials, calls = [], []
+        response = engine.run_prompt_on_example("Reply at length", "gpt-4o-mini", "hello", use_cache=False,
+                                                calls=calls, stream=True, on_partial=partials.append)
+        expected = engine.run_prompt_on_example("Reply at length", "gpt-4o-mini", "hello", use_cache=False)
+
+    assert response == expected
+    assert calls[0]["retries"] == 1
+    assert "" in partials
+    assert behavior.counts["requests"] == 3
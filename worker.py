@@ -0,0 +1,255 @@
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from call_metrics import CallMetrics
+from checkpoint import CheckpointStore
+from concurrency import RunCancelled
+from dataset_loader import DatasetLoader
+from early_stopping import SequentialStopper
+from eval_engine import EvaluationEngine, create_evaluation_logger, find_ground_truth_field, find_input_field
+from live_view import RunningAggregates, result_row
+from results_store import ResultsStore
+
+ACTIVE_STATUSES = {"queued", "loading", "running"}
+# Trailing characters of each in-flight generation shown in the live view
+STREAM_PREVIEW_CHARS = 120
+
+
+class RunProgress:
+    """Progress and partial results of one background run, written by the worker and polled by the UI"""
+
+    def __init__(self, run_id: str, name: str, config: Dict[str, Any], settings: Dict[str, Any],
+                 window: int = 50):
+        self.run_id = run_id
+        self.name = name
+        self.config = config
+        self.settings = settings
+        self.status = "queued"
+        self.message = "Waiting for a free worker"
+        self.error: Optional[str] = None
+        self.completed = 0
+        self.total = 0
+        self.results = ResultsStore()
+        self.recent = deque(maxlen=window)
+        # Partial text of generations being streamed right now, by (prompt_idx, example_idx)
+        self.streaming: Dict[Tuple[int, int], str] = {}
+        self.aggregates = RunningAggregates()
+        self.metrics = CallMetrics()
+        # This run's cache hits and misses, summed from each result's own counts
+        self.cache_stats: Dict[str, Dict[str, int]] = {
+            label: {"hits": 0, "misses": 0} for label in ("Generation", "Judge")
+        }
+        self.eval_logger = None
+        self.stopper: Optional[SequentialStopper] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def add(self, result: Dict[str, Any]):
+        with self._lock:
+            self.completed += 1
+            self.results.append(result)
+            self.aggregates.update(result['scores'])
+            self.metrics.add(result)
+            for label, counts in (result.get('cache') or {}).items():
+                totals = self.cache_stats.setdefault(label, {"hits": 0, "misses": 0})
+                totals["hits"] += counts["hits"]
+                totals["misses"] += counts["misses"]
+            self.recent.append(result_row(result))
+
+    def on_partial(self, cell: Dict[str, Any], text: Optional[str]):
+        """Track a streamed generation's text so far; None once it is done"""
+        key = (cell['prompt_idx'], cell['example_idx'])
+        with self._lock:
+            if text is None:
+                self.streaming.pop(key, None)
+            else:
+                self.streaming[key] = text
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def snapshot(self) -> Dict[str, Any]:
+        """A consistent copy for rendering; full results are only included once the run has finished"""
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "name": self.name,
+                "status": self.status,
+                "message": self.message,
+                "error": self.error,
+                "completed": self.completed,
+                "total": self.total,
+                "aggregates": self.aggregates.rows(),
+                # Newest first, so the latest results stay visible without scrolling
+                "recent": list(reversed(self.recent)),
+                "streaming": [
+                    {
+                        "Prompt": f"Prompt {prompt_idx+1}",
+                        "Example": example_idx + 1,
+                        "Generating": text[-STREAM_PREVIEW_CHARS:]
+                    }
+                    for (prompt_idx, example_idx), text in sorted(self.streaming.items())
+                ],
+                # The store is only handed out once the worker has stopped writing to it
+                "results": self.results if not self.active else None,
+                "cache_stats": {label: dict(counts) for label, counts in self.cache_stats.items()},
+                # Polled every second: running totals keep this constant-time as the run grows
+                "performance": self.metrics.summary(exact=False),
+                "logging": self.eval_logger.stats() if self.eval_logger is not None else None,
+                "early_stopping": self.stopper.report() if self.stopper is not None else None,
+                "submitted_at": self.submitted_at,
+                "finished_at": self.finished_at
+            }
+
+
+class EvaluationWorker:
+    """Runs evaluations on background threads so they outlive Streamlit script reruns
+
+    Several runs can execute at once; they share the engine, so its caches and rate limits apply
+    across all of them. Each run is checkpointed under its run id, which also identifies it here.
+    """
+
+    def __init__(self, engine: EvaluationEngine, dataset_loader: DatasetLoader, checkpoint: CheckpointStore,
+                 max_runs: int = 4, keep_finished: int = 20):
+        self.engine = engine
+        self.dataset_loader = dataset_loader
+        self.checkpoint = checkpoint
+        self.keep_finished = keep_finished
+        self._pool = ThreadPoolExecutor(max_workers=max_runs, thread_name_prefix="eval-run")
+        self._runs: Dict[str, RunProgress] = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, config: Dict[str, Any], settings: Dict[str, Any],
+               run_id: Optional[str] = None) -> str:
+        """Queue a run and return its id; pass the id of a checkpointed run to resume it
+
+        `config` holds dataset_ref, prompts and scorers; `settings` are passed to `EvaluationEngine.run`,
+        except `early_stopping`, which holds `SequentialStopper` arguments to opt in to early stopping.
+        """
+        with self._lock:
+            if run_id is not None and run_id in self._runs and self._runs[run_id].active:
+                return run_id
+            if run_id is None:
+                run_id = self.checkpoint.start_run(name, config)
+            progress = RunProgress(run_id, name, config, settings)
+            self._runs[run_id] = progress
+            self._futures[run_id] = self._pool.submit(self._execute, progress)
+            self._prune()
+        return run_id
+
+    def cancel(self, run_id: str):
+        """Stop a run, even one waiting on a batch job or a retry; finished cells stay checkpointed for resuming"""
+        with self._lock:
+            progress = self._runs.get(run_id)
+            future = self._futures.get(run_id)
+        if progress is None or not progress.active:
+            return
+        progress.cancel_event.set()
+        if future is not None and future.cancel():
+            progress.update(status="cancelled", message="Cancelled before it started", finished_at=time.time())
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """Snapshots of all known runs, newest first"""
+        with self._lock:
+            runs = list(self._runs.values())
+        return [run.snapshot() for run in sorted(runs, key=lambda r: r.submitted_at, reverse=True)]
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            progress = self._runs.get(run_id)
+        return progress.snapshot() if progress else None
+
+    def active_run_ids(self) -> List[str]:
+        with self._lock:
+            return [run_id for run_id, progress in self._runs.items() if progress.active]
+
+    def _prune(self):
+        """Forget the oldest finished runs beyond `keep_finished`; their results remain in the checkpoint store"""
+        finished = sorted(
+            (progress for progress in self._runs.values() if not progress.active),
+            key=lambda p: p.submitted_at
+        )
+        for progress in finished[:max(len(finished) - self.keep_finished, 0)]:
+            del self._runs[progress.run_id]
+            self._futures.pop(progress.run_id, None)
+
+    def _execute(self, progress: RunProgress):
+        config = progress.config
+        try:
+            progress.update(status="loading", message="Loading dataset...")
+            dataset = self.dataset_loader.load(config['dataset_ref'])
+            self.checkpoint.pin_dataset(progress.run_id, dataset.digest, len(dataset))
+            fields = dataset.fields
+            input_field = find_input_field(fields)
+            ground_truth_field = find_ground_truth_field(fields)
+            if not input_field:
+                raise ValueError("Could not find input field in dataset")
+
+            total = len(dataset) * len([p for p in config['prompts'] if p['text']])
+            self.checkpoint.set_total_cells(progress.run_id, total)
+            eval_logger = create_evaluation_logger(progress.name, config['dataset_ref'])
+            settings = dict(progress.settings)
+            early_stopping = settings.pop("early_stopping", None)
+            stopper = SequentialStopper(**early_stopping) if early_stopping else None
+            progress.update(status="running", message="Evaluating...", total=total, eval_logger=eval_logger,
+                            stopper=stopper)
+
+            def on_batch_status(stage, batch):
+                counts = batch.request_counts
+                done = f" ({counts.completed}/{counts.total} requests)" if counts and counts.total else ""
+                progress.update(message=f"{stage.capitalize()} batch {batch.id}: {batch.status}{done}")
+
+            results = self.engine.run(
+                dataset, config['prompts'], config['scorers'], input_field, ground_truth_field, eval_logger,
+                self.checkpoint, progress.run_id, stopper, on_batch_status=on_batch_status,
+                on_partial=progress.on_partial, cancel=progress.cancel_event, **settings
+            )
+            try:
+                for result in results:
+                    progress.add(result)
+                    if progress.cancel_event.is_set():
+                        break
+            except RunCancelled:
+                # Raised while the engine waited on a batch job, a retry or in-flight calls
+                pass
+            finally:
+                # Closing the generator shuts down the run's thread pools and drops queued work
+                results.close()
+
+            if progress.cancel_event.is_set():
+                progress.update(status="cancelled", message="Cancelled; resume it to finish the remaining cells",
+                                finished_at=time.time())
+                return
+
+            progress.update(message="Flushing Weave logs...")
+            with progress._lock:
+                performance = progress.metrics.summary()
+            eval_logger.log_summary({"performance": performance})
+            with progress._lock:
+                # Keep results in (prompt, example) order regardless of completion order
+                progress.results.sort()
+            progress.update(status="completed", message="Evaluation complete", finished_at=time.time())
+        except Exception as e:
+            traceback.print_exc()
+            progress.update(status="failed", message=f"Error during evaluation: {e}", error=str(e),
+                            finished_at=time.time())
+        finally:
+            if progress.eval_logger is not None:
+                try:
+                    # Stops the flush thread; predictions already queued are still written
+                    progress.eval_logger.close()
+                except Exception:
+                    traceback.print_exc()